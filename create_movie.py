@@ -8,6 +8,7 @@ create_movie.py
 - 対応する画像にバウンディングボックスと識別IDを描画
 - CCIDが存在する場合は、`cc_name.txt` に基づいて日本語名を重ね描画
 - 出力動画と描画済み画像を `MOVIE_FOLDER/{日付}/{対象フォルダ}` に保存
+- 描画済み画像のファイル名を `MOVIE_FOLDER/{日付}/frame_index.tsv` に登録（find_file での検索用）
 
 ## 使用方法（例）:
 ```bash
@@ -42,7 +43,9 @@ import argparse
 from datetime import datetime
 import re
 import numpy as np
-from PIL import Image, ImageDraw , ImageFont
+from module.utils3.label_io import read_labels
+from module.utils3.annotation import get_cc_name, draw_text
+from module.utils3.movie_index import add_frames
 
 
 def get_merge_json(folder_path, num_files_to_get,frame_count):
@@ -121,6 +124,7 @@ def create_movie(iamge_path, frame_count, files,merge_dir,camera_id):
     # コピー先のフォルダが存在しない場合は作成
     if not os.path.exists(destination_folder):
         os.makedirs(destination_folder)
+    day_folder = destination_folder
 
     destination_folder = os.path.join(destination_folder,folder_path)
     # コピー先のフォルダが存在しない場合は作成
@@ -133,10 +137,8 @@ def create_movie(iamge_path, frame_count, files,merge_dir,camera_id):
 
     # print("clear")
 
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
+    # 書き出した画像のファイル名（日付フォルダのインデックスに登録する）
+    written_frames = []
 
     # フォルダ内のすべてのファイルを取得
     for  filename in files:
@@ -151,8 +153,7 @@ def create_movie(iamge_path, frame_count, files,merge_dir,camera_id):
         image = cv2.imread(image_file_path)
 
         # JSONファイルを読み込む
-        with open(os.path.join(merge_dir, filename), 'r') as file:
-            data = json.load(file)
+        data = read_labels(os.path.join(merge_dir, filename))
 
         # labels部分を取得
         # labels = data["labels"]
@@ -180,18 +181,9 @@ def create_movie(iamge_path, frame_count, files,merge_dir,camera_id):
                     #HACK　取得したIDに文字列"cc_id"が含まれているかチェックする 2024/11/15 torisato(削除予定)
                     if "cc_id" in str(TID):
                         ccid = int(str(TID).replace("cc_id", ""))
-                        cc = next((item for item in cc_name_dict if item['ccid'] == str(ccid)), None)
-                        text = cc['name']
-                        #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-                        image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-                        #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-                        draw = ImageDraw.Draw(image_pil)
-
-                        # 画像にテキストを描画
-                        draw.text((bbox[0], int((bbox[1] + bbox[3]) / 2)), text, font=font, fill=(0, 255, 0))
-                        # Pillow形式からcv2形式に戻す
-                        image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
+                        text = get_cc_name(ccid)
+                        # 画像にテキストを描画（描画済みの名前画像をブレンドする）
+                        draw_text(image, (bbox[0], int((bbox[1] + bbox[3]) / 2)), text, fill=(0, 255, 0))
                         # バウンディングボックスの上にTIDを表示
                         id_lists.append(TID)
                     else:
@@ -206,10 +198,13 @@ def create_movie(iamge_path, frame_count, files,merge_dir,camera_id):
 
         #例)>- MOVIE_FOLDER/111643295/111654095.jpg
         cv2.imwrite(os.path.join(destination_folder,number + ".jpg"),image)
+        written_frames.append(number + ".jpg")
         video.write(image)  # 動画ファイルに書き込み
 
     # 動画ファイルを保存し終了
     video.release()
+    # find_file で画像を検索できるように、日付フォルダのインデックスに追記する
+    add_frames(day_folder, folder_path, written_frames)
     cv2.destroyAllWindows()
 
 def main():
@@ -76,6 +76,8 @@ for CAMERA in "${CAMERAS[@]}"; do
     rm -rf "${PREFIX}data/merged_jsons"
     # rm -rf "${PREFIX}videos"
     rm -rf "${PREFIX}last_object_count.txt"
+    rm -rf "${PREFIX}object_ids.sqlite3" "${PREFIX}object_ids.sqlite3-wal" "${PREFIX}object_ids.sqlite3-shm"
+    rm -rf "${PREFIX}gsam.txt"
 
     #初回起動時、人物カウントを"0"から始める
     echo "0" > "${PREFIX}last_object_count.txt"
@@ -82,7 +82,8 @@ for camera in CAMERAS:
     ]
 
     # Remove old files and folders
-    for name in ["video.txt", "video_list.txt", "last_object_count.txt"]:
+    for name in ["video.txt", "video_list.txt", "last_object_count.txt", "object_ids.sqlite3",
+                 "object_ids.sqlite3-wal", "object_ids.sqlite3-shm"]:
         file = prefix / name
         if file.exists():
             file.unlink()
@@ -102,7 +103,7 @@ for camera in CAMERAS:
 
     # Reset last_object_count
     (prefix / "last_object_count.txt").write_text("0")
-    (prefix / "gsam.txt").touch()
+    (prefix / "gsam.txt").write_text("")
 
 # Start get_video_slice.py for each camera
 for camera in CAMERAS:
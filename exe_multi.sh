@@ -76,6 +76,7 @@ for CAMERA in "${CAMERAS[@]}"; do
     rm -rf "${PREFIX}data/merged_jsons"
     rm -rf "${PREFIX}videos"
     rm -rf "${PREFIX}last_object_count.txt"
+    rm -rf "${PREFIX}object_ids.sqlite3" "${PREFIX}object_ids.sqlite3-wal" "${PREFIX}object_ids.sqlite3-shm"
 
     FOLDERS=(
         "${INDEX}"
@@ -12,7 +12,8 @@ SAM2（Segment Anything Model 2）および Grounding DINO を用いて、セマ
 - 検出オブジェクトがない場合は空のマスク・空のJSONファイルを自動生成
 - オブジェクトを一意に識別し、マスクをフレーム間で伝播・追跡
 - 検出・追跡結果を `.npy`（マスク）および `.json`（属性情報）として保存
-- オブジェクト数を `last_object_count.txt` に記録・更新
+- オブジェクトIDを `object_ids.sqlite3` からブロック単位で予約（複数バッチを同時に処理してもIDが重複しない）
+- 割り当て済みの最大IDを `last_object_count.txt` に記録・更新
 
 ## 使用モデル
 - Grounding DINO Base: Zero-shot Object Detectionモデル
@@ -24,23 +25,36 @@ python gsam2_c-idv2.py \
   --input_folder ./frames/134920000 \
   --output_dir ./outputs \
   --device_id 0 \
-  --camera_id 1
+  --camera_id 1 \
+  --roi 0,300,1920,1080 \
+  --roi_scale 0.75
 
 引数:
     --input_folder (str, 必須): 処理対象のフレーム画像が保存されたフォルダ
     --output_dir (str, 任意): 出力ファイル（マスク/JSON）の保存先ディレクトリ（デフォルト: ./outputs）
     --device_id (int, 任意): 使用するCUDAデバイスID（デフォルト: 0）
     --camera_id (int, 必須): カメラ識別用のID。保存ファイルや状態管理に使用されます。
+    --all_segments (flag, 任意): input_folder / output_dir をセグメントの親フォルダとして扱い、
+        split.py が作成した全セグメントを1回のモデルロードで処理します。重なり合うフレームの
+        Grounding DINO の検出結果と SAM2 の特徴量はセグメント間で共有されます。
+    --cache_dir (str, 任意): 推論結果キャッシュの保存先（デフォルト: <camera_id>/frame_cache）
+    --cache_max_mb (int, 任意): ディスクキャッシュの上限サイズ（MB、デフォルト: 2048）
+    --persist_frames (int, 任意): 次のバッチに引き継がれるフレーム数。最後のこの枚数分の
+        検出結果・特徴量をディスクに保存し、次のバッチで同じ画像を再推論しないようにします。
+    --roi (str, 任意): 推論対象の作業エリア "x1,y1,x2,y2"。指定した範囲のみを切り出して推論します。
+    --roi_scale (float, 任意): 切り出した画像の縮小率（0 < roi_scale <= 1.0、デフォルト: 1.0）
 
 出力:
     ./outputs/mask_data/: フレームごとのマスクファイル（.npy）
     ./outputs/json_data/: マスクに対応する属性情報（.json）
-    <camera_id>/last_object_count.txt: オブジェクト識別IDのカウンタ（状態保持）
+    <camera_id>/object_ids.sqlite3: オブジェクト識別IDの払い出し状態（複数プロセスで共有）
+    <camera_id>/last_object_count.txt: 割り当て済みの最大ID（互換性のため）
 
 注意事項:
     SAM2とGrounding DINOのチェックポイントおよび設定ファイルは、./gsam2/checkpoints/ およびルートディレクトリに適切に配置されている必要があります。
     CUDAデバイスが使用可能である必要があります（GPU推論を前提としています）。
     フレーム間隔（step=15）ごとに推論を行います。
+    ROI を指定した場合も、出力されるマスク・JSON はフルフレームの座標系に戻して保存されます。
 
 作成日：2025年5月
 作成者：インフォファーム
@@ -57,12 +71,26 @@ from sam2.sam2_image_predictor import SAM2ImagePredictor
 from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
 from utils2.common_utils import CommonUtils
 from utils2.mask_dictionary_model import MaskDictionaryModel, ObjectInfo
+from utils2.roi_utils import FrameROI, parse_roi
+from utils2.id_allocator import ObjectIDAllocator
+from utils2.frame_cache import PersistentFeatureCache, DetectionCache, frame_content_key, settings_digest
+from utils2.label_io import write_labels
 import json
 import copy
 import argparse  # argparseを追加
 
+def get_segment_names(segments_dir):
+    """`split.py` が作成したセグメントフォルダ名（segment_0, segment_1, ...）を番号順で返す。"""
+    segment_names = [d for d in os.listdir(segments_dir) if os.path.isdir(os.path.join(segments_dir, d))]
+    segment_names.sort(key=lambda d: int(d.split("_")[-1]))
+    return segment_names
+
+# メモリ上に保持する SAM2 特徴量の上限（これを超えると古いものから破棄）
+FEATURE_CACHE_MAX_BYTES = 4 * 1024 ** 3
+
 class VideoProcessor:
-    def __init__(self, input_folder, output_dir="./outputs", device_id=0,camera_id=None):
+    def __init__(self, input_folder, output_dir="./outputs", device_id=0,camera_id=None, roi=None, roi_scale=1.0,
+                 cache_dir=None, cache_max_mb=2048, persist_frames=0):
         # 入力フォルダとデバイスの設定
         self.input_folder = input_folder
         self.output_dir = output_dir
@@ -74,24 +102,40 @@ class VideoProcessor:
         # 環境設定とモデルの初期化
         self.setup_environment()
         self.initialize_models()
-        self.setup_directories()
 
-        # その他の初期設定
-        self.frame_names = self.get_frame_names()
-        self.inference_state = self.video_predictor.init_state(
-            video_path=self.input_folder, offload_video_to_cpu=True, async_loading_frames=True
+        # セグメント間・バッチ間で共有する推論結果（同じ画像は一度だけ推論する）
+        # - feature_cache: SAM2 画像エンコーダの特徴量（画像内容のハッシュがキー）
+        # - detection_cache: Grounding DINO の検出結果（画像内容のハッシュがキー）
+        # 次のバッチに引き継がれる最後の persist_frames 枚はディスクにも保存する
+        if cache_dir is None:
+            cache_dir = os.path.join(str(self.camera_id), "frame_cache")
+        cache_max_bytes = cache_max_mb * 1024 * 1024
+        self.feature_cache = PersistentFeatureCache(
+            os.path.join(cache_dir, "features"), cache_max_bytes,
+            storage_device="cpu", max_bytes=FEATURE_CACHE_MAX_BYTES
         )
+        self.detection_cache = DetectionCache(os.path.join(cache_dir, "detections"), cache_max_bytes)
+        self.persist_frames = persist_frames
+        self.content_keys = {}
+        self.roi = None
+        self.roi_args = (roi, roi_scale)
+
         #フレーム間隔の変更2024.10.28 torisato
         self.step = 15  # Grounding DINOのフレーム間隔
-        self.sam2_masks = MaskDictionaryModel()
         self.PROMPT_TYPE_FOR_VIDEO = "mask"
         #2024.10.29 torisato
         # self.objects_count = 0
-        with open(os.path.join(str(self.camera_id), "last_object_count.txt"), "r") as file:
-            last_object_count = file.readline().strip()
-        self.objects_count = int(last_object_count)
+        # with open(os.path.join(str(self.camera_id), "last_object_count.txt"), "r") as file:
+        #     last_object_count = file.readline().strip()
+        # self.objects_count = int(last_object_count)
+        # IDはブロック単位で予約する（同じカメラの他のバッチと同時に処理してもIDが重複しない）
+        self.id_allocator = ObjectIDAllocator(self.camera_id)
+        self.objects_count = 0  # 最後に割り当てたID
         self.text = "person."  # テキストプロンプト
 
+        # 処理対象のフレームを読み込む
+        self.load_segment(input_folder, output_dir)
+
     def setup_environment(self):
         """
         CUDA環境の設定を行う。
@@ -122,6 +166,7 @@ class VideoProcessor:
         #TODO モデルを2.1のものを使用するときは、「gsam2/sam2/build_sam.pyのコメントアウトを修正する」
         sam2_checkpoint = "./gsam2/checkpoints/sam2.1_hiera_large.pt"
         model_cfg = "sam2.1_hiera_l.yaml"
+        self.sam2_checkpoint = sam2_checkpoint
         self.video_predictor = build_sam2_video_predictor(model_cfg, sam2_checkpoint)
         sam2_image_model = build_sam2(model_cfg, sam2_checkpoint, device=self.device)
         self.image_predictor = SAM2ImagePredictor(sam2_image_model)
@@ -130,6 +175,7 @@ class VideoProcessor:
         #2024.10.28 torisato
         # model_id = "IDEA-Research/grounding-dino-tiny"
         model_id = "IDEA-Research/grounding-dino-base"
+        self.grounding_model_id = model_id
         self.processor = AutoProcessor.from_pretrained(model_id)
         self.grounding_model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(self.device)
 
@@ -154,6 +200,107 @@ class VideoProcessor:
         # CommonUtils.creat_dirs(self.result_dir)
         self.output_video_path = os.path.join(self.output_dir, "output.mp4")
 
+    def load_segment(self, input_folder, output_dir):
+        """
+        処理対象のセグメント（フレーム画像フォルダ）を切り替える。
+
+        モデルは再ロードせず、出力ディレクトリ・フレーム名・SAM2 の推論状態のみを作り直す。
+        推論状態は `self.feature_cache` を共有するため、前のセグメントと重なるフレームは再エンコードされない。
+        """
+        self.input_folder = input_folder
+        self.output_dir = output_dir
+        self.setup_directories()
+        self.frame_names = self.get_frame_names()
+        if self.roi is None:
+            self.setup_roi(*self.roi_args)
+        self.inference_state = self.video_predictor.init_state(
+            video_path=self.input_folder, offload_video_to_cpu=True, async_loading_frames=True,
+            image_transform=None if self.roi.is_full_frame else self.roi.crop_image,
+            pin_memory=True,
+            frame_keys=[self.feature_key(name) for name in self.frame_names],
+            shared_feature_cache=self.feature_cache
+        )
+        # 追跡はセグメントごとに独立して行う（セグメント間のIDの統合は merge_segment.py で行う）
+        self.sam2_masks = MaskDictionaryModel()
+
+    def setup_roi(self, roi, roi_scale):
+        """
+        カメラの作業エリア（ROI）を設定する。
+
+        - ROI の外側は推論しないため、Grounding DINO の入力画素数は ROI の面積に比例して減る。
+        - Grounding DINO のリサイズ先をフルフレーム時と同じ画素密度に合わせる。
+        - ROI 未指定の場合はフルフレームをそのまま推論する（従来通り）。
+        """
+        first_frame_path = os.path.join(self.input_folder, self.frame_names[0])
+        self.roi = FrameROI.from_frame(roi, first_frame_path, roi_scale)
+        detector_size = self.roi.detector_size()
+        if detector_size is not None:
+            self.processor.image_processor.size = detector_size
+        # 推論結果に影響する設定をキャッシュキーに含める
+        self.feature_salt = settings_digest(
+            self.sam2_checkpoint, self.roi.crop_box, self.roi.scale
+        )
+        self.detection_salt = settings_digest(
+            self.grounding_model_id, self.text, self.roi.crop_box, self.roi.scale, detector_size
+        )
+
+    def get_content_key(self, frame_name, folder=None):
+        """フレーム画像の内容のハッシュを返す（同じフレーム名は一度だけ計算する）。"""
+        content_key = self.content_keys.get(frame_name)
+        if content_key is None:
+            folder = self.input_folder if folder is None else folder
+            content_key = frame_content_key(os.path.join(folder, frame_name))
+            self.content_keys[frame_name] = content_key
+        return content_key
+
+    def feature_key(self, frame_name, folder=None):
+        return f"{self.get_content_key(frame_name, folder)}_{self.feature_salt}"
+
+    def detection_key(self, frame_name, folder=None):
+        return f"{self.get_content_key(frame_name, folder)}_{self.detection_salt}"
+
+    def set_persist_frames(self, frame_names):
+        """バッチの最後の `persist_frames` 枚（次のバッチに引き継がれるフレーム）をディスクに保存する対象にする。"""
+        if self.persist_frames <= 0:
+            return
+        last_frames = sorted(frame_names, key=lambda p: int(os.path.splitext(p)[0]))[-self.persist_frames:]
+        self.feature_cache.persist_keys = {self.feature_key(name) for name in last_frames}
+        self.detection_cache.persist_keys = {self.detection_key(name) for name in last_frames}
+
+    def print_cache_stats(self):
+        print(
+            f"特徴量キャッシュ: hit={self.feature_cache.hits} (disk={self.feature_cache.disk_hits}), "
+            f"miss={self.feature_cache.misses} / "
+            f"検出キャッシュ: hit={self.detection_cache.hits}, miss={self.detection_cache.misses}"
+        )
+
+    def load_frame(self, frame_idx):
+        """フレーム画像を読み込み、ROI で切り出した画像を返す。"""
+        img_path = os.path.join(self.input_folder, self.frame_names[frame_idx])
+        return self.roi.crop_image(Image.open(img_path))
+
+    def detect(self, frame_idx, image):
+        """
+        Grounding DINO で人物を検出する。
+
+        重なり合うセグメントやバッチ間で同じ画像を再推論しないよう、結果は画像内容のハッシュごとに保持する。
+        """
+        key = self.detection_key(self.frame_names[frame_idx])
+        results = self.detection_cache.get(key, self.device)
+        if results is None:
+            inputs = self.processor(images=image, text=self.text, return_tensors="pt").to(self.device)
+            with torch.no_grad():
+                outputs = self.grounding_model(**inputs)
+            results = self.processor.post_process_grounded_object_detection(
+                outputs,
+                inputs.input_ids,
+                box_threshold=0.35,
+                text_threshold=0.25,
+                target_sizes=[image.size[::-1]],
+            )
+            self.detection_cache.put(key, results)
+        return results
+
     def get_frame_names(self):
         """フレーム名の取得とソート"""
         frame_names = [
@@ -424,8 +571,7 @@ class VideoProcessor:
         # print("総フレーム数:", len(self.frame_names))
         for start_frame_idx in range(0, len(self.frame_names), self.step):
             # print("処理中のフレームインデックス:", start_frame_idx)
-            img_path = os.path.join(self.input_folder, self.frame_names[start_frame_idx])
-            image = Image.open(img_path)
+            image = self.load_frame(start_frame_idx)
             image_base_name = self.frame_names[start_frame_idx].split(".")[0]
             mask_dict = MaskDictionaryModel(
                 promote_type=self.PROMPT_TYPE_FOR_VIDEO, mask_name=f"mask_{image_base_name}.npy"
@@ -438,18 +584,8 @@ class VideoProcessor:
                 if current_frame_idx >= len(self.frame_names):
                     break  # フレーム範囲を超えた場合
 
-                img_path = os.path.join(self.input_folder, self.frame_names[current_frame_idx])
-                image = Image.open(img_path)
-                inputs = self.processor(images=image, text=self.text, return_tensors="pt").to(self.device)
-                with torch.no_grad():
-                    outputs = self.grounding_model(**inputs)
-                results = self.processor.post_process_grounded_object_detection(
-                    outputs,
-                    inputs.input_ids,
-                    box_threshold=0.35,
-                    text_threshold=0.25,
-                    target_sizes=[image.size[::-1]],
-                )
+                image = self.load_frame(current_frame_idx)
+                results = self.detect(current_frame_idx, image)
                 if len(results[0]["boxes"]) > 0:  # オブジェクトを検出した場合
                     # print(results[0],current_frame_idx)
                     box = results[0]["boxes"][0]  # 最初のボックスを取得
@@ -461,7 +597,7 @@ class VideoProcessor:
 
                         # オブジェクトが検出されなかった場合、空のJSONとマスクを作成
                         current_image_base_name = self.frame_names[current_frame_idx].split(".")[0]
-                        empty_mask = np.zeros((image.size[1], image.size[0]), dtype=np.uint16)  # 空のマスク
+                        empty_mask = np.zeros((self.roi.full_height, self.roi.full_width), dtype=np.uint16)  # 空のマスク
                         empty_mask_path = os.path.join(self.mask_data_dir, f"mask_{current_image_base_name}.npy")
                         np.save(empty_mask_path, empty_mask)
 
@@ -470,8 +606,7 @@ class VideoProcessor:
                         json_data_path = os.path.join(
                             self.json_data_dir, f"mask_{current_image_base_name}.json"
                         )
-                        with open(json_data_path, "w") as f:
-                            json.dump(json_data, f)
+                        write_labels(json_data_path, json_data)
                         # print(f"空のマスクとJSONを保存: {empty_mask_path}, {json_data_path}")
                     else:
                         # print(f"フレーム{current_frame_idx}でオブジェクトを検出しました")
@@ -483,7 +618,7 @@ class VideoProcessor:
 
                     # オブジェクトが検出されなかった場合、空のJSONとマスクを作成
                     current_image_base_name = self.frame_names[current_frame_idx].split(".")[0]
-                    empty_mask = np.zeros((image.size[1], image.size[0]), dtype=np.uint16)  # 空のマスク
+                    empty_mask = np.zeros((self.roi.full_height, self.roi.full_width), dtype=np.uint16)  # 空のマスク
                     empty_mask_path = os.path.join(self.mask_data_dir, f"mask_{current_image_base_name}.npy")
                     np.save(empty_mask_path, empty_mask)
 
@@ -492,8 +627,7 @@ class VideoProcessor:
                     json_data_path = os.path.join(
                         self.json_data_dir, f"mask_{current_image_base_name}.json"
                     )
-                    with open(json_data_path, "w") as f:
-                        json.dump(json_data, f)
+                    write_labels(json_data_path, json_data)
                     # print(f"空のマスクとJSONを保存: {empty_mask_path}, {json_data_path}")
 
             if not objects_found:
@@ -547,6 +681,7 @@ class VideoProcessor:
                 raise NotImplementedError("SAM 2ビデオ予測器はマスクプロンプトのみサポートしています")
 
             # マスクの伝播
+            self.objects_count = self.id_allocator.ensure_available(self.objects_count, len(mask_dict.labels))
             self.objects_count = mask_dict.update_masks(
                 tracking_annotation_dict=self.sam2_masks, iou_threshold=0.8, objects_count=self.objects_count
             )
@@ -598,15 +733,16 @@ class VideoProcessor:
                 for obj_id, obj_info in mask.items():
                     mask_img[obj_info.mask == True] = obj_id
 
+                # ROI 座標系のマスク・バウンディングボックスをフルフレームに戻して保存
+                mask_img = self.roi.mask_to_full(mask_img)
                 mask_img = mask_img.numpy().astype(np.uint16)
                 np.save(os.path.join(self.mask_data_dir, frame_masks_info.mask_name), mask_img)
 
-                json_data = frame_masks_info.to_dict()
+                json_data = self.roi.frame_dict_to_full(frame_masks_info.to_dict())
                 json_data_path = os.path.join(
                     self.json_data_dir, frame_masks_info.mask_name.replace(".npy", ".json")
                 )
-                with open(json_data_path, "w") as f:
-                    json.dump(json_data, f)
+                write_labels(json_data_path, json_data)
 
 
     # def draw_results_and_save_video(self):
@@ -618,10 +754,50 @@ class VideoProcessor:
 
     def run(self):
         # 全体の処理を実行
+        self.set_persist_frames(self.frame_names)
+        # 1セグメントのみの場合、メモリ上には特徴量を保持しない
+        self.feature_cache.set_retain_keys(())
         self.process_frames()
+        self.print_cache_stats()
+        self.save_object_count()
+
+    def run_segments(self, segments_dir, output_base_dir):
+        """
+        `split.py` が作成した全セグメント（segment_0, segment_1, ...）を1回のモデルロードで処理する。
+
+        - セグメントは番号順に処理し、出力は `output_base_dir/<セグメント名>` に保存する。
+        - 後続のセグメントでも使うフレームの特徴量だけをメモリに保持し、不要になったものは破棄する。
+        - オブジェクトIDのカウンタはセグメント間で引き継ぐ。
+        """
+        segment_names = get_segment_names(segments_dir)
+        segment_frames = [
+            set(p for p in os.listdir(os.path.join(segments_dir, d))
+                if os.path.splitext(p)[-1].lower() in [".jpg", ".jpeg", ".png"])
+            for d in segment_names
+        ]
+        # 各セグメントのフレームの特徴量キャッシュのキー
+        segment_keys = [
+            {self.feature_key(name, os.path.join(segments_dir, d)) for name in frames}
+            for d, frames in zip(segment_names, segment_frames)
+        ]
+        self.set_persist_frames(set().union(*segment_frames))
+        for i, segment_name in enumerate(segment_names):
+            if i > 0:
+                self.load_segment(
+                    os.path.join(segments_dir, segment_name),
+                    os.path.join(output_base_dir, segment_name),
+                )
+            # 以降のセグメントで再利用するフレームのみ特徴量を保持する
+            self.feature_cache.set_retain_keys(set().union(*segment_keys[i + 1:]))
+            self.process_frames()
+        self.print_cache_stats()
+        self.save_object_count()
+
+    def save_object_count(self):
         #2024.10.29 torisato
-        with open(os.path.join(str(self.camera_id), "last_object_count.txt"), "w") as file:
-            file.write(str(self.objects_count))
+        self.id_allocator.save_count(self.objects_count)
+        # 予約したIDの未使用分を返却する
+        self.id_allocator.release(self.objects_count)
         #結果の描画とビデオの保存 2024.10.28 torisato
         # self.draw_results_and_save_video()
 
@@ -648,13 +824,43 @@ if __name__ == "__main__":
         help="使用するCUDAデバイスのID（デフォルトは0）"
     )
     parser.add_argument('--camera_id', type=int, required=True, help='カメラのid')
+    parser.add_argument(
+        '--all_segments',
+        action='store_true',
+        help='input_folder / output_dir をセグメントの親フォルダとして扱い、全セグメントをまとめて処理する'
+    )
+    parser.add_argument('--cache_dir', type=str, default=None, help='推論結果キャッシュの保存先（デフォルト: <camera_id>/frame_cache）')
+    parser.add_argument('--cache_max_mb', type=int, default=2048, help='ディスクキャッシュの上限サイズ（MB）')
+    parser.add_argument('--persist_frames', type=int, default=0, help='次のバッチに引き継がれるフレーム数（この枚数分の推論結果をディスクに保存）')
+    parser.add_argument('--roi', type=str, default=None, help='推論対象の作業エリア "x1,y1,x2,y2"（未指定時はフルフレーム）')
+    parser.add_argument('--roi_scale', type=float, default=1.0, help='切り出した画像の縮小率（0 < roi_scale <= 1.0）')
     args = parser.parse_args()
 
     # VideoProcessorのインスタンスを作成し、処理を実行
-    processor = VideoProcessor(
-        input_folder=args.input_folder,
-        output_dir=args.output_dir,
-        device_id=args.device_id,
-        camera_id=args.camera_id
-    )
-    processor.run()
\ No newline at end of file
+    if args.all_segments:
+        first_segment = get_segment_names(args.input_folder)[0]
+        processor = VideoProcessor(
+            input_folder=os.path.join(args.input_folder, first_segment),
+            output_dir=os.path.join(args.output_dir, first_segment),
+            device_id=args.device_id,
+            camera_id=args.camera_id,
+            roi=parse_roi(args.roi),
+            roi_scale=args.roi_scale,
+            cache_dir=args.cache_dir,
+            cache_max_mb=args.cache_max_mb,
+            persist_frames=args.persist_frames
+        )
+        processor.run_segments(args.input_folder, args.output_dir)
+    else:
+        processor = VideoProcessor(
+            input_folder=args.input_folder,
+            output_dir=args.output_dir,
+            device_id=args.device_id,
+            camera_id=args.camera_id,
+            roi=parse_roi(args.roi),
+            roi_scale=args.roi_scale,
+            cache_dir=args.cache_dir,
+            cache_max_mb=args.cache_max_mb,
+            persist_frames=args.persist_frames
+        )
+        processor.run()
\ No newline at end of file
@@ -0,0 +1,355 @@
+"""
+gsam2_stream.py
+
+このスクリプトは、カメラから保存されるフレーム画像を到着順に1枚ずつ処理し、人物の検出・追跡結果を
+マスクおよびJSON形式で保存するストリーミング版の推論処理です。
+gsam2_c-idv2.py はセグメントのフォルダがすべて揃ってから推論を開始するため、撮影からDB登録までに
+1クリップ分（約30秒）の遅延が発生していました。本スクリプトではフレームが届くたびに推論するため、
+遅延は数フレーム分になります。
+
+## 主な機能
+
+- 入力フォルダを監視し、新しいフレーム画像を番号順に処理
+- `step` フレームごとに Grounding DINO で人物を検出し、追跡対象を追加・更新
+- 検出フレームの間は SAM2CameraPredictor の `track()` でフレームごとに追跡
+- 前回の追跡結果とのIoUでIDを引き継ぎ、新しい人物には新しいIDを割り当て
+- 検出・追跡結果を gsam2_c-idv2.py と同じ形式の `.npy`（マスク）および `.json`（属性情報）として保存
+- オブジェクトIDを `object_ids.sqlite3` からブロック単位で予約し、割り当て済みの最大IDを `last_object_count.txt` に記録
+
+## 実行方法（CLI引数）
+```bash
+python gsam2/gsam2_stream.py \
+  --input_folder ./1/frames \
+  --output_dir ./1/data/gsam2_stream \
+  --device_id 0 \
+  --camera_id 1
+
+引数:
+    --input_folder (str, 必須): フレーム画像が保存されるフォルダ（監視対象）
+    --output_dir (str, 任意): 出力ファイル（マスク/JSON）の保存先ディレクトリ（デフォルト: ./outputs）
+    --device_id (int, 任意): 使用するCUDAデバイスID（デフォルト: 0）
+    --camera_id (int, 必須): カメラ識別用のID。保存ファイルや状態管理に使用されます。
+    --step (int, 任意): Grounding DINO を実行するフレーム間隔（デフォルト: 15）
+    --poll_interval (float, 任意): 新しいフレームを確認する間隔（秒、デフォルト: 0.2）
+    --idle_timeout (float, 任意): 新しいフレームが届かない状態がこの秒数続いたら終了（デフォルト: 終了しない）
+    --roi (str, 任意): 推論対象の作業エリア "x1,y1,x2,y2"
+    --roi_scale (float, 任意): 切り出した画像の縮小率（0 < roi_scale <= 1.0、デフォルト: 1.0）
+
+出力:
+    <output_dir>/mask_data/: フレームごとのマスクファイル（.npy）
+    <output_dir>/json_data/: マスクに対応する属性情報（.json）
+    <camera_id>/object_ids.sqlite3: オブジェクト識別IDの払い出し状態（複数プロセスで共有）
+    <camera_id>/last_object_count.txt: 割り当て済みの最大ID（互換性のため）
+
+注意事項:
+    SAM2とGrounding DINOのチェックポイントは、./gsam2/checkpoints/ に配置されている必要があります。
+    CUDAデバイスが使用可能である必要があります（GPU推論を前提としています）。
+    フレーム画像のファイル名は数字（例: 134920000.jpg）である必要があります。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import time
+import argparse
+import torch
+import numpy as np
+from PIL import Image
+from sam2.build_sam import build_sam2_camera_predictor, build_sam2
+from sam2.sam2_image_predictor import SAM2ImagePredictor
+from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+from utils2.common_utils import CommonUtils
+from utils2.mask_dictionary_model import MaskDictionaryModel, ObjectInfo
+from utils2.roi_utils import FrameROI, parse_roi
+from utils2.id_allocator import ObjectIDAllocator
+from utils2.label_io import write_labels
+
+
+class StreamingTracker:
+    def __init__(self, output_dir="./outputs", device_id=0, camera_id=None, step=15, roi=None, roi_scale=1.0):
+        # 出力先とデバイスの設定
+        self.output_dir = output_dir
+        self.device_id = device_id
+        self.camera_id = camera_id
+        self.device = f"cuda:{device_id}" if torch.cuda.is_available() else "cpu"
+        torch.cuda.set_device(device_id)
+
+        # 環境設定とモデルの初期化
+        self.setup_environment()
+        self.initialize_models()
+        self.setup_directories()
+
+        # ROI は最初のフレームのサイズが分かった時点で設定する
+        self.roi = None
+        self.roi_args = (roi, roi_scale)
+
+        self.step = step  # Grounding DINOのフレーム間隔
+        self.PROMPT_TYPE_FOR_VIDEO = "mask"
+        self.text = "person."  # テキストプロンプト
+        self.id_allocator = ObjectIDAllocator(self.camera_id)
+        self.objects_count = 0  # 最後に割り当てたID
+
+        # 追跡状態
+        self.sam2_masks = MaskDictionaryModel()  # 直前のフレームの結果（IDの引き継ぎに使用）
+        self.class_names = {}  # object_id -> class_name
+        self.tracking = False
+        self.frames_since_detection = 0
+
+    def setup_environment(self):
+        """
+        CUDA環境の設定を行う。
+
+        - 半精度 (float16) 自動キャストを有効にしてメモリ効率を向上。
+        - 対象GPU（Compute Capability 8.0以上）の場合、TensorFloat-32（TF32）演算を許可。
+        """
+        torch.autocast(device_type="cuda", dtype=torch.float16).__enter__()
+        if torch.cuda.get_device_properties(self.device_id).major >= 8:
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+
+    def initialize_models(self):
+        """
+        SAM2（カメラ用予測器・画像予測器）と Grounding DINO を初期化する。
+        """
+        sam2_checkpoint = "./gsam2/checkpoints/sam2.1_hiera_large.pt"
+        model_cfg = "sam2.1_hiera_l.yaml"
+        self.camera_predictor = build_sam2_camera_predictor(model_cfg, sam2_checkpoint)
+        sam2_image_model = build_sam2(model_cfg, sam2_checkpoint, device=self.device)
+        self.image_predictor = SAM2ImagePredictor(sam2_image_model)
+
+        model_id = "IDEA-Research/grounding-dino-base"
+        self.processor = AutoProcessor.from_pretrained(model_id)
+        self.grounding_model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(self.device)
+
+    def setup_directories(self):
+        """出力結果（マスク・JSON）を保存するディレクトリを作成する。"""
+        CommonUtils.creat_dirs(self.output_dir)
+        self.mask_data_dir = os.path.join(self.output_dir, "mask_data")
+        self.json_data_dir = os.path.join(self.output_dir, "json_data")
+        CommonUtils.creat_dirs(self.mask_data_dir)
+        CommonUtils.creat_dirs(self.json_data_dir)
+
+    def setup_roi(self, image):
+        """最初のフレームのサイズから作業エリア（ROI）を設定する。"""
+        roi, roi_scale = self.roi_args
+        self.roi = FrameROI(roi, image.size[0], image.size[1], roi_scale)
+        detector_size = self.roi.detector_size()
+        if detector_size is not None:
+            self.processor.image_processor.size = detector_size
+
+    def process_frame(self, frame_name, image):
+        """
+        1フレームを処理し、マスクとJSONを保存する。
+
+        - 追跡中でない場合は、人物が検出されるまで毎フレーム Grounding DINO を実行する。
+        - 追跡中は `step` フレームごとに Grounding DINO で追跡対象を更新し、その間は `track()` で追跡する。
+
+        :param frame_name: フレーム画像のファイル名（例: 134920000.jpg）
+        :param image: フレーム画像（PIL.Image、フルフレーム）
+        """
+        if self.roi is None:
+            self.setup_roi(image)
+        image = self.roi.crop_image(image.convert("RGB"))
+        image_base_name = os.path.splitext(frame_name)[0]
+
+        if not self.tracking or self.frames_since_detection >= self.step:
+            frame_masks = self.detect_and_initialize(image)
+        else:
+            frame_masks = self.track(image)
+
+        if frame_masks is None:
+            self.save_empty(image_base_name)
+            return
+        frame_masks.mask_name = f"mask_{image_base_name}.npy"
+        self.save(frame_masks)
+
+    def detect_and_initialize(self, image):
+        """
+        Grounding DINO で人物を検出し、SAM2 でマスクを生成して追跡対象を初期化する。
+
+        - 直前の結果とのIoUが 0.8 を超える人物は同じIDを引き継ぐ。
+        - 検出されなかった場合（信頼度 0.7 未満の1件のみの場合を含む）は追跡を停止し None を返す。
+        """
+        inputs = self.processor(images=image, text=self.text, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            outputs = self.grounding_model(**inputs)
+        results = self.processor.post_process_grounded_object_detection(
+            outputs,
+            inputs.input_ids,
+            box_threshold=0.35,
+            text_threshold=0.25,
+            target_sizes=[image.size[::-1]],
+        )
+        input_boxes = results[0]["boxes"]
+        if len(input_boxes) == 0 or (len(input_boxes) == 1 and results[0]["scores"][0] < 0.7):
+            self.stop_tracking()
+            return None
+
+        # SAM画像予測器でのマスク生成
+        self.image_predictor.set_image(np.array(image))
+        masks, scores, logits = self.image_predictor.predict(
+            point_coords=None,
+            point_labels=None,
+            box=input_boxes,
+            multimask_output=False,
+        )
+        if masks.ndim == 2:
+            masks = masks[None]
+        elif masks.ndim == 4:
+            masks = masks.squeeze(1)
+
+        mask_dict = MaskDictionaryModel(promote_type=self.PROMPT_TYPE_FOR_VIDEO)
+        mask_dict.add_new_frame_annotation(
+            mask_list=torch.as_tensor(masks, device=self.device).clone().detach(),
+            box_list=torch.as_tensor(input_boxes, device=self.device).clone().detach(),
+            label_list=results[0]["labels"]
+        )
+        # 直前の結果とのIoUでIDを引き継ぐ
+        self.objects_count = self.id_allocator.ensure_available(self.objects_count, len(mask_dict.labels))
+        objects_count = mask_dict.update_masks(
+            tracking_annotation_dict=self.sam2_masks, iou_threshold=0.8, objects_count=self.objects_count
+        )
+        if objects_count != self.objects_count:
+            self.objects_count = objects_count
+            self.save_object_count()
+        if len(mask_dict.labels) == 0:
+            self.stop_tracking()
+            return None
+
+        # 検出フレームを条件フレームとして追跡を開始する
+        self.camera_predictor.load_first_frame(image)
+        self.class_names = {}
+        for object_id, object_info in mask_dict.labels.items():
+            object_info.mask = object_info.mask.bool()
+            object_info.update_box()
+            box = torch.tensor(
+                [object_info.x1, object_info.y1, object_info.x2, object_info.y2],
+                dtype=torch.float32, device=self.device
+            )
+            self.camera_predictor.add_new_points(frame_idx=0, obj_id=object_id, box=box)
+            self.class_names[object_id] = object_info.class_name
+        self.tracking = True
+        self.frames_since_detection = 0
+
+        frame_masks = MaskDictionaryModel()
+        frame_masks.mask_height = image.size[1]
+        frame_masks.mask_width = image.size[0]
+        frame_masks.labels = mask_dict.labels
+        self.sam2_masks = frame_masks
+        return frame_masks
+
+    def track(self, image):
+        """直前までの追跡結果をもとに、SAM2CameraPredictor で1フレーム追跡する。"""
+        out_obj_ids, out_mask_logits = self.camera_predictor.track(image)
+        self.frames_since_detection += 1
+
+        frame_masks = MaskDictionaryModel()
+        for i, out_obj_id in enumerate(out_obj_ids):
+            out_mask = (out_mask_logits[i] > 0.0)
+            object_info = ObjectInfo(
+                instance_id=out_obj_id,
+                mask=out_mask[0],
+                class_name=self.class_names[out_obj_id]
+            )
+            object_info.update_box()
+            frame_masks.mask_height = out_mask.shape[-2]
+            frame_masks.mask_width = out_mask.shape[-1]
+            frame_masks.labels[out_obj_id] = object_info
+        self.sam2_masks = frame_masks
+        return frame_masks
+
+    def stop_tracking(self):
+        self.tracking = False
+        self.sam2_masks = MaskDictionaryModel()
+
+    def save(self, frame_masks):
+        """マスク（.npy）とJSONを gsam2_c-idv2.py と同じ形式で保存する。"""
+        mask_img = torch.zeros(frame_masks.mask_height, frame_masks.mask_width, device=self.device)
+        for obj_id, obj_info in frame_masks.labels.items():
+            mask_img[obj_info.mask.to(self.device) == True] = obj_id
+        # ROI 座標系のマスク・バウンディングボックスをフルフレームに戻して保存
+        mask_img = self.roi.mask_to_full(mask_img)
+        mask_img = mask_img.cpu().numpy().astype(np.uint16)
+        np.save(os.path.join(self.mask_data_dir, frame_masks.mask_name), mask_img)
+
+        json_data = self.roi.frame_dict_to_full(frame_masks.to_dict())
+        json_data_path = os.path.join(self.json_data_dir, frame_masks.mask_name.replace(".npy", ".json"))
+        write_labels(json_data_path, json_data)
+
+    def save_empty(self, image_base_name):
+        """オブジェクトが検出されなかったフレームの空のマスクとJSONを保存する。"""
+        empty_mask = np.zeros((self.roi.full_height, self.roi.full_width), dtype=np.uint16)
+        np.save(os.path.join(self.mask_data_dir, f"mask_{image_base_name}.npy"), empty_mask)
+        write_labels(os.path.join(self.json_data_dir, f"mask_{image_base_name}.json"), {})
+
+    def save_object_count(self):
+        self.id_allocator.save_count(self.objects_count)
+
+    def run(self, input_folder, poll_interval=0.2, idle_timeout=None):
+        """
+        入力フォルダを監視し、届いたフレームを番号順に処理する。
+
+        :param input_folder: フレーム画像が保存されるフォルダ
+        :param poll_interval: 新しいフレームを確認する間隔（秒）
+        :param idle_timeout: 新しいフレームが届かない状態がこの秒数続いたら終了（None の場合は終了しない）
+        """
+        for frame_name, image in watch_frames(input_folder, poll_interval, idle_timeout):
+            self.process_frame(frame_name, image)
+        self.save_object_count()
+        # 予約したIDの未使用分を返却する
+        self.id_allocator.release(self.objects_count)
+
+
+def watch_frames(input_folder, poll_interval=0.2, idle_timeout=None):
+    """
+    フォルダに追加されたフレーム画像を番号順に返すジェネレータ。
+
+    - 処理済みの最大のフレーム番号のみを保持するため、長時間動かしてもメモリは増えない。
+    - 書き込み途中で読み込みに失敗したフレームは、次の確認時に再試行する。
+    """
+    last_index = -1
+    last_frame_time = time.time()
+    while True:
+        frames = []
+        for p in os.listdir(input_folder):
+            name, ext = os.path.splitext(p)
+            if ext.lower() in [".jpg", ".jpeg", ".png"] and name.isdigit() and int(name) > last_index:
+                frames.append((int(name), p))
+        frames.sort()
+        for index, frame_name in frames:
+            try:
+                with Image.open(os.path.join(input_folder, frame_name)) as image:
+                    image.load()
+            except OSError:
+                break  # 書き込み途中（次の確認時に再試行）
+            last_index = index
+            last_frame_time = time.time()
+            yield frame_name, image
+        if idle_timeout is not None and time.time() - last_frame_time > idle_timeout:
+            return
+        time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming Tracker Script")
+    parser.add_argument('--input_folder', type=str, required=True, help='フレーム画像が保存されるフォルダのパス')
+    parser.add_argument('--output_dir', type=str, default="./outputs", help='出力を保存するフォルダのパス')
+    parser.add_argument('--device_id', type=int, default=0, help='使用するCUDAデバイスのID（デフォルトは0）')
+    parser.add_argument('--camera_id', type=int, required=True, help='カメラのid')
+    parser.add_argument('--step', type=int, default=15, help='Grounding DINOを実行するフレーム間隔')
+    parser.add_argument('--poll_interval', type=float, default=0.2, help='新しいフレームを確認する間隔（秒）')
+    parser.add_argument('--idle_timeout', type=float, default=None, help='新しいフレームが届かない場合に終了するまでの秒数')
+    parser.add_argument('--roi', type=str, default=None, help='推論対象の作業エリア "x1,y1,x2,y2"（未指定時はフルフレーム）')
+    parser.add_argument('--roi_scale', type=float, default=1.0, help='切り出した画像の縮小率（0 < roi_scale <= 1.0）')
+    args = parser.parse_args()
+
+    tracker = StreamingTracker(
+        output_dir=args.output_dir,
+        device_id=args.device_id,
+        camera_id=args.camera_id,
+        step=args.step,
+        roi=parse_roi(args.roi),
+        roi_scale=args.roi_scale
+    )
+    tracker.run(args.input_folder, poll_interval=args.poll_interval, idle_timeout=args.idle_timeout)
@@ -12,6 +12,13 @@ from tqdm import tqdm
 
 from sam2.modeling.sam2_base import NO_OBJ_SCORE, SAM2Base
 from sam2.utils.misc import concat_points, fill_holes_in_mask_scores, load_video_frames
+from sam2.utils.memory_bank import (
+    EVICT_MODES,
+    compress_output,
+    memory_stats,
+    select_frames_to_evict,
+    select_offloaded_to_drop,
+)
 import numpy as np
 import cv2
 
@@ -38,6 +45,40 @@ class SAM2CameraPredictor(SAM2Base):
         self.clear_non_cond_mem_for_multi_obj = clear_non_cond_mem_for_multi_obj
         self.condition_state = {}
         self.frame_idx = 0
+        # retention policy of the tracked (non-conditioning) frame outputs, see
+        # `set_memory_retention`
+        self.max_non_cond_frames = None
+        self.evict_mode = "drop"
+        self.max_offloaded_frames = None
+
+    def set_memory_retention(self, max_non_cond_frames=None, evict_mode="drop", max_offloaded_frames=None):
+        """
+        Keep only the `max_non_cond_frames` most recent tracked frames (plus the
+        conditioning frames) in the memory bank. Older outputs are dropped
+        (`evict_mode="drop"`, constant memory) or compressed to bfloat16 on CPU
+        (`evict_mode="offload"`). None keeps the frames `track_step` can still look
+        back to, which does not change the tracking results.
+
+        "offload" never drops frames by itself, so CPU memory grows for the whole
+        stream; set `max_offloaded_frames` to drop the offloaded outputs beyond the
+        most recent ones, or use "drop" (the default) for bounded memory.
+        """
+        if evict_mode not in EVICT_MODES:
+            raise ValueError(f"evict_mode must be one of {EVICT_MODES}, got {evict_mode}")
+        self.max_non_cond_frames = max_non_cond_frames
+        self.evict_mode = evict_mode
+        self.max_offloaded_frames = max_offloaded_frames
+
+    def get_memory_stats(self):
+        """
+        Report the bytes held by the tracking outputs, in total, per device, per
+        frame and per object (see `memory_bank.memory_stats`).
+        """
+        return memory_stats(
+            self.condition_state["output_dict"],
+            self.condition_state["output_dict_per_obj"],
+            self.condition_state["obj_idx_to_id"],
+        )
 
     def perpare_data(
         self,
@@ -70,8 +111,10 @@ class SAM2CameraPredictor(SAM2Base):
             offload_video_to_cpu=False, offload_state_to_cpu=False
         )
         img, width, height = self.perpare_data(img, image_size=self.image_size)
+        # restart the frame counter of `track` for the new session
+        self.frame_idx = 0
         self.condition_state["images"] = [img]
-        self.condition_state["num_frames"] = len(img)
+        self.condition_state["num_frames"] = 1
         self.condition_state["video_height"] = height
         self.condition_state["video_width"] = width
         self._get_image_feature(frame_idx=0, batch_size=1)
@@ -573,6 +616,8 @@ class SAM2CameraPredictor(SAM2Base):
         self.frame_idx += 1
         if not self.condition_state["tracking_has_started"]:
             self.propagate_in_video_preflight()
+        # frames seen so far (bounds how far back memory and object pointers can look)
+        self.condition_state["num_frames"] = self.frame_idx + 1
 
         img, _, _ = self.perpare_data(img, image_size=self.image_size)
 
@@ -631,9 +676,35 @@ class SAM2CameraPredictor(SAM2Base):
         }
 
         storage_key = "non_cond_frame_outputs"
+        # keep this frame as memory for the following frames
+        output_dict[storage_key][self.frame_idx] = current_out
+        self._trim_non_cond_outputs()
         _, video_res_masks = self._get_orig_video_res_output(pred_masks_gpu)
         return obj_ids, video_res_masks
 
+    def _trim_non_cond_outputs(self):
+        """
+        Evict non-conditioning outputs outside the retention window. By default the
+        window covers what `track_step` can still use (it only looks back
+        `num_maskmem` frames, strided by `memory_temporal_stride_for_eval`, for
+        memory and `max_obj_ptrs_in_encoder` frames for object pointers), so that
+        streaming over an unbounded number of frames runs in constant memory.
+        """
+        window = self.max_non_cond_frames
+        if window is None:
+            window = max(
+                self.num_maskmem * self.memory_temporal_stride_for_eval,
+                self.max_obj_ptrs_in_encoder,
+            )
+        non_cond_outputs = self.condition_state["output_dict"]["non_cond_frame_outputs"]
+        for frame_idx in select_frames_to_evict(non_cond_outputs, self.frame_idx, window):
+            if self.evict_mode == "drop":
+                del non_cond_outputs[frame_idx]
+            else:
+                compress_output(non_cond_outputs[frame_idx], "cpu")
+        for frame_idx in select_offloaded_to_drop(non_cond_outputs, self.max_offloaded_frames):
+            del non_cond_outputs[frame_idx]
+
     @torch.inference_mode()
     def propagate_in_video(
         self,
@@ -12,6 +12,13 @@ from tqdm import tqdm
 
 from sam2.modeling.sam2_base import NO_OBJ_SCORE, SAM2Base
 from sam2.utils.misc import concat_points, fill_holes_in_mask_scores, load_video_frames
+from sam2.utils.memory_bank import (
+    EVICT_MODES,
+    compress_output,
+    memory_stats,
+    select_frames_to_evict,
+    select_offloaded_to_drop,
+)
 
 
 class SAM2VideoPredictor(SAM2Base):
@@ -42,13 +49,49 @@ class SAM2VideoPredictor(SAM2Base):
         offload_video_to_cpu=False,
         offload_state_to_cpu=False,
         async_loading_frames=False,
+        image_transform=None,
+        frame_keys=None,
+        shared_feature_cache=None,
+        num_load_workers=None,
+        pin_memory=False,
+        max_non_cond_frames=None,
+        evict_mode="offload",
+        max_offloaded_frames=None,
     ):
-        """Initialize a inference state."""
+        """
+        Initialize a inference state.
+
+        `image_transform` is an optional callable applied to each PIL frame before
+        it is resized (e.g. a per-camera ROI crop); output masks then have the size
+        of the transformed frames.
+
+        `frame_keys` (one key per frame, e.g. the frame file names) together with a
+        `SharedFrameFeatureCache` let several inference states over overlapping
+        videos reuse the image features of frames they have in common.
+
+        `num_load_workers` is the number of threads decoding the JPEG frames and
+        `pin_memory` keeps the decoded frames in pinned host memory.
+
+        `max_non_cond_frames` bounds the memory bank: only the N most recent
+        non-conditioning frame outputs (in the tracking direction) are kept as is,
+        plus all conditioning frames. Older outputs are compressed to bfloat16 on
+        CPU (`evict_mode="offload"`) or dropped (`evict_mode="drop"`). Keeping N at
+        least `max(num_maskmem, max_obj_ptrs_in_encoder)` does not change the
+        tracking results. "offload" keeps every evicted output on CPU, so its
+        memory grows with the video length; `max_offloaded_frames` additionally
+        drops the offloaded outputs beyond the N most recent ones. Use
+        `get_memory_stats` to see the resident bytes.
+        """
+        if evict_mode not in EVICT_MODES:
+            raise ValueError(f"evict_mode must be one of {EVICT_MODES}, got {evict_mode}")
         images, video_height, video_width = load_video_frames(
             video_path=video_path,
             image_size=self.image_size,
             offload_video_to_cpu=offload_video_to_cpu,
             async_loading_frames=async_loading_frames,
+            image_transform=image_transform,
+            num_workers=num_load_workers,
+            pin_memory=pin_memory,
         )
         inference_state = {}
         inference_state["images"] = images
@@ -74,6 +117,15 @@ class SAM2VideoPredictor(SAM2Base):
         inference_state["mask_inputs_per_obj"] = {}
         # visual features on a small number of recently visited frames for quick interactions
         inference_state["cached_features"] = {}
+        # image features shared with other inference states (keyed by `frame_keys`)
+        inference_state["frame_keys"] = frame_keys
+        inference_state["shared_feature_cache"] = shared_feature_cache
+        # retention policy of the non-conditioning frame outputs
+        inference_state["memory_retention"] = {
+            "max_non_cond_frames": max_non_cond_frames,
+            "evict_mode": evict_mode,
+            "max_offloaded_frames": max_offloaded_frames,
+        }
         # values that don't change across frames (so we only need to hold one copy of them)
         inference_state["constants"] = {}
         # mapping between client-side object id and model-side object index
@@ -658,6 +710,7 @@ class SAM2VideoPredictor(SAM2Base):
                 inference_state, frame_idx, current_out, storage_key
             )
             inference_state["frames_already_tracked"][frame_idx] = {"reverse": reverse}
+            self._apply_memory_retention(inference_state, frame_idx, reverse)
 
             # Resize the output mask to the original video resolution (we directly use
             # the mask scores on GPU for output to avoid any CPU conversion in between)
@@ -666,6 +719,54 @@ class SAM2VideoPredictor(SAM2Base):
             )
             yield frame_idx, obj_ids, video_res_masks
 
+    def _apply_memory_retention(self, inference_state, frame_idx, reverse):
+        """
+        Compress or drop the non-conditioning outputs that fell out of the retention
+        window (see `max_non_cond_frames` in `init_state`). Frames that received
+        inputs are always kept.
+        """
+        retention = inference_state["memory_retention"]
+        max_non_cond_frames = retention["max_non_cond_frames"]
+        if max_non_cond_frames is None:
+            return
+        storage_key = "non_cond_frame_outputs"
+        non_cond_outputs = inference_state["output_dict"][storage_key]
+        input_frame_inds = inference_state["consolidated_frame_inds"][storage_key]
+        for t in select_frames_to_evict(
+            non_cond_outputs, frame_idx, max_non_cond_frames, reverse
+        ):
+            if t in input_frame_inds:
+                continue
+            if retention["evict_mode"] == "drop":
+                del non_cond_outputs[t]
+                for obj_output_dict in inference_state["output_dict_per_obj"].values():
+                    obj_output_dict[storage_key].pop(t, None)
+            else:
+                compress_output(non_cond_outputs[t], "cpu")
+                # re-slice so that the per-object outputs no longer hold the old tensors
+                self._add_output_per_object(
+                    inference_state, t, non_cond_outputs[t], storage_key
+                )
+        for t in select_offloaded_to_drop(
+            non_cond_outputs, retention["max_offloaded_frames"], reverse
+        ):
+            if t in input_frame_inds:
+                continue
+            del non_cond_outputs[t]
+            for obj_output_dict in inference_state["output_dict_per_obj"].values():
+                obj_output_dict[storage_key].pop(t, None)
+
+    def get_memory_stats(self, inference_state):
+        """
+        Report the bytes held by the tracking outputs of `inference_state`, in total,
+        per device, per frame and per object (see `memory_bank.memory_stats`).
+        """
+        return memory_stats(
+            inference_state["output_dict"],
+            inference_state["output_dict_per_obj"],
+            inference_state["obj_idx_to_id"],
+        )
+
     def _add_output_per_object(
         self, inference_state, frame_idx, current_out, storage_key
     ):
@@ -733,9 +834,17 @@ class SAM2VideoPredictor(SAM2Base):
             frame_idx, (None, None)
         )
         if backbone_out is None:
-            # Cache miss -- we will run inference on a single image
             image = inference_state["images"][frame_idx].cuda().float().unsqueeze(0)
-            backbone_out = self.forward_image(image)
+            shared_cache = inference_state.get("shared_feature_cache")
+            frame_key = None
+            if shared_cache is not None and inference_state.get("frame_keys") is not None:
+                frame_key = inference_state["frame_keys"][frame_idx]
+                backbone_out = shared_cache.get(frame_key, image.device)
+            if backbone_out is None:
+                # Cache miss -- we will run inference on a single image
+                backbone_out = self.forward_image(image)
+                if frame_key is not None:
+                    shared_cache.put(frame_key, backbone_out)
             # Cache the most recent frame's feature (for repeated interactions with
             # a frame; we can use an LRU cache for more frames in the future).
             inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
@@ -0,0 +1,125 @@
+# Bounded retention and accounting for the per-frame outputs ("memory bank") kept by
+# the SAM 2 video/camera predictors.
+
+import torch
+
+# what to do with a non-conditioning frame output that falls out of the retention window:
+# "drop" keeps the memory bank bounded; "offload" keeps every evicted frame (compressed, on
+# CPU), so CPU memory grows with the stream unless `max_offloaded_frames` is also set
+EVICT_MODES = ("offload", "drop")
+
+
+def tensor_nbytes(x):
+    """Bytes held by a tensor (or a list/tuple of tensors); 0 for None."""
+    if x is None:
+        return 0
+    if isinstance(x, (list, tuple)):
+        return sum(tensor_nbytes(t) for t in x)
+    return x.numel() * x.element_size()
+
+
+def _add_bytes(stats, device, nbytes):
+    stats[str(device)] = stats.get(str(device), 0) + nbytes
+
+
+def output_nbytes(out, per_device=None):
+    """
+    Bytes held by a single frame output. `maskmem_pos_enc` is shared across frames
+    (only one copy is stored) and is therefore not counted here.
+    """
+    nbytes = 0
+    for key in ("maskmem_features", "pred_masks", "obj_ptr"):
+        x = out.get(key)
+        if x is None:
+            continue
+        n = tensor_nbytes(x)
+        nbytes += n
+        if per_device is not None:
+            _add_bytes(per_device, x.device, n)
+    return nbytes
+
+
+def compress_output(out, storage_device="cpu"):
+    """
+    Move an evicted frame output to `storage_device` in bfloat16. The object pointer
+    is a small tensor mixed with the other frames' pointers on the GPU, so it is kept
+    as is.
+    """
+    for key in ("maskmem_features", "pred_masks"):
+        x = out.get(key)
+        if x is not None:
+            out[key] = x.to(storage_device, dtype=torch.bfloat16, non_blocking=True)
+    out["compressed"] = True
+    return out
+
+
+def select_frames_to_evict(non_cond_outputs, frame_idx, max_non_cond_frames, reverse=False):
+    """
+    Non-conditioning frames farther than `max_non_cond_frames` from `frame_idx` in the
+    tracking direction (already compressed outputs are skipped).
+    """
+    if reverse:
+        return [
+            t
+            for t, out in non_cond_outputs.items()
+            if t >= frame_idx + max_non_cond_frames and not out.get("compressed")
+        ]
+    return [
+        t
+        for t, out in non_cond_outputs.items()
+        if t <= frame_idx - max_non_cond_frames and not out.get("compressed")
+    ]
+
+
+def select_offloaded_to_drop(non_cond_outputs, max_offloaded_frames, reverse=False):
+    """
+    Compressed (offloaded) frames beyond the `max_offloaded_frames` most recent ones in
+    the tracking direction. None keeps all of them.
+    """
+    if max_offloaded_frames is None:
+        return []
+    compressed = sorted(
+        (t for t, out in non_cond_outputs.items() if out.get("compressed")),
+        reverse=not reverse,
+    )
+    return compressed[max_offloaded_frames:]
+
+
+def memory_stats(output_dict, output_dict_per_obj=None, obj_idx_to_id=None):
+    """
+    Report the bytes held by the tracking outputs.
+
+    Returns a dict with:
+    - "total_bytes": bytes over all frame outputs
+    - "per_device": {device: bytes}
+    - "per_frame": {frame_idx: bytes}
+    - "per_object": {obj_id: bytes} (the per-object slices share storage with the
+      frame outputs, so these add up to the same total)
+    - "num_cond_frames" / "num_non_cond_frames" / "num_compressed_frames"
+    """
+    per_device = {}
+    per_frame = {}
+    num_compressed = 0
+    for storage_key in ("cond_frame_outputs", "non_cond_frame_outputs"):
+        for frame_idx, out in output_dict[storage_key].items():
+            per_frame[frame_idx] = per_frame.get(frame_idx, 0) + output_nbytes(out, per_device)
+            num_compressed += bool(out.get("compressed"))
+
+    per_object = {}
+    for obj_idx, obj_output_dict in (output_dict_per_obj or {}).items():
+        obj_id = obj_idx_to_id[obj_idx] if obj_idx_to_id is not None else obj_idx
+        per_object[obj_id] = sum(
+            output_nbytes(out)
+            for storage_key in ("cond_frame_outputs", "non_cond_frame_outputs")
+            for out in obj_output_dict[storage_key].values()
+        )
+
+    return {
+        "total_bytes": sum(per_frame.values()),
+        "per_device": per_device,
+        "per_frame": per_frame,
+        "per_object": per_object,
+        "num_cond_frames": len(output_dict["cond_frame_outputs"]),
+        "num_non_cond_frames": len(output_dict["non_cond_frame_outputs"]),
+        "num_compressed_frames": num_compressed,
+    }
@@ -6,7 +6,8 @@
 
 import os
 import warnings
-from threading import Thread
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
@@ -89,32 +90,77 @@ def mask_to_box(masks: torch.Tensor):
     return bbox_coords
 
 
-def _load_img_as_tensor(img_path, image_size):
+def _load_img_as_uint8(img_path, image_size, image_transform=None):
+    """Decode and resize a frame, keeping it as a (3, image_size, image_size) uint8 tensor."""
     img_pil = Image.open(img_path)
+    if image_transform is not None:
+        # e.g. crop to a per-camera ROI; the video size becomes the transformed size
+        img_pil = image_transform(img_pil)
     img_np = np.array(img_pil.convert("RGB").resize((image_size, image_size)))
-    if img_np.dtype == np.uint8:  # np.uint8 is expected for JPEG images
-        img_np = img_np / 255.0
-    else:
+    if img_np.dtype != np.uint8:  # np.uint8 is expected for JPEG images
         raise RuntimeError(f"Unknown image dtype: {img_np.dtype} on {img_path}")
-    img = torch.from_numpy(img_np).permute(2, 0, 1)
+    img = torch.from_numpy(img_np).permute(2, 0, 1).contiguous()
     video_width, video_height = img_pil.size  # the original video size
     return img, video_height, video_width
 
 
+def _load_img_as_tensor(img_path, image_size, image_transform=None):
+    img, video_height, video_width = _load_img_as_uint8(
+        img_path, image_size, image_transform
+    )
+    return img.float() / 255.0, video_height, video_width
+
+
+def _default_num_workers():
+    return min(8, os.cpu_count() or 1)
+
+
+def _normalize_frames(frames, img_mean, img_std, device):
+    """Normalize a (N, 3, H, W) uint8 batch to float32 on `device`."""
+    frames = frames.to(device, non_blocking=True).float()
+    frames /= 255.0
+    frames -= img_mean.to(device)
+    frames /= img_std.to(device)
+    return frames
+
+
 class AsyncVideoFrameLoader:
     """
     A list of video frames to be load asynchronously without blocking session start.
+
+    Frames are decoded by a pool of `num_workers` threads (PIL releases the GIL
+    while decoding/resizing) and kept as uint8 until they are requested. On access,
+    a batch of `batch_size` consecutive frames is normalized at once, on the GPU
+    when available. Decoded frames can be kept in pinned host memory
+    (`pin_memory=True`) to speed up the host-to-device copy.
     """
 
-    def __init__(self, img_paths, image_size, offload_video_to_cpu, img_mean, img_std):
+    def __init__(
+        self,
+        img_paths,
+        image_size,
+        offload_video_to_cpu,
+        img_mean,
+        img_std,
+        image_transform=None,
+        num_workers=None,
+        batch_size=8,
+        pin_memory=False,
+    ):
         self.img_paths = img_paths
         self.image_size = image_size
+        self.image_transform = image_transform
         self.offload_video_to_cpu = offload_video_to_cpu
         self.img_mean = img_mean
         self.img_std = img_std
-        # items in `self._images` will be loaded asynchronously
-        self.images = [None] * len(img_paths)
-        # catch and raise any exceptions in the async loading thread
+        self.batch_size = batch_size
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # uint8 frames, filled in by the decoding workers
+        self.frames = [None] * len(img_paths)
+        # the most recently normalized batch {frame_idx: normalized frame}
+        self.normalized = {}
+        # catch and raise any exceptions in the decoding workers
         self.exception = None
         # video_height and video_width be filled when loading the first image
         self.video_height = None
@@ -122,42 +168,61 @@ class AsyncVideoFrameLoader:
 
         # load the first frame to fill video_height and video_width and also
         # to cache it (since it's most likely where the user will click)
-        self.__getitem__(0)
+        self._decode(0)
+
+        # decode the rest of frames asynchronously without blocking the session start
+        num_workers = num_workers or _default_num_workers()
+        self.executor = ThreadPoolExecutor(max_workers=num_workers)
+        self.futures = [None] + [
+            self.executor.submit(self._decode, n) for n in range(1, len(img_paths))
+        ]
+        self.executor.shutdown(wait=False)
+
+    def _decode(self, index):
+        try:
+            img, video_height, video_width = _load_img_as_uint8(
+                self.img_paths[index], self.image_size, self.image_transform
+            )
+            if self.pin_memory:
+                img = img.pin_memory()
+        except Exception as e:
+            self.exception = e
+            raise
+        self.video_height = video_height
+        self.video_width = video_width
+        self.frames[index] = img
 
-        # load the rest of frames asynchronously without blocking the session start
-        def _load_frames():
+    def _get_frame(self, index):
+        if self.frames[index] is None:
             try:
-                for n in tqdm(range(len(self.images)), desc="frame loading (JPEG)"):
-                    self.__getitem__(n)
+                self.futures[index].result()
             except Exception as e:
-                self.exception = e
-
-        self.thread = Thread(target=_load_frames, daemon=True)
-        self.thread.start()
+                raise RuntimeError("Failure in frame loading thread") from e
+        return self.frames[index]
 
     def __getitem__(self, index):
         if self.exception is not None:
             raise RuntimeError("Failure in frame loading thread") from self.exception
 
-        img = self.images[index]
+        img = self.normalized.get(index)
         if img is not None:
             return img
 
-        img, video_height, video_width = _load_img_as_tensor(
-            self.img_paths[index], self.image_size
-        )
-        self.video_height = video_height
-        self.video_width = video_width
-        # normalize by mean and std
-        img -= self.img_mean
-        img /= self.img_std
-        if not self.offload_video_to_cpu:
-            img = img.cuda(non_blocking=True)
-        self.images[index] = img
-        return img
+        # normalize a batch of frames around `index` in the tracking direction
+        if index + 1 in self.normalized:
+            start = max(0, index - self.batch_size + 1)
+        else:
+            start = index
+        end = min(start + self.batch_size, len(self.frames))
+        batch = torch.stack([self._get_frame(n) for n in range(start, end)])
+        # only one normalized batch is kept, so this stays on the GPU even when
+        # `offload_video_to_cpu` is set (the whole video is held as uint8 on CPU)
+        batch = _normalize_frames(batch, self.img_mean, self.img_std, self.device)
+        self.normalized = {n: batch[n - start] for n in range(start, end)}
+        return self.normalized[index]
 
     def __len__(self):
-        return len(self.images)
+        return len(self.frames)
 
 
 def load_video_frames(
@@ -167,6 +232,9 @@ def load_video_frames(
     img_mean=(0.485, 0.456, 0.406),
     img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
+    image_transform=None,
+    num_workers=None,
+    pin_memory=False,
 ):
     """
     Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format).
@@ -175,6 +243,14 @@ def load_video_frames(
     `offload_video_to_cpu` is `False` and to CPU if `offload_video_to_cpu` is `True`.
 
     You can load a frame asynchronously by setting `async_loading_frames` to `True`.
+
+    `image_transform` is an optional callable applied to each PIL frame before
+    resizing (e.g. an ROI crop). The returned video height/width are those of the
+    transformed frames.
+
+    Frames are decoded by `num_workers` threads (defaults to the number of CPUs,
+    up to 8) and normalized in batches; `pin_memory` keeps the decoded uint8
+    frames in pinned host memory.
     """
     if isinstance(video_path, str) and os.path.isdir(video_path):
         jpg_folder = video_path
@@ -196,23 +272,117 @@ def load_video_frames(
 
     if async_loading_frames:
         lazy_images = AsyncVideoFrameLoader(
-            img_paths, image_size, offload_video_to_cpu, img_mean, img_std
+            img_paths,
+            image_size,
+            offload_video_to_cpu,
+            img_mean,
+            img_std,
+            image_transform,
+            num_workers=num_workers,
+            pin_memory=pin_memory,
         )
         return lazy_images, lazy_images.video_height, lazy_images.video_width
 
-    images = torch.zeros(num_frames, 3, image_size, image_size, dtype=torch.float32)
-    for n, img_path in enumerate(tqdm(img_paths, desc="frame loading (JPEG)")):
-        images[n], video_height, video_width = _load_img_as_tensor(img_path, image_size)
-    if not offload_video_to_cpu:
-        images = images.cuda()
-        img_mean = img_mean.cuda()
-        img_std = img_std.cuda()
-    # normalize by mean and std
-    images -= img_mean
-    images /= img_std
+    frames = torch.zeros(num_frames, 3, image_size, image_size, dtype=torch.uint8)
+    if pin_memory and torch.cuda.is_available():
+        frames = frames.pin_memory()
+    with ThreadPoolExecutor(max_workers=num_workers or _default_num_workers()) as executor:
+        results = executor.map(
+            lambda path: _load_img_as_uint8(path, image_size, image_transform), img_paths
+        )
+        for n, (img, video_height, video_width) in enumerate(
+            tqdm(results, total=num_frames, desc="frame loading (JPEG)")
+        ):
+            frames[n] = img
+    # normalize by mean and std in batches (on the GPU unless offloading)
+    device = torch.device("cpu" if offload_video_to_cpu else "cuda")
+    images = torch.empty(
+        num_frames, 3, image_size, image_size, dtype=torch.float32, device=device
+    )
+    batch_size = 16
+    for start in range(0, num_frames, batch_size):
+        images[start : start + batch_size] = _normalize_frames(
+            frames[start : start + batch_size], img_mean, img_std, device
+        )
     return images, video_height, video_width
 
 
+class SharedFrameFeatureCache:
+    """
+    Image encoder outputs shared between several inference states whose videos
+    contain the same frames (e.g. the overlapping segments of one clip), so that
+    each unique frame is encoded only once.
+
+    Features are keyed by frame (e.g. its name or content hash) and kept on
+    `storage_device`. Only keys in `retain_keys` are stored (all keys if it is
+    None), which lets the caller keep just the frames that later videos still
+    need. If `max_bytes` is set, the least recently used entries are evicted to
+    keep the stored features under that size.
+    """
+
+    def __init__(self, storage_device="cpu", max_bytes=None):
+        self.storage_device = torch.device(storage_device)
+        self.max_bytes = max_bytes
+        self.backbone_fpn = OrderedDict()
+        self.nbytes = 0
+        # the positional encodings only depend on the feature size, so they are
+        # identical for every frame and a single copy is kept
+        self.vision_pos_enc = None
+        self.retain_keys = None
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.backbone_fpn
+
+    def __len__(self):
+        return len(self.backbone_fpn)
+
+    def get(self, key, device):
+        """Return the cached backbone output of `key` on `device` (or None)."""
+        backbone_fpn = self.backbone_fpn.get(key)
+        if backbone_fpn is None or self.vision_pos_enc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.backbone_fpn.move_to_end(key)
+        return {
+            "backbone_fpn": [f.to(device, non_blocking=True) for f in backbone_fpn],
+            "vision_pos_enc": [p.to(device, non_blocking=True) for p in self.vision_pos_enc],
+        }
+
+    def put(self, key, backbone_out):
+        if self.retain_keys is not None and key not in self.retain_keys:
+            return
+        self._store(
+            key, [f.detach().to(self.storage_device) for f in backbone_out["backbone_fpn"]]
+        )
+        if self.vision_pos_enc is None:
+            self.vision_pos_enc = [
+                p.detach().to(self.storage_device) for p in backbone_out["vision_pos_enc"]
+            ]
+
+    def set_retain_keys(self, keys):
+        """Only keep (and from now on only store) the features of `keys`."""
+        self.retain_keys = set(keys)
+        for key in list(self.backbone_fpn):
+            if key not in self.retain_keys:
+                self._evict(key)
+
+    def _store(self, key, backbone_fpn):
+        if key in self.backbone_fpn:
+            self._evict(key)
+        self.backbone_fpn[key] = backbone_fpn
+        self.nbytes += sum(f.numel() * f.element_size() for f in backbone_fpn)
+        if self.max_bytes is not None:
+            while self.nbytes > self.max_bytes and len(self.backbone_fpn) > 1:
+                self._evict(next(iter(self.backbone_fpn)))
+
+    def _evict(self, key):
+        backbone_fpn = self.backbone_fpn.pop(key)
+        self.nbytes -= sum(f.numel() * f.element_size() for f in backbone_fpn)
+
+
 def fill_holes_in_mask_scores(mask, max_area):
     """
     A post processor to fill small holes in mask scores with area under `max_area`.
@@ -5,6 +5,7 @@ import numpy as np
 from dataclasses import dataclass
 import supervision as sv
 import random
+from utils2.label_io import read_labels, loads_labels
 
 class CommonUtils:
     @staticmethod
@@ -47,8 +48,7 @@ class CommonUtils:
             
             # load box information
             file_path = os.path.join(json_path, "mask_"+raw_image_name.split(".")[0]+".json")
-            with open(file_path, "r") as file:
-                json_data = json.load(file)
+            json_data = read_labels(file_path)
             
             class_id_counter = 0  # For assigning integer class IDs
             
@@ -125,8 +125,8 @@ class CommonUtils:
 
 
             file_path = os.path.join(json_path, "mask_"+raw_image_name.split(".")[0]+".json")
-            with open(file_path, 'r') as file:
-                json_data = json.load(file)
+            with open(file_path, 'rb') as file:
+                json_data = loads_labels(file.read())
                 # Draw bounding boxes and labels
                 for obj_id, obj_item in json_data["labels"].items():
                     # Extract data from JSON
@@ -0,0 +1,212 @@
+"""
+frame_cache.py
+
+フレーム画像の内容（ハッシュ値）をキーとして、Grounding DINO の検出結果と
+SAM2 画像エンコーダの特徴量をキャッシュするためのユーティリティ。
+
+- 連続するバッチの間では `split.copy_images` により最後の数フレームが次のバッチに
+  引き継がれるため、同じ画像が再度推論されていた。ファイル名ではなく内容のハッシュを
+  キーにすることで、別プロセス・別フォルダの同じ画像でもキャッシュが効く。
+- メモリ上のキャッシュに加えてディスク上にも保存し、プロセスをまたいで再利用する。
+- どちらも LRU 方式で、上限サイズを超えた場合は古いものから削除する。
+"""
+
+import os
+import hashlib
+from collections import OrderedDict
+
+import torch
+from sam2.utils.misc import SharedFrameFeatureCache
+
+
+def frame_content_key(frame_path):
+    """
+    フレーム画像ファイルの内容からキャッシュキー（16進数のハッシュ文字列）を作成する。
+
+    :param frame_path: フレーム画像のパス
+    """
+    h = hashlib.blake2b(digest_size=20)
+    with open(frame_path, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def settings_digest(*settings):
+    """
+    モデル・ROI・閾値など、推論結果に影響する設定から短いハッシュ文字列を作成する。
+    設定が変わった場合に古いキャッシュを使わないよう、キャッシュキーに付加する。
+    """
+    return hashlib.blake2b(repr(settings).encode("utf-8"), digest_size=4).hexdigest()
+
+
+class DiskLRUCache:
+    """
+    キーごとに1ファイル（torch.save 形式）で保存するディスクキャッシュ。
+    合計サイズが `max_bytes` を超えた場合は、最後に使われた時刻が古いものから削除する。
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # 既存のキャッシュファイルを最終更新時刻順に読み込む（先頭が最も古い）
+        entries = []
+        for name in os.listdir(cache_dir):
+            if not name.endswith(".pt"):
+                continue
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name[:-3], stat.st_size))
+        entries.sort()
+        self.index = OrderedDict((key, size) for _, key, size in entries)
+        self.nbytes = sum(self.index.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    def _adopt(self, key):
+        """
+        インデックスにないキーのファイルが存在する場合（__init__ の後に別プロセスが書き込んだ場合）、インデックスに追加する。
+        """
+        try:
+            size = os.path.getsize(self._path(key))
+        except OSError:
+            return False
+        self.index[key] = size
+        self.nbytes += size
+        return True
+
+    def __contains__(self, key):
+        return key in self.index or self._adopt(key)
+
+    def get(self, key):
+        if key not in self:
+            return None
+        path = self._path(key)
+        try:
+            value = torch.load(path, map_location="cpu")
+        except (OSError, RuntimeError, EOFError):
+            # 別プロセスによる削除や書き込み途中のファイルはキャッシュミスとして扱う
+            self._remove(key)
+            return None
+        os.utime(path)
+        self.index.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(value, tmp_path)
+        os.replace(tmp_path, path)
+        if key in self.index:
+            self.nbytes -= self.index.pop(key)
+        size = os.path.getsize(path)
+        self.index[key] = size
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self.index) > 1:
+            self._remove(next(iter(self.index)))
+
+    def _remove(self, key):
+        self.nbytes -= self.index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class PersistentFeatureCache(SharedFrameFeatureCache):
+    """
+    SAM2 画像エンコーダの特徴量キャッシュ（メモリ + ディスク）。
+
+    メモリ上のキャッシュは `SharedFrameFeatureCache` と同じくセグメント間で共有し、
+    `persist_keys` に含まれるフレーム（次のバッチに引き継がれるフレーム）のみディスクにも保存する。
+    """
+
+    def __init__(self, cache_dir, max_disk_bytes, storage_device="cpu", max_bytes=None):
+        super().__init__(storage_device=storage_device, max_bytes=max_bytes)
+        self.disk = DiskLRUCache(cache_dir, max_disk_bytes)
+        self.pos_enc_path = os.path.join(cache_dir, "vision_pos_enc.pos")
+        self.persist_keys = set()
+        self.disk_hits = 0
+
+    def get(self, key, device):
+        backbone_out = super().get(key, device)
+        if backbone_out is not None or key not in self.disk:
+            return backbone_out
+        backbone_fpn = self.disk.get(key)
+        if backbone_fpn is None:
+            return None
+        if self.vision_pos_enc is None:
+            if not os.path.exists(self.pos_enc_path):
+                return None
+            self.vision_pos_enc = torch.load(self.pos_enc_path, map_location=self.storage_device)
+        self.disk_hits += 1
+        self.misses -= 1
+        backbone_fpn = [f.to(self.storage_device) for f in backbone_fpn]
+        if self.retain_keys is None or key in self.retain_keys:
+            self._store(key, backbone_fpn)
+            return super().get(key, device)
+        # retain_keys にないフレームはメモリに保持せず、そのまま返す
+        self.hits += 1
+        return {
+            "backbone_fpn": [f.to(device, non_blocking=True) for f in backbone_fpn],
+            "vision_pos_enc": [p.to(device, non_blocking=True) for p in self.vision_pos_enc],
+        }
+
+    def put(self, key, backbone_out):
+        super().put(key, backbone_out)
+        if key not in self.persist_keys:
+            return
+        self.disk.put(key, [f.detach().cpu() for f in backbone_out["backbone_fpn"]])
+        if not os.path.exists(self.pos_enc_path):
+            tmp_path = f"{self.pos_enc_path}.{os.getpid()}.tmp"
+            torch.save([p.detach().cpu() for p in backbone_out["vision_pos_enc"]], tmp_path)
+            os.replace(tmp_path, self.pos_enc_path)
+
+
+class DetectionCache:
+    """
+    Grounding DINO の検出結果キャッシュ（メモリ + ディスク）。
+
+    検出結果（`post_process_grounded_object_detection` の戻り値）はテンソルを CPU に移して保持し、
+    取り出すときに指定デバイスへ戻す。ディスクには `persist_keys` のフレームのみ保存する。
+    """
+
+    def __init__(self, cache_dir, max_disk_bytes, max_entries=2048):
+        self.disk = DiskLRUCache(cache_dir, max_disk_bytes)
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+        self.persist_keys = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _to_device(results, device):
+        return [
+            {k: v.to(device) if torch.is_tensor(v) else v for k, v in result.items()}
+            for result in results
+        ]
+
+    def get(self, key, device):
+        results = self.results.get(key)
+        if results is None:
+            results = self.disk.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._store(key, results)
+        self.hits += 1
+        self.results.move_to_end(key)
+        return self._to_device(results, device)
+
+    def put(self, key, results):
+        results = self._to_device(results, "cpu")
+        self._store(key, results)
+        if key in self.persist_keys:
+            self.disk.put(key, results)
+
+    def _store(self, key, results):
+        self.results[key] = results
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
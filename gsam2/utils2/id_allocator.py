@@ -0,0 +1,152 @@
+"""
+id_allocator.py
+
+カメラごとのオブジェクトIDを、複数プロセスから重複なく払い出すためのユーティリティ。
+
+- 従来は `<camera_id>/last_object_count.txt` を処理開始時に読み込み、処理終了時に書き戻していたため、
+  同じカメラのバッチを同時に推論するとIDが重複していた（そのため gsam.txt で直列化していた）。
+- 本モジュールでは SQLite のトランザクション（BEGIN IMMEDIATE）でIDの範囲（ブロック）を
+  アトミックに予約するため、複数のバッチを同時に推論してもIDが重複しない。
+- 1回に予約するのは必要な数のIDだけで、直後に他のプロセスが予約していなければ同じブロックを延長する。
+  処理終了時（release）には未使用の末尾を返却するため、直列に実行した場合は従来と同じく連番になる
+  （同時に実行した場合のみ、他のプロセスの予約をまたいだブロックの未使用分が欠番になる）。
+- マスクは uint16 で保存するため、IDが MAX_OBJECT_ID を超える予約はエラーにする。
+- 互換性のため、割り当て済みの最大IDは `last_object_count.txt` にも書き出す。
+"""
+
+import os
+import sqlite3
+
+DB_FILE_NAME = "object_ids.sqlite3"
+COUNT_FILE_NAME = "last_object_count.txt"
+# マスク（uint16）に保存できるIDの最大値
+MAX_OBJECT_ID = 65535
+
+
+class ObjectIDAllocator:
+    def __init__(self, camera_dir):
+        """
+        :param camera_dir: カメラごとのフォルダ（例: "1"）
+        """
+        self.camera_dir = str(camera_dir)
+        self.db_path = os.path.join(self.camera_dir, DB_FILE_NAME)
+        # 予約済みのブロック [next_id, end_id)
+        self.next_id = 0
+        self.end_id = 0
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        """テーブルを作成し、初回のみ last_object_count.txt の値から開始する。"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sequence (name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)"
+            )
+            row = conn.execute("SELECT next_id FROM sequence WHERE name = 'object_id'").fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO sequence (name, next_id) VALUES ('object_id', ?)",
+                    (self._read_count_file() + 1,),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _read_count_file(self):
+        count_path = os.path.join(self.camera_dir, COUNT_FILE_NAME)
+        try:
+            with open(count_path, "r") as file:
+                return int(file.readline().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _update_sequence(self, update):
+        """
+        トランザクション内で現在の next_id を `update(next_id)` に渡し、戻り値が None でなければ next_id をその値に更新する。
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            current = conn.execute("SELECT next_id FROM sequence WHERE name = 'object_id'").fetchone()[0]
+            next_id = update(current)
+            if next_id is not None:
+                if next_id - 1 > MAX_OBJECT_ID:
+                    conn.execute("ROLLBACK")
+                    raise RuntimeError(
+                        f"オブジェクトIDがマスクの上限（{MAX_OBJECT_ID}）を超えます。"
+                        f"{self.db_path} と {COUNT_FILE_NAME} をリセットしてください。"
+                    )
+                conn.execute("UPDATE sequence SET next_id = ? WHERE name = 'object_id'", (next_id,))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def reserve(self, count):
+        """
+        `count` 個の連続したIDをアトミックに予約し、予約した範囲 [start, end) を返す。
+        """
+        def update(current):
+            self.next_id = current
+            self.end_id = current + count
+            return self.end_id
+
+        self._update_sequence(update)
+        return self.next_id, self.end_id
+
+    def ensure_available(self, objects_count, count):
+        """
+        現在のIDカウンタ `objects_count`（最後に割り当てたID）から、さらに `count` 個の
+        IDを割り当てられるようにする。ブロックが足りない場合は、直後に他のプロセスが予約していなければ
+        ブロックを延長し、予約されていれば新しいブロックを予約してその先頭から割り当てられるカウンタ値を返す。
+
+        `MaskDictionaryModel.update_masks(objects_count=...)` は渡したカウンタに1ずつ加算して
+        新しいIDを割り当てるため、その呼び出し前に使用する。
+        """
+        if self.next_id <= objects_count + 1 and objects_count + count < self.end_id:
+            return objects_count
+        in_block = self.next_id <= objects_count + 1 <= self.end_id
+        extended = False
+
+        def update(current):
+            nonlocal extended
+            if in_block and current == self.end_id:
+                self.end_id = objects_count + count + 1
+                extended = True
+            else:
+                self.next_id = current
+                self.end_id = current + count
+            return self.end_id
+
+        self._update_sequence(update)
+        return objects_count if extended else self.next_id - 1
+
+    def release(self, objects_count):
+        """
+        処理終了時に、予約したブロックの未使用の末尾を返却する（直後に他のプロセスが予約していない場合のみ）。
+        """
+        if not self.next_id <= objects_count + 1 <= self.end_id:
+            return
+
+        def update(current):
+            if current != self.end_id:
+                return None
+            self.end_id = objects_count + 1
+            return self.end_id
+
+        self._update_sequence(update)
+
+    def save_count(self, objects_count):
+        """互換性のため、割り当て済みの最大IDを last_object_count.txt に書き出す（値は減らさない）。"""
+        count_path = os.path.join(self.camera_dir, COUNT_FILE_NAME)
+        if objects_count <= self._read_count_file():
+            return
+        tmp_path = f"{count_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(str(objects_count))
+        os.replace(tmp_path, count_path)
@@ -0,0 +1,25 @@
+"""
+label_io.py
+
+module/utils3/label_io.py を gsam2 側のスクリプトから `utils2.label_io` として使用するためのモジュール。
+
+ラベルファイルの読み書きの実装は module/utils3/label_io.py の1つだけとし、本モジュールはそのファイルを読み込んで
+`utils2.label_io` として登録する（読み書きの集計 io_stats も同じものを共有する）。
+
+使用方法:
+    from utils2.label_io import read_labels, write_labels
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import sys
+import importlib.util
+
+_LABEL_IO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "module", "utils3", "label_io.py")
+
+_spec = importlib.util.spec_from_file_location(__name__, os.path.normpath(_LABEL_IO_PATH))
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
@@ -0,0 +1,171 @@
+"""
+roi_utils.py
+
+カメラごとの作業エリア（ROI: Region of Interest）でフレームを切り出し、
+Grounding DINO / SAM2 の推論結果をフル解像度の座標系へ戻すためのユーティリティ。
+
+- ROI は [x1, y1, x2, y2]（フルフレームのピクセル座標）で指定する。
+- scale < 1.0 を指定すると、切り出した画像をさらに縮小して推論する。
+- 推論結果（バウンディングボックス・マスク）は `box_to_full` / `mask_to_full` で
+  フルフレームの座標に戻すため、出力される JSON / npy の形式は従来と変わらない。
+"""
+
+import math
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+# Grounding DINO の画像プロセッサのデフォルトリサイズ設定
+GDINO_SHORTEST_EDGE = 800
+GDINO_LONGEST_EDGE = 1333
+
+
+class FrameROI:
+    def __init__(self, roi, full_width, full_height, scale=1.0):
+        """
+        :param roi: [x1, y1, x2, y2] の切り出し範囲。None の場合はフルフレーム
+        :param full_width: 元フレームの幅
+        :param full_height: 元フレームの高さ
+        :param scale: 切り出し後の縮小率（0 < scale <= 1.0）
+        """
+        self.full_width = int(full_width)
+        self.full_height = int(full_height)
+        if roi is None:
+            roi = [0, 0, self.full_width, self.full_height]
+        x1, y1, x2, y2 = [int(v) for v in roi]
+        # フレームの範囲内にクリップ
+        self.x1 = max(0, min(x1, self.full_width - 1))
+        self.y1 = max(0, min(y1, self.full_height - 1))
+        self.x2 = max(self.x1 + 1, min(x2, self.full_width))
+        self.y2 = max(self.y1 + 1, min(y2, self.full_height))
+        if not 0 < scale <= 1.0:
+            raise ValueError(f"roi_scale は 0 < scale <= 1.0 で指定してください: {scale}")
+        self.scale = float(scale)
+
+    @classmethod
+    def from_frame(cls, roi, frame_path, scale=1.0):
+        """先頭フレームの画像サイズを読み取って ROI を生成する。"""
+        with Image.open(frame_path) as image:
+            full_width, full_height = image.size
+        return cls(roi, full_width, full_height, scale)
+
+    @property
+    def crop_width(self):
+        return self.x2 - self.x1
+
+    @property
+    def crop_height(self):
+        return self.y2 - self.y1
+
+    @property
+    def crop_box(self):
+        """PIL の crop に渡す (left, upper, right, lower)。"""
+        return (self.x1, self.y1, self.x2, self.y2)
+
+    @property
+    def is_full_frame(self):
+        return (
+            self.x1 == 0 and self.y1 == 0
+            and self.x2 == self.full_width and self.y2 == self.full_height
+            and self.scale == 1.0
+        )
+
+    @property
+    def area_ratio(self):
+        """フルフレームに対する推論画素数の比率。"""
+        return (self.crop_width * self.crop_height * self.scale ** 2) / (self.full_width * self.full_height)
+
+    @property
+    def output_size(self):
+        """推論に使う画像サイズ (width, height)。"""
+        return (
+            max(1, round(self.crop_width * self.scale)),
+            max(1, round(self.crop_height * self.scale)),
+        )
+
+    def crop_image(self, image):
+        """PIL 画像を ROI で切り出し、必要に応じて縮小する。"""
+        if self.is_full_frame:
+            return image
+        image = image.crop(self.crop_box)
+        if self.scale != 1.0:
+            image = image.resize(self.output_size, Image.BILINEAR)
+        return image
+
+    def detector_size(self):
+        """
+        Grounding DINO のプロセッサに渡す `size` を返す。
+
+        デフォルト設定のままだと小さい切り出し画像は 800px まで拡大されてしまうため、
+        フルフレーム時と同じ画素密度になるようにリサイズ先を ROI の大きさに合わせて縮める。
+        フルフレームの場合は None（プロセッサのデフォルトを使う）。
+        """
+        if self.is_full_frame:
+            return None
+        density = min(
+            GDINO_SHORTEST_EDGE / min(self.full_width, self.full_height),
+            GDINO_LONGEST_EDGE / max(self.full_width, self.full_height),
+        )
+        density = min(density, self.scale)
+        short_edge = min(self.crop_width, self.crop_height) * density
+        long_edge = max(self.crop_width, self.crop_height) * density
+        return {
+            "shortest_edge": max(1, math.floor(short_edge)),
+            "longest_edge": max(1, math.ceil(long_edge)),
+        }
+
+    def box_to_full(self, x1, y1, x2, y2):
+        """ROI 座標系のバウンディングボックスをフルフレームの座標に戻す。"""
+        s = self.scale
+        return (
+            int(round(x1 / s)) + self.x1,
+            int(round(y1 / s)) + self.y1,
+            min(int(round(x2 / s)) + self.x1, self.full_width - 1),
+            min(int(round(y2 / s)) + self.y1, self.full_height - 1),
+        )
+
+    def mask_to_full(self, mask):
+        """
+        ROI 座標系の (H, W) マスクをフルフレームの (full_height, full_width) に貼り戻す。
+        縮小している場合は最近傍補間で元の切り出しサイズに拡大してから貼り付ける。
+        """
+        if self.is_full_frame:
+            return mask
+        if self.scale != 1.0:
+            mask = F.interpolate(
+                mask[None, None].float(),
+                size=(self.crop_height, self.crop_width),
+                mode="nearest",
+            )[0, 0].to(mask.dtype)
+        full_mask = torch.zeros(
+            (self.full_height, self.full_width), dtype=mask.dtype, device=mask.device
+        )
+        full_mask[self.y1:self.y2, self.x1:self.x2] = mask
+        return full_mask
+
+    def frame_dict_to_full(self, frame_dict):
+        """
+        MaskDictionaryModel.to_dict() の結果をフルフレームの座標系に書き換える。
+        バウンディングボックスが全て 0（マスクなし）のラベルはそのまま残す。
+        """
+        if self.is_full_frame:
+            return frame_dict
+        frame_dict["mask_height"] = self.full_height
+        frame_dict["mask_width"] = self.full_width
+        for label in frame_dict["labels"].values():
+            if label["x1"] == 0 and label["y1"] == 0 and label["x2"] == 0 and label["y2"] == 0:
+                continue
+            label["x1"], label["y1"], label["x2"], label["y2"] = self.box_to_full(
+                label["x1"], label["y1"], label["x2"], label["y2"]
+            )
+        return frame_dict
+
+
+def parse_roi(value):
+    """CLI 引数 "x1,y1,x2,y2" を [x1, y1, x2, y2] に変換する。未指定の場合は None。"""
+    if value is None or value == "":
+        return None
+    roi = [int(v) for v in str(value).split(",")]
+    if len(roi) != 4:
+        raise ValueError(f"ROI は x1,y1,x2,y2 の形式で指定してください: {value}")
+    return roi
@@ -13,7 +13,7 @@ inference_multi.py
 
 3. gsam2_c-idv2.pyの実行：
     - 指定された画像に対して、SAM2を用いたセグメンテーションを実行。
-    - 処理は一度に一セットの画像フォルダに対して行う。
+    - split.pyで作成した全セグメントを1回のモデルロードでまとめて処理する。
 
 4. correct_id.pyの実行：
     - セグメンテーション結果に基づき、ID情報の補正を行う。
@@ -63,6 +63,7 @@ import time
 import subprocess
 from datetime import datetime
 import tempfile
+from module.utils3.Camera_conf_utils import ROI_LIST, ROI_SCALE, area_roi
 
 def timed_run(label, func):
     print(f"==== {label} ====")
@@ -117,6 +118,9 @@ if __name__ == "__main__":
     FILE_PATH = "id.txt"
     FILE_PATH2 = "confirm.txt"
     FILE_PATH3 = f"{PREFIX}/gsam.txt"
+    #gsam2_c-idv2.pyを同時に実行するバッチ数の上限（デフォルトは従来通り1バッチずつ）
+    GSAM2_CONCURRENCY = max(int(os.environ.get("GSAM2_CONCURRENCY", "1")), 1)
+    WAIT_INTERVAL = 1
 
     shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
     shutil.rmtree(OUTPUT_DIR_GSAM2, ignore_errors=True)
@@ -134,14 +138,26 @@ if __name__ == "__main__":
             former_images_dir=f"./{PREFIX}/data/former_images",
             video=TARGET_IMGS_FOLDER)
 
+    #作業エリア（ROI）が設定されているカメラは切り出して推論する
+    ROI = ROI_LIST.get(PREFIX)
+    if ROI == "area":
+        #カメラコードはカメラ設定のキャッシュから取得する（ROIを使う場合のみDBの設定を読み込む）
+        from module.utils3.DB_serch_camera_conf_utils import config
+        from module.utils3.camera_config_cache import CameraConfigService
+        ROI = area_roi(CameraConfigService(config).get_camera(PREFIX)['code'])
+    ROI_ARG = ",".join(str(v) for v in ROI) if ROI else None
+
     def gsam2_run():
-        for dir_name in os.listdir(OUTPUT_DIR):
-            run_py("gsam2/gsam2_c-idv2.py",
-                input_folder=os.path.join(OUTPUT_DIR, dir_name),
-                output_dir=os.path.join(OUTPUT_DIR_GSAM2, dir_name),
-                device_id=0,
-                camera_id=PREFIX)
-            break
+        #全セグメントを1プロセスでまとめて推論する（重複フレームの特徴量は共有）
+        run_py("gsam2/gsam2_c-idv2.py",
+            input_folder=OUTPUT_DIR,
+            output_dir=OUTPUT_DIR_GSAM2,
+            all_segments=True,
+            persist_frames=FRAME_DURATION_COUNT,
+            device_id=0,
+            camera_id=PREFIX,
+            roi=ROI_ARG,
+            roi_scale=ROI_SCALE.get(PREFIX) if ROI else None)
 
     def corrected_id():
         for dir_name in os.listdir(OUTPUT_DIR_GSAM2):
@@ -153,7 +169,6 @@ if __name__ == "__main__":
                 corrected_mask_dir=os.path.join(base_path, "corrected_masks"),
                 corrected_json_dir=os.path.join(base_path, "corrected_jsons"),
                 device="cuda")
-            break
 
     def merge_segment():
         run_py("module/merge_segment.py",
@@ -220,15 +235,28 @@ if __name__ == "__main__":
 
     timed_run(f"{EXE_COUNT}回目 split.py", split_images)
 
-    if EXE_COUNT != 0:
+    #前のバッチのgsam2_c-idv2.pyの終了待ち
+    #オブジェクトIDはobject_ids.sqlite3からブロック単位で予約するため、環境変数GSAM2_CONCURRENCYで
+    #指定した数までのバッチを同時に推論できる（デフォルトの1の場合は従来通り直列）
+    #gsam.txtには終了したバッチのEXE_COUNTを1行ずつ追記し、終了していない前のバッチの数で待つ
+    def finished_gsam2():
+        if not os.path.exists(FILE_PATH3):
+            return set()
+        with open(FILE_PATH3) as f:
+            return {int(line) for line in f if line.strip().isdigit()}
+
+    def wait_gsam2():
         while True:
-            with open(FILE_PATH3) as f:
-                gsam = f.readline().strip()
-            if gsam != str(EXE_COUNT):
-                time.sleep(5)
+            finished = finished_gsam2()
+            running = sum(1 for count in range(EXE_COUNT) if count not in finished)
+            if running >= GSAM2_CONCURRENCY:
+                time.sleep(WAIT_INTERVAL)
             else:
                 break
 
+    if EXE_COUNT != 0:
+        timed_run(f"{EXE_COUNT}回目 gsam.txt wait", wait_gsam2)
+
     # for dir_name in os.listdir(OUTPUT_DIR):
     #     run_py("gsam2/gsam2_c-idv2.py",
     #         input_folder=os.path.join(OUTPUT_DIR, dir_name),
@@ -239,8 +267,9 @@ if __name__ == "__main__":
 
     timed_run(f"{EXE_COUNT}回目 gsam2_c-idv2.py", gsam2_run)
 
-    with open(FILE_PATH3, "w") as f:
-        f.write(str(EXE_COUNT + 1))
+    #同時実行時はバッチの終了順が前後するため、上書きせずに終了したバッチを追記する
+    with open(FILE_PATH3, "a") as f:
+        f.write(f"{EXE_COUNT}\n")
 
     # for dir_name in os.listdir(OUTPUT_DIR_GSAM2):
     #     base_path = os.path.join(OUTPUT_DIR_GSAM2, dir_name)
@@ -0,0 +1,120 @@
+"""
+bench_correct_id.py
+
+correct_id.py のマスクID置換処理のマイクロベンチマーク。
+
+従来の「IDごとのブール代入（mask[mask == obj_id] = -new_id の後に負の値を正に戻す）」と、
+ルックアップテーブルによる置換（relabel_mask: lut[mask]）の処理時間を比較します。
+IDが変わらないフレームの割合を指定し、置換をスキップした場合の効果も確認できます。
+
+使用方法:
+```bash
+python module/bench_correct_id.py --frames 150 --objects 20 --device cuda
+```
+
+引数:
+    --frames : フレーム数（デフォルト: 150）
+    --objects : 1フレームあたりのオブジェクト数（デフォルト: 20）
+    --width / --height : フレームサイズ（デフォルト: 1920 x 1080）
+    --mapped_ratio : 置換対象のIDを含むフレームの割合（デフォルト: 0.3）
+    --repeat : 計測の繰り返し回数（デフォルト: 3）
+    --device : 使用するPyTorchのデバイス（例: cuda または cpu）
+
+注意:
+- マスクは乱数で配置した矩形のオブジェクトで作成します（ファイルの読み書きは含みません）。
+- 置換結果が従来の処理と一致することも確認します。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import time
+import argparse
+
+import torch
+
+from correct_id import relabel_mask
+
+
+def make_masks(frames, objects, width, height, mapped_ratio, device, seed=0):
+    """
+    乱数で配置した矩形のオブジェクトを持つマスクと、IDのマッピングを作成します。
+    """
+    generator = torch.Generator().manual_seed(seed)
+    masks = []
+    mapped_frames = int(frames * mapped_ratio)
+    for frame_idx in range(frames):
+        mask = torch.zeros((height, width), dtype=torch.int32)
+        # 置換対象のフレームはID 1～objects、それ以外は objects+1 以降のIDを使用する
+        base_id = 0 if frame_idx < mapped_frames else objects
+        for k in range(objects):
+            w = int(torch.randint(width // 20, width // 5, (1,), generator=generator))
+            h = int(torch.randint(height // 10, height // 3, (1,), generator=generator))
+            x = int(torch.randint(0, width - w, (1,), generator=generator))
+            y = int(torch.randint(0, height - h, (1,), generator=generator))
+            mask[y:y + h, x:x + w] = base_id + k + 1
+        masks.append(mask.to(device))
+    # CCIDは既存のIDと重なるように割り当てる（IDの入れ替えが発生するケース）
+    id_mapping = {obj_id: objects - obj_id + 1 for obj_id in range(1, objects + 1)}
+    return masks, id_mapping
+
+
+def relabel_per_id(mask, id_mapping):
+    """
+    従来の correct_id.py と同じ、IDごとのブール代入による置換。
+    """
+    mask = mask.clone()
+    unique_ids = torch.unique(mask)
+    unique_ids = unique_ids[unique_ids != 0]
+    for obj_id in unique_ids.tolist():
+        if obj_id in id_mapping:
+            mask[mask == obj_id] = -id_mapping[obj_id]
+    mask[mask < 0] = -mask[mask < 0]
+    return mask
+
+
+def measure(label, func, masks, id_mapping, repeat, device):
+    """
+    全フレームの置換にかかる時間を計測し、最短時間を表示します。
+    """
+    best = None
+    for _ in range(repeat):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        for mask in masks:
+            func(mask, id_mapping)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label}: {best * 1000:.1f} ms ({best * 1000 / len(masks):.2f} ms/frame)")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='correct_id.py マスクID置換のベンチマーク')
+    parser.add_argument('--frames', type=int, default=150, help='フレーム数')
+    parser.add_argument('--objects', type=int, default=20, help='1フレームあたりのオブジェクト数')
+    parser.add_argument('--width', type=int, default=1920, help='フレームの幅')
+    parser.add_argument('--height', type=int, default=1080, help='フレームの高さ')
+    parser.add_argument('--mapped_ratio', type=float, default=0.3, help='置換対象のIDを含むフレームの割合')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+    parser.add_argument('--device', type=str, default='cuda', help="処理に使用するデバイス（'cuda'または'cpu'）")
+    args = parser.parse_args()
+
+    device = torch.device(args.device if torch.cuda.is_available() else 'cpu')
+    masks, id_mapping = make_masks(args.frames, args.objects, args.width, args.height, args.mapped_ratio, device)
+
+    # 置換結果が従来の処理と一致することを確認
+    for mask in masks:
+        expected = relabel_per_id(mask, id_mapping)
+        actual, _ = relabel_mask(mask, id_mapping)
+        assert torch.equal(expected, actual), "置換結果が従来の処理と一致しません"
+    changed = sum(relabel_mask(mask, id_mapping)[1] for mask in masks)
+    print(f"frames={args.frames} objects={args.objects} size={args.width}x{args.height} "
+          f"device={device} changed_frames={changed}")
+
+    per_id = measure("per-id boolean assignment", relabel_per_id, masks, id_mapping, args.repeat, device)
+    lut = measure("lookup table (lut[mask])", relabel_mask, masks, id_mapping, args.repeat, device)
+    print(f"speedup: {per_id / lut:.1f}x")
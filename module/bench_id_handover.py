@@ -0,0 +1,226 @@
+"""
+bench_id_handover.py
+
+id_handover.py のカメラ間のIDペア判定（id_handover）のマイクロベンチマーク。
+
+従来の「時刻ごとに全レコードの組を二重ループで math.sqrt により距離計算し、距離順に貪欲にペアを決める」処理と、
+距離行列とハンガリアン法による割当（match_records）の処理時間、およびペアの数・距離の合計を比較します。
+
+使用方法:
+```bash
+python module/bench_id_handover.py --people 50 --cameras 4 --frames 150
+```
+
+引数:
+    --people : 人数（デフォルト: 50）
+    --cameras : カメラ台数（デフォルト: 4）。隣り合うカメラの撮影範囲が重なるように横に並べる
+    --frames : 時刻（フレーム）の数（デフォルト: 150）
+    --noise : カメラごとの座標のばらつき（標準偏差、デフォルト: 20）
+    --repeat : 計測の繰り返し回数（デフォルト: 3）
+
+注意:
+- ログは乱数で移動する人物から作成します（DBへのアクセスは含みません）。
+- id_handover と同じく、隣り合うカメラの組（camera_pairs と同じ形式）ごとにペアを判定します。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import math
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+from id_handover import id_handover, pair_label, match_records, HANDOVER_DISTANCE
+
+CAMERA_WIDTH = 1080
+CAMERA_HEIGHT = 1920
+# 隣り合うカメラの撮影範囲の重なり
+OVERLAP = 300
+
+
+def make_results(people, cameras, frames, noise, seed=0):
+    """
+    乱数で移動する人物を各カメラで撮影したログ（get_data の結果と同じ形式）を、カメラの組ごとに作成します。
+
+    :return: {(camera_id1, camera_id2): ログレコードのリスト}
+    """
+    rng = random.Random(seed)
+    step = CAMERA_WIDTH - OVERLAP
+    world_width = step * (cameras - 1) + CAMERA_WIDTH
+    positions = [[rng.uniform(0, world_width), rng.uniform(0, CAMERA_HEIGHT)] for _ in range(people)]
+    # 1割の人物はCCIDあり
+    chameleon_codes = [str(person) if rng.random() < 0.1 else None for person in range(people)]
+    base_time = datetime(2025, 5, 28, 13, 49, 0)
+
+    records_by_camera = defaultdict(list)
+    log_id = 0
+    for frame in range(frames):
+        log_datetime = base_time + timedelta(milliseconds=200 * frame)
+        for person, position in enumerate(positions):
+            position[0] = min(max(position[0] + rng.gauss(0, 15), 0), world_width)
+            position[1] = min(max(position[1] + rng.gauss(0, 15), 0), CAMERA_HEIGHT)
+            for camera_index in range(cameras):
+                x_start = step * camera_index
+                if not x_start <= position[0] <= x_start + CAMERA_WIDTH or rng.random() < 0.05:
+                    continue
+                log_id += 1
+                camera_id = camera_index + 1
+                records_by_camera[camera_id].append({
+                    'id': log_id,
+                    'camera_id': camera_id,
+                    'chameleon_code': chameleon_codes[person],
+                    'transform_center_x': int(position[0] + rng.gauss(0, noise)),
+                    'transform_center_y': int(position[1] + rng.gauss(0, noise)),
+                    'log_datetime': log_datetime,
+                    'TID': person + 1,
+                    'update_camera_id': None,
+                })
+
+    results = {}
+    for camera_id in range(1, cameras):
+        x_start = step * camera_id
+        x_end = step * (camera_id - 1) + CAMERA_WIDTH
+        # get_data と同じく、2台の撮影範囲の重なり部分のログを取得する
+        results[(camera_id + 1, camera_id)] = sorted(
+            (record for cam in (camera_id, camera_id + 1) for record in records_by_camera[cam]
+             if x_start <= record['transform_center_x'] <= x_end),
+            key=lambda record: (record['log_datetime'], record['id']))
+    return results
+
+
+def id_handover_greedy(results):
+    """
+    従来の id_handover と同じ、二重ループの距離計算と距離順の貪欲法によるペアの判定。
+    """
+    grouped_data = defaultdict(list)
+    for row in results:
+        grouped_data[row['log_datetime']].append(row)
+
+    pairs = []
+    not_pairs = []
+    pairs_list = []
+    for log_datetime, records in grouped_data.items():
+        odd_list = []
+        for i, record1 in enumerate(records):
+            for j, record2 in enumerate(records):
+                if i != j and record1['camera_id'] != record2['camera_id']:
+                    distance = math.sqrt(
+                        (record1['transform_center_x'] - record2['transform_center_x'])**2 +
+                        (record1['transform_center_y'] - record2['transform_center_y'])**2
+                    )
+                    if distance <= HANDOVER_DISTANCE:
+                        odd_list.append((pair_label(record1, record2), distance, i, j))
+        if odd_list:
+            odd_list_sorted = sorted(odd_list, key=lambda x: x[1])
+            counter = 0
+            used_list = []
+            for odd in odd_list_sorted:
+                if counter == len(records) // 2:
+                    if odd[0] not in not_pairs:
+                        not_pairs.append(odd[0])
+                if counter == 0:
+                    if (odd[0], odd[1]) not in pairs_list and odd[0] not in not_pairs:
+                        pairs_list.append((odd[0], odd[1]))
+                        used_list.append(odd[2])
+                        used_list.append(odd[3])
+                        counter += 1
+                    elif odd[0] not in not_pairs:
+                        not_pairs.append(odd[0])
+                else:
+                    if odd[2] not in used_list and odd[3] not in used_list:
+                        pairs_list.append((odd[0], odd[1]))
+                        used_list.append(odd[2])
+                        used_list.append(odd[3])
+                        counter += 1
+                    else:
+                        if odd[0] not in not_pairs:
+                            not_pairs.append(odd[0])
+                for i, (left, right) in enumerate(pairs_list):
+                    if left == odd[0]:
+                        if right > odd[1]:
+                            pairs_list[i] = (left, odd[1])
+                        break
+
+    for pair, distance in sorted(pairs_list, key=lambda x: x[1]):
+        if pair not in pairs:
+            pairs.append(pair)
+    return pairs, not_pairs
+
+
+def greedy_matches(records):
+    """
+    1時刻分のレコードを距離順の貪欲法で1対1に対応付けます（割当結果の比較用）。
+    """
+    candidates = []
+    for i, record1 in enumerate(records):
+        for j in range(i + 1, len(records)):
+            record2 = records[j]
+            if record1['camera_id'] != record2['camera_id']:
+                distance = math.hypot(record1['transform_center_x'] - record2['transform_center_x'],
+                                      record1['transform_center_y'] - record2['transform_center_y'])
+                if distance <= HANDOVER_DISTANCE:
+                    candidates.append((distance, i, j))
+    used = set()
+    matches = []
+    for distance, i, j in sorted(candidates):
+        if i not in used and j not in used:
+            used.update((i, j))
+            matches.append((i, j, distance))
+    return matches
+
+
+def measure(label, func, results, repeat):
+    """
+    全カメラの組のペア判定にかかる時間を計測し、最短時間を表示します。
+    """
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for records in results.values():
+            func(records)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label}: {best * 1000:.1f} ms")
+    return best
+
+
+def compare_matches(results):
+    """
+    時刻ごとの対応付けの数と距離の合計を、貪欲法と割当で比較して表示します。
+    """
+    totals = {'greedy': [0, 0.0], 'assignment': [0, 0.0]}
+    for records in results.values():
+        grouped_data = defaultdict(list)
+        for row in records:
+            grouped_data[row['log_datetime']].append(row)
+        for frame_records in grouped_data.values():
+            matches = greedy_matches(frame_records)
+            totals['greedy'][0] += len(matches)
+            totals['greedy'][1] += sum(distance for _, _, distance in matches)
+        matches, _ = match_records(records)
+        totals['assignment'][0] += len(matches)
+        totals['assignment'][1] += sum(distance for _, _, _, distance in matches)
+    for label, (count, distance) in totals.items():
+        print(f"{label}: {count} matches, total distance {distance:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='id_handover.py IDペア判定のベンチマーク')
+    parser.add_argument('--people', type=int, default=50, help='人数')
+    parser.add_argument('--cameras', type=int, default=4, help='カメラ台数')
+    parser.add_argument('--frames', type=int, default=150, help='時刻（フレーム）の数')
+    parser.add_argument('--noise', type=float, default=20, help='カメラごとの座標のばらつき（標準偏差）')
+    parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    results = make_results(args.people, args.cameras, args.frames, args.noise)
+    print(f"people={args.people} cameras={args.cameras} frames={args.frames} "
+          f"camera_pairs={list(results)} records={sum(len(records) for records in results.values())}")
+
+    compare_matches(results)
+    greedy = measure("double loop + greedy", id_handover_greedy, results, args.repeat)
+    assignment = measure("distance matrix + assignment", id_handover, results, args.repeat)
+    print(f"speedup: {greedy / assignment:.1f}x")
@@ -0,0 +1,81 @@
+"""
+bench_label_io.py
+
+ラベルファイルのシリアライザのベンチマーク。
+
+既存のラベルファイル（merged_jsons など）を読み込み、以下の形式ごとにエンコード・デコードの時間とサイズを比較します。
+- json (indent=4): 従来の json.dump(..., ensure_ascii=False, indent=4)
+- json (compact): utils3.label_io の "json" 形式（orjson がインストールされていれば orjson）
+- msgpack (columnar): utils3.label_io の "msgpack" 形式（msgpack がインストールされている場合のみ）
+
+使用方法:
+```bash
+python module/bench_label_io.py --input_dir ./1/data/merged_jsons --repeat 5
+```
+
+引数:
+    --input_dir : ベンチマークに使用するラベルファイルのフォルダ
+    --repeat : 計測の繰り返し回数（デフォルト: 5）
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import json
+import time
+import argparse
+
+from utils3.label_io import read_labels, dumps_labels, loads_labels, msgpack, orjson
+
+
+def indent_dumps(data):
+    return json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+
+
+def indent_loads(raw):
+    return json.loads(raw)
+
+
+def measure(label, dumps, loads, documents, repeat):
+    """
+    全ファイルのエンコード・デコードにかかる時間（最短）と合計サイズを表示します。
+    """
+    encoded = [dumps(data) for data in documents]
+    for data, raw in zip(documents, encoded):
+        assert loads(raw) == data, f"{label}: デコード結果が元のデータと一致しません"
+
+    encode_time = decode_time = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for data in documents:
+            dumps(data)
+        elapsed = time.perf_counter() - start_time
+        encode_time = elapsed if encode_time is None else min(encode_time, elapsed)
+
+        start_time = time.perf_counter()
+        for raw in encoded:
+            loads(raw)
+        elapsed = time.perf_counter() - start_time
+        decode_time = elapsed if decode_time is None else min(decode_time, elapsed)
+
+    total_bytes = sum(len(raw) for raw in encoded)
+    print(f"{label:<20} encode {encode_time * 1000:8.1f} ms  decode {decode_time * 1000:8.1f} ms  "
+          f"size {total_bytes:>12} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ラベルファイルのシリアライザのベンチマーク')
+    parser.add_argument('--input_dir', type=str, required=True, help='ベンチマークに使用するラベルファイルのフォルダ')
+    parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.input_dir) if f.endswith('.json'))
+    documents = [read_labels(os.path.join(args.input_dir, f)) for f in files]
+    num_labels = sum(len(data.get('labels', {})) for data in documents)
+    print(f"{len(documents)} files, {num_labels} labels (orjson: {orjson is not None}, msgpack: {msgpack is not None})")
+
+    measure("json (indent=4)", indent_dumps, indent_loads, documents, args.repeat)
+    measure("json (compact)", lambda data: dumps_labels(data, "json"), loads_labels, documents, args.repeat)
+    if msgpack is not None:
+        measure("msgpack (columnar)", lambda data: dumps_labels(data, "msgpack"), loads_labels, documents, args.repeat)
@@ -0,0 +1,76 @@
+"""
+convert_labels.py
+
+既存のラベルファイル（merged_jsons など）を、utils3.label_io の指定した形式に変換するスクリプト。
+
+主な機能:
+- 指定フォルダ内の *.json を読み込み（JSON / MessagePack を自動判定）、指定した形式で書き直す
+- 出力先を指定しない場合は元のファイルを置き換える（一時ファイルに書き込んでから置き換えるため、途中で止まっても壊れない）
+- 変換前後の合計バイト数を表示する
+
+使用方法:
+```bash
+python module/convert_labels.py --input_dir ./1/data/merged_jsons --format msgpack
+python module/convert_labels.py --input_dir ./1/data/merged_jsons --format json --output_dir ./merged_jsons_json
+```
+
+引数:
+    --input_dir : 変換するラベルファイルのフォルダ
+    --format : 変換後の形式（json または msgpack）
+    --output_dir : 出力先のフォルダ（省略時は元のファイルを置き換える）
+    --recursive : サブフォルダも対象にする
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import argparse
+
+from utils3.label_io import FORMATS, read_labels, dumps_labels
+
+
+def convert_folder(input_dir, fmt, output_dir=None, recursive=False):
+    """
+    フォルダ内のラベルファイルを指定した形式に変換します。
+
+    :param input_dir: 変換するラベルファイルのフォルダ
+    :param fmt: 変換後の形式（"json" または "msgpack"）
+    :param output_dir: 出力先のフォルダ（Noneの場合は元のファイルを置き換える）
+    :param recursive: サブフォルダも対象にするかどうか
+    :return: (変換したファイル数, 変換前の合計バイト数, 変換後の合計バイト数)
+    """
+    num_files = 0
+    bytes_before = 0
+    bytes_after = 0
+    for root, dirs, files in os.walk(input_dir):
+        if not recursive:
+            dirs[:] = []
+        dst_root = root if output_dir is None else os.path.join(output_dir, os.path.relpath(root, input_dir))
+        os.makedirs(dst_root, exist_ok=True)
+        for filename in sorted(files):
+            if not filename.endswith('.json'):
+                continue
+            src_path = os.path.join(root, filename)
+            dst_path = os.path.join(dst_root, filename)
+            bytes_before += os.path.getsize(src_path)
+            raw = dumps_labels(read_labels(src_path), fmt)
+            tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, dst_path)
+            bytes_after += len(raw)
+            num_files += 1
+    return num_files, bytes_before, bytes_after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ラベルファイルの形式変換')
+    parser.add_argument('--input_dir', type=str, required=True, help='変換するラベルファイルのフォルダ')
+    parser.add_argument('--format', type=str, required=True, choices=FORMATS, help='変換後の形式')
+    parser.add_argument('--output_dir', type=str, default=None, help='出力先のフォルダ（省略時は元のファイルを置き換える）')
+    parser.add_argument('--recursive', action='store_true', help='サブフォルダも対象にする')
+    args = parser.parse_args()
+
+    num_files, bytes_before, bytes_after = convert_folder(args.input_dir, args.format, args.output_dir, args.recursive)
+    print(f"{num_files} files converted to {args.format}: {bytes_before} bytes -> {bytes_after} bytes")
@@ -7,8 +7,9 @@ corrected_id.py
 IDのマッピングを行い、修正済みのマスクファイルおよびJSONファイルを別ディレクトリに出力します。
 
 主な処理内容:
-- 指定フォルダからマスク (`.npy`) ファイルとラベル (`.json`) ファイルを読み込む
-- CSVに定義された矩形領域がマスクに含まれているかを確認
+- 指定フォルダのマスク (`.npy`) ファイルの一覧を作成する（CSVで参照されるフレームのみ判定用に読み込み、
+  それ以外は置換時に1フレームずつ読み込み・保存するため、メモリ使用量はフレーム数に依存しない）
+- CSVに定義された矩形領域がマスクに含まれているかを確認（マスクごとの累積和テーブルで、同じフレームの行をまとめて判定）
 - 含まれていれば、その領域内のオブジェクトIDをCSVのCCIDに置き換える
 - 対応するJSONの `instance_id` も同様に更新
 - 更新後のマスク・JSONを別ディレクトリに保存
@@ -33,8 +34,11 @@ python corrected_id.py \
 
 注意点:
 - CSVの ReadTime によってマスクファイル名を特定するため、ファイル名に対応する mask_*.npy が存在する必要があります。
+  （ReadTime は整数として読み込み、9桁に0埋めしたファイル名 mask_HHMMSSmmm.npy を参照します）
+- 同じプロセス内から呼び出す場合は、CSVファイルの代わりに csv_data（DataFrame）を渡すことができます。
 - 領域がマスク内にない場合、その行はスキップされます。
-- マスクIDの置換は一時的に負の値を使用して処理されます（競合回避のため）。
+- マスクIDの置換はルックアップテーブル（lut[mask]）で1回の参照で処理されます（IDの入れ替えも競合しません）。
+- IDが変わらないマスク・JSONは書き直さず、元ファイルへのハードリンク（できない場合はコピー）を出力します。
 - JSONに含まれる labels の instance_id も cc_id123 のように更新されます。
 
 作成者: インフォファーム
@@ -45,22 +49,74 @@ python corrected_id.py \
 import os
 import numpy as np
 import pandas as pd
-import json
 import glob
 import torch
 import argparse
+import shutil
+
+from utils3.mask_containment import MaskContainment
+from utils3.label_io import read_labels, write_labels
+
+def relabel_mask(mask, id_mapping):
+    """
+    マスクのIDを、ルックアップテーブル（lut[mask]）による1回の参照で置換します。
+
+    :param mask: マスクのtorchテンソル（値はオブジェクトID、0は背景）
+    :param id_mapping: IDのマッピング（元のID -> 新しいID）
+    :return: (置換後のマスク, IDが変わったかどうか)。置換対象のIDがない場合は元のマスクをそのまま返す
+    """
+    if not id_mapping or mask.numel() == 0:
+        return mask, False
+    max_id = int(mask.max().item())
+    mapped = [(obj_id, new_id) for obj_id, new_id in id_mapping.items() if 0 < obj_id <= max_id]
+    if not mapped:
+        return mask, False
+    # マスク内に存在するIDのみを対象にする
+    present = torch.zeros(max_id + 1, dtype=torch.bool, device=mask.device)
+    present[mask.flatten().long()] = True
+    present_ids = set(torch.nonzero(present).flatten().tolist())
+    mapped = [(obj_id, new_id) for obj_id, new_id in mapped if obj_id in present_ids]
+    if not mapped:
+        return mask, False
+
+    lut = torch.arange(max_id + 1, dtype=mask.dtype, device=mask.device)
+    obj_ids, new_ids = zip(*mapped)
+    lut[torch.tensor(obj_ids, device=mask.device)] = torch.tensor(new_ids, dtype=mask.dtype, device=mask.device)
+    return lut[mask.long()], True
+
+
+def link_or_copy(source, destination):
+    """
+    sourceをdestinationにハードリンクします。別のファイルシステムなどでリンクできない場合はコピーします。
+    """
+    remove_existing(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def remove_existing(path):
+    """
+    既存の出力ファイルを削除します。前回の実行でハードリンクした出力に上書きすると
+    元ファイルまで書き換わるため、書き込み前に必ずリンクを外します。
+    """
+    if os.path.lexists(path):
+        os.remove(path)
+
 
 class MaskIDCorrector:
-    def __init__(self, mask_data_dir, json_data_dir, csv_file_path, corrected_mask_dir, corrected_json_dir, device='cuda'):
+    def __init__(self, mask_data_dir, json_data_dir, csv_file_path, corrected_mask_dir, corrected_json_dir, device='cuda', csv_data=None):
         """
         マスク情報とCSVファイルを読み込み、修正後のデータを保存するための初期化を行います。
 
         :param mask_data_dir: マスクが保存されているディレクトリのパス
         :param json_data_dir: マスクに対応するJSONファイルが保存されているディレクトリのパス
-        :param csv_file_path: CSVファイルのパス
+        :param csv_file_path: CSVファイルのパス（csv_dataを指定する場合はNone可）
         :param corrected_mask_dir: 修正後のマスクを保存するディレクトリのパス
         :param corrected_json_dir: 修正後のJSONファイルを保存するためのディレクトリのパス
         :param device: 処理に使用するデバイス（'cuda'または'cpu'）
+        :param csv_data: CCの読み取り結果のDataFrame（result.csvと同じ列）。指定した場合はCSVファイルを読み込まない
         """
         self.mask_data_dir = mask_data_dir
         self.json_data_dir = json_data_dir
@@ -73,166 +129,196 @@ class MaskIDCorrector:
         os.makedirs(self.corrected_mask_dir, exist_ok=True)
         os.makedirs(self.corrected_json_dir, exist_ok=True)
 
-        self.masks = {}
-        self.json_data = {}
-        self.load_masks_and_json()
+        # マスクファイル名 -> パス（マスク自体は必要になった時点で1フレームずつ読み込む）
+        self.mask_files = {}
+        self.index_mask_files()
+        self.csv_data = csv_data
         self.load_csv()
 
         # IDのマッピング（元のID -> 新しいID）
         self.id_mapping = {}
 
-    def load_masks_and_json(self):
+    def index_mask_files(self):
         """
-        マスクデータと対応するJSONデータを読み込みます。
+        マスクファイルの一覧を作成します（マスクデータ自体はここでは読み込みません）。
         """
         mask_files = glob.glob(os.path.join(self.mask_data_dir, "mask_*.npy"))
-        for mask_file in mask_files:
+        for mask_file in sorted(mask_files):
             #例) ./../../105030000.npy -> 105030000.npy
             mask_name = os.path.basename(mask_file)
-            # マスクをGPU上のtorchテンソルとして読み込み
-            mask_array = np.load(mask_file).astype(np.int32)
-            mask = torch.from_numpy(mask_array).to(self.device)
-            self.masks[mask_name] = mask
-
-            json_file = os.path.join(self.json_data_dir, mask_name.replace('.npy', '.json'))
-            if os.path.exists(json_file):
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.json_data[mask_name] = data
-            else:
-                print(f"対応するJSONファイルが見つかりません: {json_file}")
+            self.mask_files[mask_name] = mask_file
+
+    def load_mask(self, mask_name):
+        """
+        マスクデータを読み込みます。
+
+        :param mask_name: マスクファイル名
+        :return: マスクのtorchテンソル（self.device上）
+        """
+        # マスクをGPU上のtorchテンソルとして読み込み
+        mask_array = np.load(self.mask_files[mask_name]).astype(np.int32)
+        return torch.from_numpy(mask_array).to(self.device)
+
+    def load_json(self, mask_name):
+        """
+        マスクに対応するJSONデータを読み込みます。
+
+        :param mask_name: マスクファイル名
+        :return: JSONデータ（ファイルがない場合は空の辞書）
+        """
+        json_file = os.path.join(self.json_data_dir, mask_name.replace('.npy', '.json'))
+        if os.path.exists(json_file):
+            return read_labels(json_file)
+        print(f"対応するJSONファイルが見つかりません: {json_file}")
+        return {}
 
     def load_csv(self):
         """
-        CSVファイルを読み込み、データフレームとして保持します。
+        CSVファイル（または指定されたDataFrame）を読み込み、判定に使用する列を型付きの配列に変換します。
+
+        - self.read_times: 読み取り時刻（int）
+        - self.ccids: CCID（int）
+        - self.rectangles: 四角形の外接矩形 [x_min, y_min, x_max, y_max]（int, (N, 4)）
+        """
+        if self.csv_data is None:
+            self.csv_data = pd.read_csv(self.csv_file_path, sep=',', header=0)
+        # 列名の前後に余計な空白があれば削除（渡されたDataFrameは変更しない）
+        self.csv_data = self.csv_data.rename(columns=lambda column: str(column).strip())
+
+        #ReadTimeが 例)085952123　→　85952123に変換されてしまうため、整数として扱いファイル名の作成時に9桁に0埋めする
+        self.read_times = self.csv_data['ReadTime'].astype(str).str.strip().astype(np.int64).to_numpy()
+        # 2024.10.10 toirsato
+        # CSVデータからCCIDの取得
+        self.ccids = self.csv_data['Code'].astype(np.int64).to_numpy()
+        # 四角形の座標 [x1, y1, ..., x4, y4] から外接矩形を作成
+        x_coords = self.csv_data[['X1', 'X2', 'X3', 'X4']].astype(int).to_numpy()
+        y_coords = self.csv_data[['Y1', 'Y2', 'Y3', 'Y4']].astype(int).to_numpy()
+        self.rectangles = np.stack([x_coords.min(axis=1), y_coords.min(axis=1),
+                                    x_coords.max(axis=1), y_coords.max(axis=1)], axis=1)
+
+    @staticmethod
+    def get_mask_name(read_time):
+        """
+        読み取り時刻からマスクファイル名を作成します（例: 85952123 -> mask_085952123.npy）。
         """
-        self.csv_data = pd.read_csv(self.csv_file_path, sep=',', header=0)
-        # 列名の前後に余計な空白があれば削除
-        self.csv_data.columns = self.csv_data.columns.str.strip()
+        return f"mask_{int(read_time):09d}.npy"
 
-    def is_rectangle_inside_mask(self, mask, rectangle):
+    def find_ids_in_rectangles(self):
         """
-        四角形がマスク内に完全に含まれているかをチェックします。
+        各行の四角形がマスク内に完全に含まれているかを確認し、含まれている場合は領域内のマスクIDを取得します。
+        読み取り時刻（フレーム）ごとに行をまとめ、マスクごとに累積和テーブルを1回だけ作成して判定します。
+        CSVで参照されているマスクのみを1フレームずつ読み込み、判定後はすぐに解放します。
 
-        :param mask: マスクの2次元テンソル（GPU上）
-        :param rectangle: 四角形の座標（リスト形式で [x1, y1, x2, y2, x3, y3, x4, y4]）
-        :return: 四角形がマスク内に含まれている場合はTrue、そうでなければFalse
+        :return: 各行の領域内のマスクIDのリスト（含まれていない場合・マスクがない場合はNone）
         """
-        # 四角形の境界を取得
-        x_coords = [rectangle[i] for i in range(0, len(rectangle), 2)]
-        y_coords = [rectangle[i] for i in range(1, len(rectangle), 2)]
-        x_min, x_max = int(min(x_coords)), int(max(x_coords))
-        y_min, y_max = int(min(y_coords)), int(max(y_coords))
-
-        # マスクの範囲内にクリップ
-        height, width = mask.shape
-        x_min = max(0, x_min)
-        x_max = min(width - 1, x_max)
-        y_min = max(0, y_min)
-        y_max = min(height - 1, y_max)
-
-        # 四角形の領域を抽出
-        mask_region = mask[y_min:y_max+1, x_min:x_max+1]
-
-        # マスクIDが0（背景）でないピクセルが存在するか確認
-        if torch.all(mask_region > 0):
-            return True
-        else:
-            return False
+        ids_per_row = [None] * len(self.read_times)
+        if len(self.read_times) == 0:
+            return ids_per_row
+
+        # 読み取り時刻ごとに行番号をまとめる（行の順序は保持）
+        frame_times, inverse = np.unique(self.read_times, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        boundaries = np.cumsum(np.bincount(inverse, minlength=len(frame_times)))[:-1]
+
+        for read_time, row_indices in zip(frame_times, np.split(order, boundaries)):
+            mask_name = self.get_mask_name(read_time)
+            if mask_name not in self.mask_files:
+                print(f"ReadTime {read_time} に対応するマスクファイルが見つかりません: {mask_name}")
+                continue
+            containment = MaskContainment(self.load_mask(mask_name))
+            results = containment.ids_in_rectangles(self.rectangles[row_indices])
+            del containment
+            for row_index, ids_in_region in zip(row_indices.tolist(), results):
+                ids_per_row[row_index] = ids_in_region
+        return ids_per_row
 
     def correct_mask_ids(self):
         """
         マスクIDの修正を行います。
         """
         # IDのマッピングを構築
-        for index, row in self.csv_data.iterrows():
-            # ReadTimeを使用してマスクファイル名を構築
-            read_time = str(row['ReadTime']).strip()
-            #ReadTimeが 例)085952123　→　85952123に変換されてしまう 2024.10.16 torisato
-            #read_timeの文字数が8桁の場合、先頭に”０”を追加する　
-            if len(read_time) == 8:
-                read_time = str("0") + read_time
-            mask_name = f"mask_{read_time}.npy"
-            # 2024.10.10 toirsato
-            # CSVデータからCCIDの取得
-            ccid = int(row['Code'])
-
-            if mask_name in self.masks:
-                mask = self.masks[mask_name]
-                # 四角形の座標を取得
-                rectangle = [
-                    row['X1'], row['Y1'], row['X2'], row['Y2'],
-                    row['X3'], row['Y3'], row['X4'], row['Y4']
-                ]
-                rectangle = list(map(int, rectangle))
-
-                # マスク内に四角形が含まれているか確認
-                if self.is_rectangle_inside_mask(mask, rectangle):
-                    # 四角形の領域内のマスクIDを取得
-                    x_coords = [rectangle[i] for i in range(0, len(rectangle), 2)]
-                    y_coords = [rectangle[i] for i in range(1, len(rectangle), 2)]
-                    x_min, x_max = int(min(x_coords)), int(max(x_coords))
-                    y_min, y_max = int(min(y_coords)), int(max(y_coords))
-
-                    # マスクの範囲内にクリップ
-                    height, width = mask.shape
-                    x_min = max(0, x_min)
-                    x_max = min(width - 1, x_max)
-                    y_min = max(0, y_min)
-                    y_max = min(height - 1, y_max)
-
-                    # 四角形の領域を抽出
-                    mask_region = mask[y_min:y_max+1, x_min:x_max+1]
-
-                    # 領域内のユニークなマスクIDを取得
-                    ids_in_region = torch.unique(mask_region)
-                    ids_in_region = ids_in_region[ids_in_region != 0]  # 背景を除外
-
-                    #CSVデータからCCを紐づける処理 2024.10.10 torisato
-                    for obj_id in ids_in_region.tolist():
-                        if ccid not in self.id_mapping:
-                            self.id_mapping[obj_id] = ccid
-
-                else:
-                    # 四角形がマスクに含まれていない場合、何もしない
-                    continue
-            else:
-                print(f"ReadTime {read_time} に対応するマスクファイルが見つかりません: {mask_name}")
-
-        # 全てのマスクとJSONを更新
-        for mask_name, mask in self.masks.items():
-            # マスク内のユニークなIDを取得
-            unique_ids = torch.unique(mask)
-            unique_ids = unique_ids[unique_ids != 0]  # 背景を除外
-
-            # IDの置換
-            for obj_id in unique_ids.tolist():
-                if obj_id in self.id_mapping:
-                    new_id = self.id_mapping[obj_id]
-                    mask[mask == obj_id] = -new_id  # 一時的に負の値を使用
-
-            # 負の値を正の値に戻す
-            mask[mask < 0] = -mask[mask < 0]
+        # フレーム（マスク）ごとに、全ての行の矩形をまとめて判定する
+        ids_per_row = self.find_ids_in_rectangles()
+
+        # CSVの行順にマッピングを登録する（四角形がマスクに含まれていない行はNone）
+        for ccid, ids_in_region in zip(self.ccids.tolist(), ids_per_row):
+            if not ids_in_region:
+                continue
+            #CSVデータからCCを紐づける処理 2024.10.10 torisato
+            for obj_id in ids_in_region:
+                if ccid not in self.id_mapping:
+                    self.id_mapping[obj_id] = ccid
+
+        # 全てのマスクとJSONを更新（1フレームずつ読み込み・置換・保存する）
+        for mask_name in self.mask_files:
+            mask = self.load_mask(mask_name)
+            # IDの置換（ルックアップテーブルによる1回の参照で置換する）
+            mask, mask_changed = relabel_mask(mask, self.id_mapping)
 
             # JSONデータの更新
-            json_data = self.json_data.get(mask_name, {})
+            json_data = self.load_json(mask_name)
+            json_changed = False
             if 'labels' in json_data:
                 for label_key, label in json_data['labels'].items():
                     original_id = label['instance_id']
                     if original_id in self.id_mapping:
                         label['instance_id'] = f'cc_id{self.id_mapping[original_id]}'
+                        json_changed = True
             # print(f"self.id_mapping:{self.id_mapping}",f"original_id:{original_id}")
 
-            # 修正後のマスクとJSONを保存
+            # 修正後のマスクとJSONを保存（IDが変わっていないファイルは元ファイルへのハードリンクにする）
+            if not mask_changed and self.link_source_mask(mask_name):
+                mask = None
+            if not json_changed and json_data and self.link_source_json(mask_name):
+                json_data = None
             self.save_corrected_mask_and_json(mask_name, mask, json_data)
 
+    def link_source_mask(self, mask_name):
+        """
+        IDが変わっていないマスクについて、元ファイルを修正後のディレクトリにハードリンク（できない場合はコピー）します。
+        元ファイルが保存時の形式（2次元のuint16）でない場合は何もしません。
+
+        :param mask_name: マスクファイル名
+        :return: リンク（コピー）した場合はTrue
+        """
+        source = self.mask_files[mask_name]
+        header = np.load(source, mmap_mode='r')
+        if header.dtype != np.uint16 or header.ndim != 2:
+            return False
+        del header
+        link_or_copy(source, os.path.join(self.corrected_mask_dir, mask_name))
+        return True
+
+    def link_source_json(self, mask_name):
+        """
+        IDが変わっていないJSONについて、元ファイルを修正後のディレクトリにハードリンク（できない場合はコピー）します。
+
+        :param mask_name: マスクファイル名
+        :return: リンク（コピー）した場合はTrue
+        """
+        json_name = mask_name.replace('.npy', '.json')
+        link_or_copy(os.path.join(self.json_data_dir, json_name), os.path.join(self.corrected_json_dir, json_name))
+        return True
+
     def save_corrected_mask_and_json(self, mask_name, mask, json_data):
         """
         修正されたマスクとJSONデータを個別に保存します。
 
+        :param mask_name: マスクファイル名
+        :param mask: 修正後のマスクテンソル（Noneの場合は保存しない）
+        :param json_data: 修正後のJSONデータ（Noneの場合は保存しない）
+        """
+        if mask is not None:
+            self.save_corrected_mask(mask_name, mask)
+        if json_data is not None:
+            self.save_corrected_json(mask_name, json_data)
+
+    def save_corrected_mask(self, mask_name, mask):
+        """
+        修正されたマスクを保存します。
+
         :param mask_name: マスクファイル名
         :param mask: 修正後のマスクテンソル
-        :param json_data: 修正後のJSONデータ
         """
         # マスクの保存
         corrected_mask_path = os.path.join(self.corrected_mask_dir, mask_name)
@@ -249,12 +335,20 @@ class MaskIDCorrector:
             # 4次元の場合、最初のチャンネルを使用
             mask_array = mask_array[0]
 
+        remove_existing(corrected_mask_path)
         np.save(corrected_mask_path, mask_array)
 
+    def save_corrected_json(self, mask_name, json_data):
+        """
+        修正されたJSONデータを保存します。
+
+        :param mask_name: マスクファイル名
+        :param json_data: 修正後のJSONデータ
+        """
         # JSONデータの保存
         corrected_json_path = os.path.join(self.corrected_json_dir, mask_name.replace('.npy', '.json'))
-        with open(corrected_json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=4)
+        remove_existing(corrected_json_path)
+        write_labels(corrected_json_path, json_data)
 
     def run(self):
         """
@@ -29,12 +29,19 @@ python create_db.py \
     --frames_folder (str): 処理対象の画像フォルダパス（画像ファイルが格納されている場所）
     --camera_id (int): 使用するカメラのID（DB登録・補正パラメータ識別用）
     --confirm_text (str): 処理完了フラグを書き込むテキストファイル
+    --flush_size (int): まとめてDBに登録する行数（デフォルト: 500）
+    --local_db (str): DBの代わりに登録するローカルのSQLiteファイル（動作確認用。省略時はDBに登録）
 
 注意事項:
-    カメラ情報は utils3.DB_serch_camera_conf_utils 経由でDBから取得
+    カメラ情報は utils3.camera_config_cache のキャッシュ（camera_config_cache.json）から取得し、
+    DBのテーブルが変更された場合のみDBから取得し直す
     カメラの歪み補正行列や変換行列は utils3.Camera_conf_utils の CAMERA_CONFIG から読み込み
-    INSERT処理は非同期で実行（createpool() 〜 insert()）
-    utils3.get_transform_pt により、画像座標から平面変換を実施
+    INSERT処理は非同期で実行（createpool() 〜 insert()）。コネクションプールはプロセスで1つだけ作成し、
+    複数ファイル分の行をまとめて --flush_size 行ごとに複数行の INSERT 文で登録する
+    行はまず <camera_id>/log_buffer.sqlite3 に書き込み、バックグラウンドの送信スレッドがDBに送るため、
+    DBが遅い・停止している間もフレームの処理は止まらない。処理終了の confirm_text への書き込みは、
+    この実行の行がすべてDBに登録されてから行う（送れなかった行は RETRY_WAIT 秒ごとに再送する）
+    utils3.camera_transform により、画像座標から平面変換をフレーム単位でまとめて実施
     カメラ別の領域定義・スケール調整には CAMERA_AREA, REDUCTION_RATIO が利用される
     拡張予定/コメントアウト済み機能:
     骨格推定（Pose Estimator）による足位置補完
@@ -47,17 +54,23 @@ python create_db.py \
 import os
 import json
 import cv2
-from utils3.get_transform_pt import transform_pt, to_two_dimension
-from utils3.DB_insert_utils import get_timestamp_conversion, get_current_time, createpool, insert
-from utils3.DB_serch_camera_conf_utils import async_config, fetch_camera_info
+from utils3.camera_transform import get_camera_transform
+from utils3.DB_insert_utils import get_timestamp_conversion, get_current_time, INSERT_CHUNK_SIZE
+from utils3.log_buffer import LogBuffer, LogShipper, MySQLLogSink, SQLiteLogSink
+from utils3.DB_serch_camera_conf_utils import config, async_config
+from utils3.camera_config_cache import CameraConfigService
 from utils3.Camera_conf_utils import REDUCTION_RATIO, CAMERA_AREA, CAMERA_CONFIG
+from utils3.label_io import read_labels
 import argparse
-import asyncio
+import time
 import numpy as np
 import re
 from PIL import Image
 # from utils3.Estimator.estimator import PoseEstimator
 
+# DBに送れなかった行を再送するまでの待ち時間（秒）
+RETRY_WAIT = 5
+
 # def call_insert(camera_id,bbox,bottom_center_x,bottom_center_y,id,time_stamp_number,update_camera_id):
 #     #print("a")
 #     #取得したIDに文字列"cc_id"が含まれているかチェックする
@@ -193,7 +206,7 @@ def create_data(merge_folder, marge_file, M, mtx, dist, new_mtx, frames_data, ca
             - ピクセルと変換後の座標を `call_insert()` 関数で登録用データとして蓄積。
         - 登録対象がいない場合、過去の座標情報を一定回数まで引き継ぐ。
         - `former_cordinate_list` を `current_cordinate_list` で更新。
-        - 最終的にDBへの非同期登録処理（`insert()`）を実行。
+        - DBへの登録は呼び出し元でまとめて行う（`flush_insert()`）。
     """
     # 正規表現で9桁の数値を抽出
     match = re.search(r'\d{9}', marge_file)
@@ -201,8 +214,7 @@ def create_data(merge_folder, marge_file, M, mtx, dist, new_mtx, frames_data, ca
         number = match.group()
 
     # JSONファイルを読み込む
-    with open(os.path.join(merge_folder, marge_file), 'r') as file:
-        data = json.load(file)
+    data = read_labels(os.path.join(merge_folder, marge_file))
 
     # 画像ファイルを読み込む
     image = cv2.imread(os.path.join(frames_data, number) + ".jpg")
@@ -216,6 +228,8 @@ def create_data(merge_folder, marge_file, M, mtx, dist, new_mtx, frames_data, ca
     #id管理用リスト
     id_lists = []
     current_cordinate_list = {}
+    # 登録対象（bbox, 足元の座標, instance_id）。座標変換はフレーム単位でまとめて行う
+    targets = []
 
     if labels:
         # labelsの内容をfor文で回す
@@ -282,34 +296,34 @@ def create_data(merge_folder, marge_file, M, mtx, dist, new_mtx, frames_data, ca
                 mid_bottom_y = label_info['y2']
                 feet_coordinates = (mid_bottom_x, mid_bottom_y)
 
-                # カメラ画角を平面マップに落とし込む
-                # 座標の歪み補正
-                undistorted_point = cv2.undistortPoints(feet_coordinates, mtx, dist, None, new_mtx)
-                # 平面座標に変換
-                dst_pt = transform_pt(undistorted_point.reshape(-1), M)
-
-                # バウンディングボックス底辺の中心座標
-                # bottom_center_x = dst_pt[0]* REDUCTION_RATIO[str(camera_id)][0]+int(x_cordinate_start)
-                # bottom_center_y = dst_pt[1]* REDUCTION_RATIO[str(camera_id)][1]+int(y_cordinate_start)
-
-                #平面座標とピクセル値　2025.05.19 torisato
-                bottom_center_x = feet_coordinates[0]
-                bottom_center_y = feet_coordinates[1]
-                transform_center_x = dst_pt[0]* REDUCTION_RATIO[str(camera_id)][0] + int(x_cordinate_start)
-                transform_center_y = dst_pt[1]* REDUCTION_RATIO[str(camera_id)][1] + int(x_cordinate_start)
+                targets.append((bbox, feet_coordinates, label_info['instance_id']))
 
                 id_lists.append(str_id)
                 # print("idlist",id_lists)
 
-                #2025.05.19 torisato
-                # call_insert(camera_id,bbox,bottom_center_x,bottom_center_y,label_info['instance_id'],number,label_info['update_camera_id'])
-                call_insert(camera_id, bbox, bottom_center_x, bottom_center_y, label_info['instance_id'], number, transform_center_x, transform_center_y)
-
                 image = cv2.rectangle(image, (bbox[0], bbox[1]), (bbox[2], int(feet_coordinates[1])), (0, 255, 255), 2)
                 # cv2.imwrite(output_folder2, image)
             # else:
             #     print("test2", str_id)
 
+        # カメラ画角を平面マップに落とし込む
+        # 座標の歪み補正・平面座標への変換をフレーム内の全員分まとめて行う（transform_pt と同じく整数に切り捨て）
+        dst_pts = camera_transform.pixels_to_world([feet for _, feet, _ in targets]).astype(int)
+        for (bbox, feet_coordinates, instance_id), dst_pt in zip(targets, dst_pts.tolist()):
+            # バウンディングボックス底辺の中心座標
+            # bottom_center_x = dst_pt[0]* REDUCTION_RATIO[str(camera_id)][0]+int(x_cordinate_start)
+            # bottom_center_y = dst_pt[1]* REDUCTION_RATIO[str(camera_id)][1]+int(y_cordinate_start)
+
+            #平面座標とピクセル値　2025.05.19 torisato
+            bottom_center_x = feet_coordinates[0]
+            bottom_center_y = feet_coordinates[1]
+            transform_center_x = dst_pt[0]* REDUCTION_RATIO[str(camera_id)][0] + int(x_cordinate_start)
+            transform_center_y = dst_pt[1]* REDUCTION_RATIO[str(camera_id)][1] + int(x_cordinate_start)
+
+            #2025.05.19 torisato
+            # call_insert(camera_id,bbox,bottom_center_x,bottom_center_y,label_info['instance_id'],number,label_info['update_camera_id'])
+            call_insert(camera_id, bbox, bottom_center_x, bottom_center_y, instance_id, number, transform_center_x, transform_center_y)
+
         for key, value in former_cordinate_list.items():
             if key not in current_cordinate_list:
                 if value[2] < 3:
@@ -318,9 +332,52 @@ def create_data(merge_folder, marge_file, M, mtx, dist, new_mtx, frames_data, ca
         former_cordinate_list.clear()  # former_cordinate_list をクリア
         former_cordinate_list.update(current_cordinate_list)  # 更新
 
-        loop = asyncio.get_event_loop()
-        pool = loop.run_until_complete(createpool(async_config, loop=loop))
-        loop.run_until_complete(insert(pool, INSERT_DATA_LIST, cc_detection_flg_list))
+def flush_insert(log_buffer, shipper):
+    """
+    INSERT_DATA_LIST に溜まった行をローカルのバッファに書き込んでリストを空にし、
+    バックグラウンドの送信スレッド（LogShipper）にDBへの送信を依頼する（DBへの送信は待たない）。
+
+    引数:
+        log_buffer (LogBuffer): カメラごとのローカルのバッファ
+        shipper (LogShipper): バッファの行をDBに送る送信スレッド
+
+    戻り値:
+        int or None: バッファに書き込んだ最後の行のID（書き込む行がない場合は None）
+    """
+    last_id = log_buffer.append(INSERT_DATA_LIST, cc_detection_flg_list)
+    INSERT_DATA_LIST.clear()
+    cc_detection_flg_list.clear()
+    shipper.notify()
+    return last_id
+
+def wait_shipped(log_buffer, make_sink, last_id):
+    """
+    バッファの ID が last_id 以下の行（この実行までに書き込んだ行）がすべてDBに登録されるまで待つ。
+    送信スレッドで送り切れなかった行はここで送り、DBに送れない間は RETRY_WAIT 秒ごとに再送する。
+    （後続の merge_json_merge.py / id_handover.py は confirm_text を見てDBの行を参照するため、
+    行がDBに揃うまでは confirm_text に書き込まない）
+
+    引数:
+        log_buffer (LogBuffer): カメラごとのローカルのバッファ
+        make_sink (callable): 送信先を作成する関数
+        last_id (int or None): この実行で書き込んだ最後の行のID
+    """
+    if last_id is None:
+        return
+    sink = make_sink()
+    try:
+        while True:
+            try:
+                log_buffer.ship(sink, batch_size=args.flush_size)
+            except Exception as e:
+                print(f"DBへの登録に失敗しました（未送信の行はバッファに残します）: {e}")
+            pending = log_buffer.pending_count(last_id)
+            if pending == 0:
+                return
+            print(f"未送信の行が {pending} 行あるため、{RETRY_WAIT} 秒後に再送します")
+            time.sleep(RETRY_WAIT)
+    finally:
+        sink.close()
 
 def get_merge_json(folder_path, num_files_to_get, frame_count):
     """
@@ -412,31 +469,26 @@ if __name__ == "__main__":
     parser.add_argument('--frames_folder', type=str, required=True, help='画像スライスフォルダ')
     parser.add_argument('--camera_id', type=int, required=True, help='カメラのid')
     parser.add_argument('--confirm_text', type=str, required=True, help='処理終了確認用')
+    parser.add_argument('--flush_size', type=int, default=INSERT_CHUNK_SIZE, help='まとめてDBに登録する行数')
+    parser.add_argument('--local_db', type=str, default=None, help='DBの代わりに登録するローカルのSQLiteファイル（動作確認用）')
     args = parser.parse_args()
     #骨格推定
     # estimator = PoseEstimator('rtmpose',None,'True')
 
-    #カメラ情報の取得
-    records = fetch_camera_info() #camera_id, code, ip_address
+    #カメラ情報の取得（キャッシュから取得し、DBのテーブルが変更された場合のみDBに問い合わせる）
+    camera = CameraConfigService(config).get_camera(args.camera_id) #id, code, ip_address
 
     #DBのカメラとの調合
-    count = 0
-    # print("records",records)
-    for row in records:
-        if int(row['id']) == int(args.camera_id):
-            count += 1
-            camera_id  = row['id']
-            code = row['code']
-            x_cordinate_start = CAMERA_AREA[f"{camera_id}"][0]
-            y_cordinate_start = CAMERA_AREA[f"{camera_id}"][1]
-            break
-
-    if count == 0:
+    if camera is None:
         print("codeなし")
+    camera_id  = camera['id']
+    code = camera['code']
+    x_cordinate_start = CAMERA_AREA[f"{camera_id}"][0]
+    y_cordinate_start = CAMERA_AREA[f"{camera_id}"][1]
 
     #設定ファイルから値を取得
-    M = to_two_dimension(CAMERA_CONFIG[code])
-    mtx, dist, new_mtx = np.array(CAMERA_CONFIG[code]['mtx']), np.array(CAMERA_CONFIG[code]['dist']), np.array(CAMERA_CONFIG[code]['new_mtx'])
+    camera_transform = get_camera_transform(code, CAMERA_CONFIG[code])
+    M, mtx, dist, new_mtx = camera_transform.M, camera_transform.mtx, camera_transform.dist, camera_transform.new_mtx
     # print("mtx",mtx)
     # print("dist",dist)
     # print("new_mtx",new_mtx)
@@ -452,11 +504,30 @@ if __name__ == "__main__":
     # フォルダが存在しない場合は作成
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    #for文でmarge_jsonの分だけ回す。
-    for file in files:
-        INSERT_DATA_LIST = []
-        cc_detection_flg_list = []
-        create_data(args.merge_dir, file, M, mtx, dist, new_mtx, args.frames_folder, camera_id, former_cordinate_list)
+    # 行はまずカメラごとのローカルのバッファに書き込み、送信スレッドがそこからDBに送る（コネクションプールはスレッドで1つだけ）
+    log_buffer = LogBuffer.for_camera(camera_id)
+    if args.local_db:
+        make_sink = lambda: SQLiteLogSink(args.local_db)
+    else:
+        make_sink = lambda: MySQLLogSink(async_config)
+    shipper = LogShipper(log_buffer.db_path, make_sink, batch_size=args.flush_size)
+    last_id = None
+    try:
+        #for文でmarge_jsonの分だけ回す。
+        for file in files:
+            create_data(args.merge_dir, file, M, mtx, dist, new_mtx, args.frames_folder, camera_id, former_cordinate_list)
+            # 一定の行数が溜まったらバッファに書き込み、バックグラウンドでDBに送る
+            if len(INSERT_DATA_LIST) >= args.flush_size:
+                last_id = flush_insert(log_buffer, shipper) or last_id
+        last_id = flush_insert(log_buffer, shipper) or last_id
+    finally:
+        shipper.close()
+
+    # この実行の行がすべてDBに登録されてから処理終了を記録する
+    try:
+        wait_shipped(log_buffer, make_sink, last_id)
+    finally:
+        log_buffer.close()
 
     with open(args.confirm_text, "a") as file:
         file.write(args.frames_folder + "\n")
\ No newline at end of file
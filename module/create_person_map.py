@@ -4,6 +4,7 @@ import tkinter as tk
 from PIL import Image, ImageTk
 from tkinter import filedialog
 from utils3.get_transform_pt import transform_pt, REDUCTION_RATIO, to_two_dimension, CAMERA_CONFIG
+from utils3.camera_transform import get_camera_transform
 from PIL import ImageGrab
 
 class CameraApp:
@@ -149,9 +150,8 @@ class CameraApp:
                 # item=(item[0],item[1])
                 item=(item[0]*self.reduction_ratio[0],item[1]*self.reduction_ratio[1])
                 print(item)
-                converted_obstacle = cv2.undistortPoints(item, mtx, dist, None, new_mtx)
-                # 平面座標に変換
-                dst_pt = transform_pt(converted_obstacle.reshape(-1), M)
+                # 歪み補正・平面座標に変換
+                dst_pt = camera_transform.pixel_to_world(item)
                 # converted_obstacle = (dst_pt[0]*REDUCTION_RATIO[0],dst_pt[1]*REDUCTION_RATIO[1])
                 converted_obstacle = (dst_pt[0]*REDUCTION_RATIO["1"][0]/self.reduction_ratio[0]*(1920/1080),dst_pt[1]*REDUCTION_RATIO["1"][1]/self.reduction_ratio[1]*(1080/1920))
                 # converted_obstacle = self.convert_to_overhead(obstacle)
@@ -273,7 +273,7 @@ class CameraApp:
 
 if __name__ == '__main__':
     camera_ip, camera_code  = '192.168.1.142', 'ZGY8586252'
-    M = to_two_dimension(CAMERA_CONFIG[camera_code])
-    mtx, dist, new_mtx = np.array(CAMERA_CONFIG[camera_code]['mtx']), np.array(CAMERA_CONFIG[camera_code]['dist']), np.array(CAMERA_CONFIG[camera_code]['new_mtx'])
+    camera_transform = get_camera_transform(camera_code, CAMERA_CONFIG[camera_code])
+    M, mtx, dist, new_mtx = camera_transform.M, camera_transform.mtx, camera_transform.dist, camera_transform.new_mtx
     # print(mtx, dist, new_mtx)
     root = CameraApp(tk.Tk(), "座標取得", CAMERA_CONFIG[camera_code],mtx, dist, new_mtx, video_source=f"rtsp://{camera_ip}:554/rtpstream/config1=r")
@@ -30,7 +30,7 @@ JSONマージファイルへの反映、ラベル付き画像の生成、動画
 - Pillow
 - NumPy
 - mysql-connector-python
-- argparse, os, json, shutil, datetime, subprocess, re, time, math, collections
+- argparse, os, json, shutil, datetime, subprocess, re, time, collections
 
 注意事項：
 - カメラごとの設定情報（エリア定義など）は utils3.Camera_conf_utils に依存
@@ -50,14 +50,20 @@ import cv2
 import shutil
 from datetime import datetime
 import json
-from PIL import Image, ImageDraw , ImageFont
 import numpy as np
 from collections import defaultdict
-import math
 import re
 from utils3.Camera_conf_utils import camera_list, camera_pairs, CAMERA_AREA
+from utils3.label_io import read_labels, write_labels, format_io_stats
+from utils3.assignment import assign_edges
+from utils3.movie_index import find_frame
+from utils3.movie_render import MovieRenderScheduler, encode_folder
+from utils3.annotation import get_cc_name, draw_text
 import time
 
+# 異なるカメラのレコードを同一人物のペアとみなす平面座標上の距離の上限
+HANDOVER_DISTANCE = 150
+
 def get_data(first_file, last_file, x_range_start, x_range_end, y_range_start, y_range_end, camera_id1, camera_id2):
     """
     指定された日時・座標・カメラIDの条件に一致するログデータを MySQL データベースから取得する。
@@ -109,15 +115,182 @@ def get_data(first_file, last_file, x_range_start, x_range_end, y_range_start, y
         connection.close()
 
 
+def pair_label(record1, record2):
+    """
+    同一時刻の2つのレコードを、カメラID（update_camera_id があればそちら）・IDの順に並べたペアにします。
+    IDは chameleon_code があれば "cc_id" + chameleon_code、なければ TID を使用します。
+
+    Returns:
+        tuple: ((camera_id1, id1), (camera_id2, id2))
+    """
+    id1 = "cc_id" + str(record1['chameleon_code']) if record1['chameleon_code'] is not None else str(record1['TID'])
+    id2 = "cc_id" + str(record2['chameleon_code']) if record2['chameleon_code'] is not None else str(record2['TID'])
+
+    # カメラID順でペアを一貫性のある順序に
+    camera_id1 = record1['camera_id']
+    camera_id2 = record2['camera_id']
+
+    update_camera_id1 = record1['update_camera_id']
+    update_camera_id2 = record2['update_camera_id']
+
+    if update_camera_id1 and update_camera_id2:
+        if update_camera_id1 < update_camera_id2:
+            pair = ((update_camera_id1, id1), (update_camera_id2, id2))
+        elif update_camera_id1 == update_camera_id2:
+            if "cc_id" not in id1 and "cc_id" not in id2:
+                if int(id1) < int(id2):
+                    pair = ((update_camera_id1, id1), (update_camera_id2, id2))
+                else:
+                    pair = ((update_camera_id2, id2), (update_camera_id1, id1))
+            else:
+                pair = ((update_camera_id1, id1), (update_camera_id2, id2))
+        else:
+            pair = ((update_camera_id2, id2), (update_camera_id1, id1))
+
+    elif update_camera_id1 and update_camera_id2 == None:
+        if update_camera_id1 < camera_id2:
+            pair = ((update_camera_id1, id1), (camera_id2, id2))
+        elif update_camera_id1 == camera_id2:
+            if "cc_id" not in id1 and "cc_id" not in id2:
+                if int(id1) < int(id2):
+                    pair = ((update_camera_id1, id1), (camera_id2, id2))
+                else:
+                    pair = ((camera_id2, id2), (update_camera_id1, id1))
+            else:
+                pair = ((update_camera_id1, id1), (camera_id2, id2))
+        else:
+            pair = ((camera_id2, id2), (update_camera_id1, id1))
+
+    elif update_camera_id1 == None and update_camera_id2:
+        if camera_id1 < update_camera_id2:
+            pair = ((camera_id1, id1), (update_camera_id2, id2))
+        elif update_camera_id2 == camera_id1:
+            if "cc_id" not in id1 and "cc_id" not in id2:
+                if int(id1) < int(id2):
+                    pair = ((camera_id1, id1), (update_camera_id2, id2))
+                else:
+                    pair = ((update_camera_id2, id2), (camera_id1, id1))
+            else:
+                pair = ((camera_id1, id1), (update_camera_id2, id2))
+        else:
+            pair = ((update_camera_id2, id2), (camera_id1, id1))
+    else:
+        if camera_id1 < camera_id2:
+            pair = ((camera_id1, id1), (camera_id2, id2))
+        else:
+            pair = ((camera_id2, id2), (camera_id1, id1))
+    return pair
+
+
+def _assign_records(edges, camera_ids):
+    """
+    同一時刻のレコードの候補の組（異なるカメラで距離が上限以内の組）から、レコード同士を1対1で割り当てる。
+    3台以上のカメラのレコードがある場合は、カメラIDの組ごとに、まだ割り当てていないレコード同士で割り当てる。
+
+    Parameters:
+        edges (list[tuple]): 候補の組 [(index, i, j, distance), ...]（index は match_records の候補の番号）
+        camera_ids (list): レコードごとのカメラID
+
+    Returns:
+        list[int]: 割り当てた候補の番号
+    """
+    edges_by_cameras = defaultdict(list)
+    for index, i, j, distance in edges:
+        # カメラIDの小さいほうのレコードを行にする
+        row, col = (i, j) if camera_ids[i] < camera_ids[j] else (j, i)
+        edges_by_cameras[(camera_ids[row], camera_ids[col])].append((index, row, col, distance))
+
+    assigned = []
+    used = set()
+    for cameras in sorted(edges_by_cameras):
+        camera_edges = [edge for edge in edges_by_cameras[cameras] if edge[1] not in used and edge[2] not in used]
+        for k in assign_edges([(row, col, distance) for _, row, col, distance in camera_edges]):
+            index, row, col, _ = camera_edges[k]
+            assigned.append(index)
+            used.update((row, col))
+    return assigned
+
+
+def match_records(records, max_distance=HANDOVER_DISTANCE):
+    """
+    同一時刻（log_datetime）のレコードのうち、異なるカメラで距離が max_distance 以内のレコード同士を1対1で対応付ける。
+
+    距離の計算は全時刻分を numpy でまとめて行い、対応付けはハンガリアン法による割当
+    （対応付けるペアの数が最大で、その中で距離の合計が最小）で決定する。
+    候補が1つしかないレコード同士はそのまま対応付け、候補が競合する時刻のレコードだけを割当で解く。
+
+    Parameters:
+        records (list[dict]): ログレコードのリスト（id_handover の results と同じ形式）
+        max_distance (float): ペアとみなす距離の上限
+
+    Returns:
+        tuple:
+            - matches (list[tuple]): 対応付けたレコードの組 [(group, i, j, distance), ...]
+            - candidates (list[tuple]): 距離が上限以内の異なるカメラのレコードの組 [(group, i, j, distance), ...]
+            group は log_datetime の出現順の番号、i < j は records のインデックス。いずれも group・距離の昇順
+    """
+    if not records:
+        return [], []
+    group_numbers = {}
+    groups = np.array([group_numbers.setdefault(record['log_datetime'], len(group_numbers)) for record in records])
+    points = np.array([(record['transform_center_x'], record['transform_center_y']) for record in records], dtype=np.float64)
+    camera_ids = np.array([record['camera_id'] for record in records])
+
+    # 時刻順に並べ、k 個離れたレコード同士（同一時刻のもの）の距離を k = 1, 2, ... の順にまとめて計算する
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    sorted_points = points[order]
+    sorted_camera_ids = camera_ids[order]
+    pair_i, pair_j, pair_distances = [], [], []
+    for k in range(1, len(records)):
+        i = np.flatnonzero(sorted_groups[:-k] == sorted_groups[k:])
+        if len(i) == 0:
+            # 全ての時刻のレコード数が k 以下
+            break
+        j = i + k
+        diff = sorted_points[i] - sorted_points[j]
+        distances = np.sqrt(diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1])
+        gated = (sorted_camera_ids[i] != sorted_camera_ids[j]) & (distances <= max_distance)
+        pair_i.append(order[i[gated]])
+        pair_j.append(order[j[gated]])
+        pair_distances.append(distances[gated])
+    pair_i = np.concatenate(pair_i or [np.zeros(0, dtype=np.int64)])
+    pair_j = np.concatenate(pair_j or [np.zeros(0, dtype=np.int64)])
+    pair_distances = np.concatenate(pair_distances or [np.zeros(0)])
+    if len(pair_i) == 0:
+        return [], []
+    pair_groups = groups[pair_i]
+
+    # 候補が1つしかないレコード同士の組はそのまま対応付ける
+    degree = np.bincount(np.concatenate([pair_i, pair_j]), minlength=len(records))
+    single = (degree[pair_i] == 1) & (degree[pair_j] == 1)
+    matched = single.copy()
+    # 候補が競合するレコードは、時刻ごとに割当で解く
+    conflict = np.flatnonzero(~single)
+    conflicts = defaultdict(list)
+    for index, group, i, j, distance in zip(conflict.tolist(), pair_groups[conflict].tolist(), pair_i[conflict].tolist(),
+                                            pair_j[conflict].tolist(), pair_distances[conflict].tolist()):
+        conflicts[group].append((index, i, j, distance))
+    record_camera_ids = camera_ids.tolist()
+    for edges in conflicts.values():
+        matched[_assign_records(edges, record_camera_ids)] = True
+
+    order = np.lexsort((pair_distances, pair_groups))
+    candidates = list(zip(pair_groups[order].tolist(), pair_i[order].tolist(), pair_j[order].tolist(), pair_distances[order].tolist()))
+    matches = [candidate for candidate, is_matched in zip(candidates, matched[order].tolist()) if is_matched]
+    return matches, candidates
+
+
 def id_handover(results):
     """
     ログデータから時刻ごとに2台の異なるカメラ間で人物が受け渡された可能性のあるIDペアを判定・抽出する。
 
     与えられた `results`（辞書形式のログレコード一覧）を `log_datetime` ごとにグループ化し、
     同一時刻に異なるカメラに記録された座標が近いIDのペアを構築する。  
-    ペアは距離150以内で、IDやupdate_camera_idを考慮しソート・重複排除したうえで整形される。
+    ペアは距離150以内で、時刻ごとにレコード同士を1対1で割り当て（match_records）、
+    IDやupdate_camera_idを考慮して並べ（pair_label）、重複を除いたうえで距離の近い順に整形される。
 
-    条件に一致するものは `pairs` に、条件に一致しなかったかすでに使用済みで採用されなかったペアは `not_pairs` に格納される。
+    割り当てられたものは `pairs` に、距離150以内だった全てのペア（割り当てられたものを含む）は `not_pairs` に格納される。
 
     Parameters:
         results (list[dict]): 
@@ -137,164 +310,39 @@ def id_handover(results):
             - pairs (list[tuple]): 
                 距離の近いIDのペアリスト。形式は [((camera_id1, id1), (camera_id2, id2)), ...]
             - not_pairs (list[tuple]):
-                採用されなかったペアのリスト。形式は [(camera_id, id), (camera_id, id)], ...
-    """
-    # log_datetimeごとにデータをグループ化
-    grouped_data = defaultdict(list)
-
-    """
-    rowの中身
-    #例(162492, 1, None, 366, 1004, datetime.datetime(2025, 5, 28, 13, 49, 22, 800000), 4, None)
-    #id, camera_id, chameleon_code, transform_center_x, transform_center_y, log_datetime, TID, update_camera_id
-    #row[0] = 162492
-    #row[1] = 1
-    #row[2] = None
-    #row[3] = 366
-    #row[4] = 1004
-    #row[5] = 2025-05-28 13:49:22.800000
-    #row[6] = 4
-    #row[7] = None
-    """
-
-    for row in results:
-        grouped_data[row['log_datetime']].append(row)
-
-    # log_datetimeごとのペアを生成
-    pairs = []
-
-    #ペア管理用indexリスト
-    pair_index_list=[]
-
-    #ペアにしないリスト
-    not_pairs=[]
-
-    pairs_list=[]
-
-    for log_datetime, records in grouped_data.items():
-        used_indices = set()  # 既にペアリングされたレコードのインデックスを追跡
-        odd_list = []
-
-        for i, record1 in enumerate(records):
-            for j, record2 in enumerate(records):
-                if (
-                    i != j and
-                    j not in used_indices and
-                    record1['camera_id'] != record2['camera_id']  # カメラIDが異なるものを選択
-                ):
-                    # 距離を計算
-                    distance = math.sqrt(
-                        (record1['transform_center_x'] - record2['transform_center_x'])**2 +
-                        (record1['transform_center_y'] - record2['transform_center_y'])**2
-                    )
-                    if distance <= 150:
-                        id1 = "cc_id" + str(record1['chameleon_code']) if record1['chameleon_code'] is not None else str(record1['TID'])
-                        id2 = "cc_id" + str(records[j]['chameleon_code']) if records[j]['chameleon_code'] is not None else str(records[j]['TID'])
-
-                        # カメラID順でペアを一貫性のある順序に
-                        camera_id1 = record1['camera_id']
-                        camera_id2 = records[j]['camera_id']
-
-                        update_camera_id1 = record1['update_camera_id']
-                        update_camera_id2 = records[j]['update_camera_id']
-
-                        if update_camera_id1 and update_camera_id2:
-                            if update_camera_id1 < update_camera_id2:
-                                pair = ((update_camera_id1, id1), (update_camera_id2, id2))
-                            elif update_camera_id1 == update_camera_id2:
-                                if "cc_id" not in id1 and "cc_id" not in id2:
-                                    if int(id1) < int(id2):
-                                        pair = ((update_camera_id1, id1), (update_camera_id2, id2))
-                                    else:
-                                        pair = ((update_camera_id2, id2), (update_camera_id1, id1))
-                                else:
-                                    pair = ((update_camera_id1, id1), (update_camera_id2, id2))
-                            else:
-                                pair = ((update_camera_id2, id2), (update_camera_id1, id1))
-
-                        elif update_camera_id1 and update_camera_id2 == None:
-                            if update_camera_id1 < camera_id2:
-                                pair = ((update_camera_id1, id1), (camera_id2, id2))
-                            elif update_camera_id1 == camera_id2:
-                                if "cc_id" not in id1 and "cc_id" not in id2:
-                                    if int(id1) < int(id2):
-                                        pair = ((update_camera_id1, id1), (camera_id2, id2))
-                                    else:
-                                        pair = ((camera_id2, id2), (update_camera_id1, id1))
-                                else:
-                                    pair = ((update_camera_id1, id1), (camera_id2, id2))
-                            else:
-                                pair = ((camera_id2, id2), (update_camera_id1, id1))
-
-                        elif update_camera_id1 == None and update_camera_id2:
-                            if camera_id1 < update_camera_id2:
-                                pair = ((camera_id1, id1), (update_camera_id2, id2))
-                            elif update_camera_id2 == camera_id1:
-                                if "cc_id" not in id1 and "cc_id" not in id2:
-                                    if int(id1) < int(id2):
-                                        pair = ((camera_id1, id1), (update_camera_id2, id2))
-                                    else:
-                                        pair = ((update_camera_id2, id2), (camera_id1, id1))
-                                else:
-                                    pair = ((camera_id1, id1), (update_camera_id2, id2))
-                            else:
-                                pair = ((update_camera_id2, id2), (camera_id1, id1))
-                        else:
-                            if camera_id1 < camera_id2:
-                                pair = ((camera_id1, id1), (camera_id2, id2))
-                            else:
-                                pair = ((camera_id2, id2), (camera_id1, id1))
-
-                        odd_list.append((pair, distance, i, j))
-                        if distance == 78.29431652425353:
-                            print(log_datetime,record1,record2)
-        # print(odd_list)
-        #例)odd_list =  [(((1, 'cc_id2'), (2, '2')), 117.38824472663352, 0, 2), (((1, 'cc_id2'), (2, '2')), 117.38824472663352, 2, 0)]
-        if odd_list:
-            odd_list_sorted = sorted(odd_list, key=lambda x: x[1])
-            counter = 0
-            used_list = []
-            for odd in odd_list_sorted:
-                if counter == len(records) // 2:
-                    if odd[0] not in not_pairs:
-                            not_pairs.append(odd[0])
-
-                if counter == 0:
-                    if (odd[0], odd[1]) not in pairs_list and odd[0] not in not_pairs:
-                        pairs_list.append((odd[0], odd[1]))
-                        used_list.append(odd[2])
-                        used_list.append(odd[3])
-                        counter += 1
-                    elif odd[0] not in not_pairs:
-                        not_pairs.append(odd[0])
-                else:
-                    if odd[2] not in used_list and odd[3] not in used_list:
-                        pairs_list.append((odd[0], odd[1]))
-                        used_list.append(odd[2])
-                        used_list.append(odd[3])
-                        counter+=1
-                    else:
-                        if odd[0] not in not_pairs:
-                            not_pairs.append(odd[0])
-
-                for i, (left, right) in enumerate(pairs_list):
-                    # print(left,right,odd[0],odd[1])
-                    if left == odd[0]:
-                        if right > odd[1]:
-                            pairs_list[i] = (left, odd[1])  # 右側を更新
-                        break
-    """
-    pairs_list = [(((<camera_id1>, <id1>), (<camera_id2>, <id2>)), <distance>)]
-    #例) [(((1, '4'), (2, '7')), 14.422205101855956)]
-    """
-    pairs_list_sorted = sorted(pairs_list, key=lambda x: x[1])
-
-    for pair,distance in pairs_list_sorted:
-        if pair not in pairs:
-            pairs.append(pair)
+                距離150以内だったペアのリスト（時刻・距離順、重複なし）。形式は [(camera_id, id), (camera_id, id)], ...
+    """
+    # log_datetimeごとに対応付け（group は log_datetime の出現順の番号）
+    matches, candidates = match_records(results or [])
+
+    # ペア -> 最短の距離（最初に見つかった順）
+    pair_distances = {}
+    for group, i, j, distance in matches:
+        pair = pair_label(results[i], results[j])
+        if pair not in pair_distances or distance < pair_distances[pair]:
+            pair_distances[pair] = distance
+
+    #ペアにしないリスト（従来と同じく、距離が上限以内の全ての組。対応付けたペアも含む）
+    #pairs_consistency は not_pairs を使って推移的なIDの書き換え（A-B, B-C から A→C）を防ぐため、
+    #対応付けたペアも除外しない
+    not_pairs = []
+    not_pair_set = set()
+    for group, i, j, distance in candidates:
+        pair = pair_label(results[i], results[j])
+        if pair not in not_pair_set:
+            not_pair_set.add(pair)
+            not_pairs.append(pair)
+
+    """
+    pair_distances = {((<camera_id1>, <id1>), (<camera_id2>, <id2>)): <distance>}
+    #例) {((1, '4'), (2, '7')): 14.422205101855956}
+    """
+    pairs = sorted(pair_distances, key=pair_distances.get)
     print("pairs", pairs)
 
     return pairs, not_pairs
 
+
 def create_pair(record1, record2):
     """
     2つのレコードをペアとして一意に識別可能なタプルに変換。
@@ -495,7 +543,7 @@ def update_images(first_file, last_file, merge_dir, updated_list, log_last, fram
         1. update_flg=1 のログ情報を元に該当画像ファイルを特定。
         2. chameleon_code がある場合は、cc_name.txt から名前を取得して画像にラベル描画。
         3. それ以外の場合は update_camera_id_TID の形式で描画。
-        4. 更新されたフォルダ単位で `movie_create` 関数を呼び出して動画を再生成。
+        4. 更新されたフォルダを `MovieRenderScheduler` に登録し、フォルダごとに1回だけ `movie_create` で動画を再生成。
         5. マージ済みJSONファイル（mask_*.json）も `update_merged_json` 関数で上書き。
         6. フレーム不足の JSON ファイルについても補完更新を実行。
 
@@ -512,52 +560,33 @@ def update_images(first_file, last_file, merge_dir, updated_list, log_last, fram
         - 出力される画像には、人物IDや名前が直接描画されます。
         - 各MOVIE_FOLDER配下の画像が更新された場合、動画（output.mp4）も再生成されます。
     """
-    #HACK 名前辞書読込 2024/11/15 torisato(削除予定)
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    #HACK　日本語フォント　2024/11/15 torisato(削除予定)
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
     results = get_update_date(first_file, last_file)
     #results = id, camera_id, chameleon_code, top_left_x, top_left_y, bottom_right_x, bottom_right_y, log_datetime, TID, update_camera_id
-    last_folder_name = ""
     if results != None:
-        for row in results:
-            #画像に更新処理をかける
-            filename = row['log_datetime'].strftime("%H%M%S%f")[:9]+".jpg"
-            # print(filename)
-            # root_folder = str(row[1])+"/MOVIE_FOLDER"+"/"+ datetime.now().strftime("%Y%m%d")
-            root_folder = os.path.join(str(row['camera_id']), "MOVIE_FOLDER", datetime.now().strftime("%Y%m%d"))
-            image_file, current_folder_name = find_file(root_folder, filename)
-            merged_json_name = "mask_" + row['log_datetime'].strftime("%H%M%S%f")[:9] + ".json"
-            # print(image_file)
-            if image_file != None:
-                image = cv2.imread(image_file)
-                if row['chameleon_code'] != None:
-                    ccid = int(str(row['chameleon_code']))
-                    cc = next((item for item in cc_name_dict if item['ccid'] == str(ccid)), None)
-                    text = cc['name']
-                    #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-                    image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-                    #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-                    draw = ImageDraw.Draw(image_pil)
-
-                    # 画像にテキストを描画
-                    draw.text((int(row['top_left_x']), int((int(row['top_left_y']) + int(row['bottom_right_y'])) / 2 - 40)), text, font=font, fill=(0, 255, 0))
-                    # Pillow形式からcv2形式に戻す
-                    image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
-                    # image = cv2.putText(image, str(item[1]), (label['x1'], int((label['y1']+label['y2'])/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-                else:
-                    image = cv2.putText(image, str(row['update_camera_id'])+"_"+str(row['TID']), (int(row['top_left_x']),int((int(row['top_left_y'])+int(row['bottom_right_y']))/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-                cv2.imwrite(image_file,image)
-                if last_folder_name != current_folder_name and last_folder_name != "":
-                    print(last_folder_name)
-                    movie_create(last_folder_name)
-                last_folder_name=current_folder_name
-        if last_folder_name != "":
-                # print(last_folder_name)
-                movie_create(last_folder_name)
+        # 画像を書き換えたフォルダの動画は、with を抜けるときにまとめて作成する
+        with MovieRenderScheduler(movie_create, window=None) as render_scheduler:
+            for row in results:
+                #画像に更新処理をかける
+                filename = row['log_datetime'].strftime("%H%M%S%f")[:9]+".jpg"
+                # print(filename)
+                # root_folder = str(row[1])+"/MOVIE_FOLDER"+"/"+ datetime.now().strftime("%Y%m%d")
+                root_folder = os.path.join(str(row['camera_id']), "MOVIE_FOLDER", datetime.now().strftime("%Y%m%d"))
+                image_file, current_folder_name = find_file(root_folder, filename)
+                merged_json_name = "mask_" + row['log_datetime'].strftime("%H%M%S%f")[:9] + ".json"
+                # print(image_file)
+                if image_file != None:
+                    image = cv2.imread(image_file)
+                    if row['chameleon_code'] != None:
+                        ccid = int(str(row['chameleon_code']))
+                        text = get_cc_name(ccid)
+                        # 画像にテキストを描画
+                        draw_text(image, (int(row['top_left_x']), int((int(row['top_left_y']) + int(row['bottom_right_y'])) / 2 - 40)), text, fill=(0, 255, 0))
+                        # image = cv2.putText(image, str(item[1]), (label['x1'], int((label['y1']+label['y2'])/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+                    else:
+                        image = cv2.putText(image, str(row['update_camera_id'])+"_"+str(row['TID']), (int(row['top_left_x']),int((int(row['top_left_y'])+int(row['bottom_right_y']))/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+                    cv2.imwrite(image_file,image)
+                    # 同じフォルダへの要求はまとめて、動画は後でバックグラウンドで作成する
+                    render_scheduler.request(current_folder_name)
 
     results = get_update_date(first_file, log_last)
 
@@ -573,8 +602,8 @@ def update_images(first_file, last_file, merge_dir, updated_list, log_last, fram
 
 def find_file(root_folder, target_file_name):
     """
-    指定されたフォルダ以下のすべてのサブディレクトリから、指定したファイル名を再帰的に検索し、
-    該当ファイルのパスとフォルダパスを返す。
+    指定された日付フォルダのインデックス（create_movie.py が画像の書き出し時に登録）から、
+    指定したファイル名を検索し、該当ファイルのパスとフォルダパスを返す。
 
     Parameters:
         root_folder (str): 検索を開始するルートフォルダのパス。
@@ -586,38 +615,23 @@ def find_file(root_folder, target_file_name):
             - str: ファイルが見つかったディレクトリのパス
         ファイルが見つからなかった場合は `(None, None)` を返す。
     """
-    # 指定したフォルダ内の全てのサブフォルダを再帰的に検索
-    for root, dirs, files in os.walk(root_folder):
-        if target_file_name in files:
-            return root +"/"+target_file_name , root
-    return None, None
+    # os.walk でサブフォルダを毎回検索する代わりにインデックスを引く
+    return find_frame(root_folder, target_file_name)
 
 def movie_create(root_folder):
     """
     指定フォルダ内の全てのJPEG画像を結合して、MP4形式の動画ファイル (output2.mp4) を生成する。
 
     処理概要:
+        - 画像が前回の作成時から変わっていない場合（output2.sig で判定）は作成しない。
         - すでに output2.mp4 が存在する場合は削除。
-        - 指定フォルダ内のすべての `.jpg` ファイルを対象に、解像度1920x1080、フレームレート5fpsの動画を作成。
+        - 指定フォルダ内のすべての `.jpg` ファイルを対象に、解像度1920x1080、フレームレート5fpsの動画をファイル名順に作成。
 
     Parameters:
         root_folder (str): 対象となる画像フォルダのパス。動画もこのフォルダ内に保存される。
     """
-    # 同名のMP4ファイルが存在する場合は削除
-    if os.path.exists(os.path.join(root_folder, "output2.mp4")):
-        os.remove(os.path.join(root_folder, "output2.mp4"))  # 既存のファイルを削除
-
-    # 動画作成のための VideoWriter オブジェクトを作成
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # mp4形式で保存
-    video = cv2.VideoWriter(os.path.join(root_folder, "output2.mp4"), fourcc, 5.0, (1920, 1080))
-    # 指定されたディレクトリ内のすべてのファイルを取得
-    files = os.listdir(root_folder)
-
-    # .jpg拡張子のファイルのみをリストアップ
-    jpg_files = [file for file in files if file.lower().endswith('.jpg')]
-    for file in jpg_files:
-        image = cv2.imread(root_folder+"/"+file)
-        video.write(image)  # 動画ファイルに書き込み
+    # 画像が前回の作成時から変わっていない場合は作成しない
+    return encode_folder(root_folder)
 
 def convert_filename_to_time_format(filename):
     """
@@ -689,37 +703,35 @@ def update_merged_json(merge_folder, file, camera_id, updated_list):
         None: 処理後、ファイルは上書き保存される。
     """
     # with open('./'+str(camera_id)+'/'+merge_folder +'/' + file, 'r') as f:
-    with open(os.path.join(merge_folder, file), 'r') as f:
-        merge_data = json.load(f)
-        labels = merge_data.get('labels', {})
-        for key, label in labels.items():
-            for item in updated_list:
-                item_camera_id = item[0][0]
-                item_TID = item[0][1]
-                item_update_camera_id = item[1][0]
-                item_ccid = item[1][1]
-                if label['update_camera_id'] == 0:
-                    if int(item_camera_id) == camera_id and int(item_TID) == label['instance_id']:
-                        if "cc_id" not in str(item_ccid):
-                            label['update_camera_id'] = int(item_update_camera_id)
-                            label['instance_id'] = int(item_ccid)
-                        else:
-                            label['instance_id'] = item_ccid
-                        break
-                    # print("更新されたよ",'./'+str(camera_id)+'/'+merge_folder +'/' + file)
-                else:
-                    if int(item_camera_id) == label['update_camera_id'] and int(item_TID) == label['instance_id']:
-                        if "cc_id" not in str(item_ccid):
-                            label['update_camera_id'] = int(item_update_camera_id)
-                            label['instance_id'] = int(item_ccid)
-                        else:
-                            label['instance_id'] = item_ccid
-                            label['update_camera_id'] = 0
-                        break
+    merge_data = read_labels(os.path.join(merge_folder, file))
+    labels = merge_data.get('labels', {})
+    for key, label in labels.items():
+        for item in updated_list:
+            item_camera_id = item[0][0]
+            item_TID = item[0][1]
+            item_update_camera_id = item[1][0]
+            item_ccid = item[1][1]
+            if label['update_camera_id'] == 0:
+                if int(item_camera_id) == camera_id and int(item_TID) == label['instance_id']:
+                    if "cc_id" not in str(item_ccid):
+                        label['update_camera_id'] = int(item_update_camera_id)
+                        label['instance_id'] = int(item_ccid)
+                    else:
+                        label['instance_id'] = item_ccid
+                    break
+                # print("更新されたよ",'./'+str(camera_id)+'/'+merge_folder +'/' + file)
+            else:
+                if int(item_camera_id) == label['update_camera_id'] and int(item_TID) == label['instance_id']:
+                    if "cc_id" not in str(item_ccid):
+                        label['update_camera_id'] = int(item_update_camera_id)
+                        label['instance_id'] = int(item_ccid)
+                    else:
+                        label['instance_id'] = item_ccid
+                        label['update_camera_id'] = 0
+                    break
 
     # with open('./'+str(camera_id)+'/'+merge_folder +'/' + file, 'w') as f:
-    with open(os.path.join(merge_folder, file), 'w') as f:
-        json.dump(merge_data, f, ensure_ascii=False, indent=4)
+    write_labels(os.path.join(merge_folder, file), merge_data)
 
 def copy_merged_json(merged_json_folder, former_merged_json_folder, frame_count, camera_id):
     """
@@ -1005,6 +1017,7 @@ if __name__ == '__main__':
 
         for camera_id in camera_list:
             copy_merged_json(args.merge_dir, args.former_merge_dir, args.frame_count, camera_id)
+        print(format_io_stats("id_handover"))
 
         with open(args.id_text, "a") as file:
             file.write(video_path + "\n")
\ No newline at end of file
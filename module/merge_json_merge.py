@@ -8,7 +8,7 @@ merge_json_merge.py
 
 1. 一つ前の動画と現在の動画でmerge_jsonフォルダを比較し、IoUに基づいて同一物体のIDを継承。
 2. マッチしたインスタンスのIDおよびカメラ情報を後続のJSONに反映。
-3. 特定のCCIDが割り当てられた場合、旧IDに遡ってJSONファイルとDBへ反映。
+3. 特定のCCIDが割り当てられた場合、旧IDに遡ってJSONファイルとDBへ反映（DBはまとめて1トランザクションで更新）。
 4. 日本語名のラベル付き画像生成（任意：Pillowによるテキスト描画）。
 5. 動画内画像（.jpg）から動画（.mp4）を生成。
 6. 動画間の連続性を保つため、末尾のmerge_jsonファイルを次動画処理用に一時保存。
@@ -28,7 +28,7 @@ python merge_json_merge.py \
     --camera_id : 対象のカメラID（DB更新や動画名生成に使用）
 
 要件:
-    torch, torchvision, cv2, Pillow, mysql-connector-python が必要
+    numpy, cv2, Pillow, mysql-connector-python が必要（IoU計算は utils3/box_geometry.py を使用し、torch は不要）
     utils3/DB_serch_camera_conf_utils.py にDB更新ロジックが実装されている必要あり
     cc_name.txt にCCIDと名称のマッピングが格納されている必要あり
     NotoSansJP-VariableFont_wght.ttf フォントファイルが存在する必要あり（画像への日本語描画用）
@@ -44,17 +44,19 @@ python merge_json_merge.py \
 """
 
 import json
-import torch
-from torchvision.ops import box_iou
 import os
 import argparse
 import shutil
 from datetime import datetime
-from utils3.DB_serch_camera_conf_utils import config
+from utils3.DB_serch_camera_conf_utils import config, run_in_transaction
+from utils3.label_io import read_labels, write_labels, format_io_stats
+from utils3.box_geometry import box_iou, matching_pairs
+from utils3.movie_index import find_frame
+from utils3.movie_render import MovieRenderScheduler, encode_folder
+from utils3.annotation import get_cc_name, draw_text
 import mysql.connector
 import re
 import cv2
-from PIL import Image, ImageDraw , ImageFont
 import numpy as np
 
 def update_instance_ids_based_on_iou(former_merge_folder, merge_folder, iou_threshold=0.8):
@@ -67,12 +69,10 @@ def update_instance_ids_based_on_iou(former_merge_folder, merge_folder, iou_thre
 
     for file in files:
         # 1つ目のmerge_jsonを読み込み
-        with open(os.path.join(former_merge_folder, file) , 'r') as f:
-            merge_data_1 = json.load(f)
+        merge_data_1 = read_labels(os.path.join(former_merge_folder, file))
 
         # 2つ目のmerge_jsonを読み込み
-        with open(os.path.join(merge_folder, file) , 'r') as f:
-            merge_data_2 = json.load(f)
+        merge_data_2 = read_labels(os.path.join(merge_folder, file))
 
         # 各ラベルを取得（バウンディングボックスとinstance_idを含む）
         labels_1 = merge_data_1.get('labels', {})
@@ -102,23 +102,22 @@ def update_instance_ids_based_on_iou(former_merge_folder, merge_folder, iou_thre
             class_names_2.append(label['class_name'])
             update_camera_id_2.append(label['update_camera_id'])
 
-        # バウンディングボックスをテンソルに変換
-        bboxes_tensor_1 = torch.tensor(bboxes_1, dtype=torch.float32)
-        bboxes_tensor_2 = torch.tensor(bboxes_2, dtype=torch.float32)
+        # 2つ目のmerge_jsonの instance_id -> ラベルキー の索引
+        label_keys_2 = {}
+        for key, label in labels_2.items():
+            label_keys_2.setdefault(label['instance_id'], []).append(key)
 
-        # IoUを計算
-        if bboxes_tensor_1.size(0) > 0 and bboxes_tensor_2.size(0) > 0:
-            ious = box_iou(bboxes_tensor_1, bboxes_tensor_2)
+        # IoUを計算（ボックス数が少ないため numpy で計算する）
+        if len(bboxes_1) > 0 and len(bboxes_2) > 0:
+            ious = box_iou(bboxes_1, bboxes_2)
 
             # IoUが閾値以上のペアを見つける
-            matching_pairs = torch.nonzero(ious >= iou_threshold, as_tuple=False)
-            # print(matching_pairs)
+            pairs = matching_pairs(ious, iou_threshold)
+            # print(pairs)
 
             # マッチしたペアのインスタンスIDを反映
-            for idx_pair in matching_pairs:
-                idx_1 = idx_pair[0].item()  # merge_json_1のインデックス
-                idx_2 = idx_pair[1].item()  # merge_json_2のインデックス
-
+            for idx_1, idx_2 in pairs:
+                # idx_1: merge_json_1のインデックス, idx_2: merge_json_2のインデックス
                 # クラス名が一致するか確認
                 if class_names_1[idx_1] == class_names_2[idx_2]:
                     # 1つ目のmerge_jsonのinstance_idを2つ目に反映
@@ -126,16 +125,19 @@ def update_instance_ids_based_on_iou(former_merge_folder, merge_folder, iou_thre
                     new_instance_id = instance_ids_1[idx_1]
                     new_camera_id = update_camera_id_1[idx_1]
 
-                    # 2つ目のmerge_jsonのラベルに反映
-                    for key, label in labels_2.items():
-                        if label['instance_id'] == old_instance_id_2:
-                            label['instance_id'] = new_instance_id
-                            if (old_instance_id_2, new_instance_id) not in instance_list and old_instance_id_2 != new_instance_id:
-                                if "cc_id" in str(old_instance_id_2) and "cc_id" not in str(new_instance_id):
-                                    if (new_instance_id, old_instance_id_2) not in reversed_instance_list:
-                                        reversed_instance_list.append((new_instance_id, old_instance_id_2))
-                                else:
-                                    instance_list.append((old_instance_id_2, (new_instance_id, new_camera_id)))
+                    # 2つ目のmerge_jsonで、現在 old_instance_id_2 のラベルに反映
+                    keys = label_keys_2.pop(old_instance_id_2, [])
+                    if not keys:
+                        continue
+                    label_keys_2.setdefault(new_instance_id, []).extend(keys)
+                    for key in keys:
+                        labels_2[key]['instance_id'] = new_instance_id
+                    if old_instance_id_2 != new_instance_id:
+                        # 同じ旧IDに対しては最初に見つかった引継ぎ先を使用する
+                        if "cc_id" in str(old_instance_id_2) and "cc_id" not in str(new_instance_id):
+                            reversed_instance_mapping.setdefault(new_instance_id, old_instance_id_2)
+                        else:
+                            instance_mapping.setdefault(old_instance_id_2, (new_instance_id, new_camera_id))
 
         # 2つ目のmerge_jsonを上書き保存
         # with open(merge_folder + '/' + file, 'w') as f:
@@ -149,6 +151,21 @@ def update_instance_ids_based_on_iou(former_merge_folder, merge_folder, iou_thre
     #         if os.path.isfile(file_path):  # ファイルかどうか確認
     #             os.remove(file_path)  # ファイルを削除
 
+def resolve_instance_mapping(mapping):
+    """
+    {旧ID: (新ID, カメラID)} の引継ぎを推移的に解決します（例: a→b, b→c の場合は a→c）。
+    循環している場合は、循環に入る直前の引継ぎ先で止めます。
+    """
+    resolved = {}
+    for old_id in mapping:
+        visited = {old_id}
+        target = mapping[old_id]
+        while target[0] in mapping and target[0] not in visited:
+            visited.add(target[0])
+            target = mapping[target[0]]
+        resolved[old_id] = target
+    return resolved
+
 def get_merge_json(folder_path, start_file):
     """
     指定されたフォルダ内のファイル一覧から、特定のファイル以降のファイル名をリストで返す関数。
@@ -207,81 +224,62 @@ def reversed_get_merge_json(folder_path, start_file):
 
 def merge_json_correct(files, reversed_files, camera_id):
     """動画ごとのmerge_jsonを更新し、更新後データを使用して動画を再作成する。"""
-    last_folder_name=""
-    if instance_list != []:
-        for file in files:
-            with open(os.path.join(merge_folder, file), 'r') as f:
-                merge_data = json.load(f)
+    # DBに反映するカメレオンコードの更新 (ccid, log_datetime, TID, camera_id)
+    pending_updates = []
+    # 画像を書き換えたフォルダの動画は、with を抜けるときにまとめて作成する
+    with MovieRenderScheduler(movie_create, window=None) as render_scheduler:
+        if instance_mapping:
+            """
+            例)instance_mappingの中身
+            {old_instance_id: (new_instance_id, new_camera_id)}
+            """
+            resolved_mapping = resolve_instance_mapping(instance_mapping)
+            for file in files:
+                merge_data = read_labels(os.path.join(merge_folder, file))
                 labels = merge_data.get('labels', {})
                 for key, label in labels.items():
-                    for item in instance_list:
-                        """
-                        例)instance_listの中身
-                        old_instance_id
-                        (new_instance_id, new_camera_id)
-                        """
-                        if label['instance_id'] == item[0]:
-                            label['instance_id'] = item[1][0]
-                            label['update_camera_id'] = item[1][1]
-                            break
-            with open(os.path.join(merge_folder, file), 'w') as f:
-                json.dump(merge_data, f, ensure_ascii=False, indent=4)
-
-    #HACK 名前辞書読込 2024/11/15 torisato(削除予定)
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    #HACK　日本語フォント　2024/11/15 torisato(削除予定)
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
-    if reversed_instance_list != []:
-        for file in reversed_files:
-            id_lists=[]
-            with open(os.path.join(merge_folder, file), 'r') as f:
-                merge_data = json.load(f)
+                    item = resolved_mapping.get(label['instance_id'])
+                    if item is not None:
+                        label['instance_id'] = item[0]
+                        label['update_camera_id'] = item[1]
+                write_labels(os.path.join(merge_folder, file), merge_data)
+
+        if reversed_instance_mapping:
+            for file in reversed_files:
+                id_lists=[]
+                merge_data = read_labels(os.path.join(merge_folder, file))
                 labels = merge_data.get('labels', {})
                 for key, label in labels.items():
-                    for item in reversed_instance_list:
-                        #print(instance_list)
-                        TID = item[0]
-                        ccid = int(str(item[1]).replace("cc_id", ""))
-                        if label['instance_id'] == TID:
-                            log_time = convert_filename_to_time_format(file)
-                            # update_data(int(str(item[1]).replace("cc_id", "")), log_time, int(item[0]), camera_id)
-                            update_data(ccid, log_time, int(TID), camera_id)
-                            #例)root_folder = 1/MOVIE_FOLDER/20250528    target_folder = 134917000.jpg
-                            root_folder, target_file_name = get_day_and_timestamp(file)
-                            #例)image_file = 1/MOVIE_FOLDER/20250528\134850000/134917200.jpg
-                            image_file, current_folder_name = find_file(root_folder, target_file_name)
-
-                            # 画像を読み込む
-                            if image_file != None:
-                                image = cv2.imread(image_file)
-                                # ccid = int(str(item[1]).replace("cc_id", ""))
-                                cc = next((item for item in cc_name_dict if item['ccid'] == str(ccid)), None)
-                                text = cc['name']
-                                #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-                                image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-                                #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-                                draw = ImageDraw.Draw(image_pil)
-
-                                # 画像にテキストを描画
-                                if TID not in id_lists:
-                                    draw.text((label['x1'], int((label['y1']+label['y2'])/2-40)), text, font=font, fill=(0, 255, 0))
-                                    # Pillow形式からcv2形式に戻す
-                                    image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
-                                # image = cv2.putText(image, str(item[1]), (label['x1'], int((label['y1']+label['y2'])/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-                                    cv2.imwrite(image_file,image)
-                                    id_lists.append(TID)
-                                if last_folder_name != current_folder_name and last_folder_name != "":
-                                    movie_create(last_folder_name)
-                                last_folder_name = current_folder_name
-                            label['instance_id'] = item[1]
-                            break
-            with open(os.path.join(merge_folder, file), 'w') as f:
-                json.dump(merge_data, f, ensure_ascii=False, indent=4)
-        if last_folder_name != "":
-            movie_create(last_folder_name)
+                    #print(reversed_instance_mapping)
+                    TID = label['instance_id']
+                    if TID not in reversed_instance_mapping:
+                        continue
+                    item = (TID, reversed_instance_mapping[TID])
+                    ccid = int(str(item[1]).replace("cc_id", ""))
+                    log_time = convert_filename_to_time_format(file)
+                    # update_data(int(str(item[1]).replace("cc_id", "")), log_time, int(item[0]), camera_id)
+                    # DBの更新はまとめて最後に1回で行う
+                    pending_updates.append((ccid, log_time, int(TID), camera_id))
+                    #例)root_folder = 1/MOVIE_FOLDER/20250528    target_folder = 134917000.jpg
+                    root_folder, target_file_name = get_day_and_timestamp(file)
+                    #例)image_file = 1/MOVIE_FOLDER/20250528\134850000/134917200.jpg
+                    image_file, current_folder_name = find_file(root_folder, target_file_name)
+
+                    # 画像を読み込む
+                    if image_file != None:
+                        # 画像にテキストを描画
+                        if TID not in id_lists:
+                            image = cv2.imread(image_file)
+                            text = get_cc_name(ccid)
+                            draw_text(image, (label['x1'], int((label['y1']+label['y2'])/2-40)), text, fill=(0, 255, 0))
+                        # image = cv2.putText(image, str(item[1]), (label['x1'], int((label['y1']+label['y2'])/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
+                            cv2.imwrite(image_file,image)
+                            id_lists.append(TID)
+                        # 同じフォルダへの要求はまとめて、動画は後でバックグラウンドで作成する
+                        render_scheduler.request(current_folder_name)
+                    label['instance_id'] = item[1]
+                write_labels(os.path.join(merge_folder, file), merge_data)
+    update_data_bulk(pending_updates)
 
 def get_firstfile(former_merged_json_folder):
     """指定フォルダから最初のファイルを取得する"""
@@ -386,6 +384,46 @@ def update_data(ccid, log_datetime, TID, camera_id):
         db.close()
         connection.close()
 
+def update_data_bulk(updates, chunk_size=500):
+    """
+    `update_data` をまとめて実行します。
+
+    更新内容を一時テーブルに一括で登録し、`cclog_db.logs` と結合した1回の UPDATE で反映します。
+    プールの接続1つを使用し、1トランザクションで実行します（一時的なエラーの場合は再試行）。
+    同じ (log_datetime, TID, camera_id) に複数の更新がある場合は、最後のものを反映します（逐次実行と同じ結果）。
+
+    引数:
+        updates (list[tuple]): (ccid, log_datetime, TID, camera_id) のリスト。
+        chunk_size (int): 一時テーブルに1回で登録する行数。
+    """
+    latest = {}
+    for ccid, log_datetime, TID, camera_id in updates:
+        latest[(log_datetime, TID, camera_id)] = ccid
+    if not latest:
+        return
+    rows = [(ccid, log_datetime, TID, camera_id) for (log_datetime, TID, camera_id), ccid in latest.items()]
+
+    def apply(connection, db):
+        # 列の型は logs テーブルと同じにする
+        db.execute("DROP TEMPORARY TABLE IF EXISTS tmp_chameleon_code_updates;")
+        db.execute("CREATE TEMPORARY TABLE tmp_chameleon_code_updates AS "
+                   "SELECT chameleon_code, log_datetime, TID, camera_id FROM cclog_db.logs LIMIT 0;")
+        for start in range(0, len(rows), chunk_size):
+            db.executemany("INSERT INTO tmp_chameleon_code_updates (chameleon_code, log_datetime, TID, camera_id) "
+                           "VALUES (%s, %s, %s, %s);", rows[start:start + chunk_size])
+        db.execute("UPDATE cclog_db.logs AS l JOIN tmp_chameleon_code_updates AS t "
+                   "ON l.log_datetime = t.log_datetime AND l.TID = t.TID AND l.camera_id = t.camera_id "
+                   "SET l.chameleon_code = t.chameleon_code;")
+        updated = db.rowcount
+        db.execute("DROP TEMPORARY TABLE tmp_chameleon_code_updates;")
+        return updated
+
+    try:
+        updated = run_in_transaction(apply)
+        print(f"chameleon_code updated: {updated} rows ({len(rows)} requests)")
+    except mysql.connector.Error as e:
+        print(e)
+
 def get_day_and_timestamp(filename):
     """
     指定されたファイル名から9桁の数値を抽出し、それをもとに保存先ディレクトリパスと
@@ -416,30 +454,13 @@ def get_day_and_timestamp(filename):
     return os.path.join(camera_id, "MOVIE_FOLDER", formatted_date), str(number)+".jpg"
 
 def find_file(root_folder, target_file_name):
-    """指定したフォルダ内の全てのサブフォルダを再帰的に検索"""
-    for root, dirs, files in os.walk(root_folder):
-        if target_file_name in files:
-            return os.path.join(root, target_file_name) , root
-    return None
+    """日付フォルダのインデックスから画像を検索（見つからない場合は (None, None)）"""
+    return find_frame(root_folder, target_file_name)
 
 def movie_create(root_folder):
     """更新後の動画を作成する。"""
-    output2_video_path = os.path.join(root_folder,"output2.mp4")
-    # 同名のMP4ファイルが存在する場合は削除
-    if os.path.exists(output2_video_path):
-        os.remove(output2_video_path)  # 既存のファイルを削除
-
-    # 動画作成のための VideoWriter オブジェクトを作成
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # mp4形式で保存
-    video = cv2.VideoWriter(output2_video_path, fourcc, 5.0, (1920, 1080))
-    # 指定されたディレクトリ内のすべてのファイルを取得
-    files = os.listdir(root_folder)
-
-    # .jpg拡張子のファイルのみをリストアップ
-    jpg_files = [file for file in files if file.lower().endswith('.jpg')]
-    for file in jpg_files:
-        image = cv2.imread(os.path.join(root_folder, file))
-        video.write(image)  # 動画ファイルに書き込み
+    # 画像が前回の作成時から変わっていない場合は作成しない
+    return encode_folder(root_folder)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Merged_json Merge')
@@ -459,11 +480,11 @@ if __name__ == '__main__':
     #former_merge_folderに入っている一番最初のファイルを取得
     former_merge_folder_firstfile = get_firstfile(former_merge_folder)
 
-    #動画間引継ぎ用のリスト
-    instance_list=[]
+    #動画間引継ぎ用の辞書 {old_instance_id: (new_instance_id, new_camera_id)}
+    instance_mapping={}
 
-    #動画間の途中でカメレオンコードが読み込まれたときのリスト
-    reversed_instance_list=[]
+    #動画間の途中でカメレオンコードが読み込まれたときの辞書 {TID: ccid}
+    reversed_instance_mapping={}
 
     update_instance_ids_based_on_iou(former_merge_folder, merge_folder)
 
@@ -475,8 +496,8 @@ if __name__ == '__main__':
 
     merge_json_correct(files, reversed_files, camera_id)
 
-    # print(instance_list)
-    # print(reversed_instance_list)
+    # print(instance_mapping)
+    # print(reversed_instance_mapping)
 
     copy_merged_json(args.merge_dir, args.former_merge_dir, args.frame_count)
-
+    print(format_io_stats("merge_json_merge"))
@@ -5,10 +5,12 @@ merge_segment.py
 
 ## 主な処理内容:
 1. 各セグメントディレクトリ（segment_0, segment_1, ...）から `corrected_jsons` フォルダ内のファイルを収集。
-2. 同一ファイル名を持つ複数の JSON ファイル間でオブジェクトのバウンディングボックスを比較し、`IoU` が 1.0 以上かつクラス名が一致する場合に `instance_id` を統一。
-3. 統一した `instance_id` を元にマージし、`merge_dir` に保存。
-4. 残された単一セグメントのファイルについても、IoU による ID 統合を行う。
-5. 統一された ID で最後に `merge_dir` 内の最新 `duration` 件のファイルを更新。
+2. 同一ファイル名を持つ複数の JSON ファイル間でバウンディングボックスとクラス名が完全に一致する（IoU = 1）ラベルを
+   同一オブジェクトとみなし、(セグメント番号, instance_id) を素集合（Union-Find）で統合する（共有フレームを1回ずつ走査）。
+3. 各グループの代表ID（cc_id を優先、なければ最小の整数ID）で全ファイルの `instance_id` を更新し、`merge_dir` に1回ずつ保存。
+4. `merge_dir` 内の最新 `duration` 件のファイルからは 0 座標のラベルを削除。
+5. 各入力ファイルは1回だけ読み込み、各出力ファイルは1回だけ（utils3.label_io のコンパクトな形式で）書き込む。
+   読み書きしたファイル数・バイト数を最後に表示する。
 
 ## 使用方法:
 ```bash
@@ -28,8 +30,8 @@ python merge_segment.py
     --duration: マージされた JSON のうち ID 統一対象とするフレーム数（デフォルト: 100）
 
 注意:
-- IoU による一致判定には torchvision.ops.box_iou を使用。
-- instance_id_mapping により複数セグメントに跨る ID の一貫性を担保。
+- 一致判定はボックス座標とクラス名をキーとした辞書で行うため、ラベル数に比例した時間で処理する。
+- 素集合により複数セグメントに跨る ID の一貫性を担保（統合の順序によらず代表IDは一意に決まる）。
 - 0座標のバウンディングボックスや不正なデータはスキップまたは削除対象。
 
 作成日：2025年5月
@@ -37,347 +39,139 @@ python merge_segment.py
 """
 
 import os
-import json
 import argparse
 import shutil
-import torch
-from torchvision.ops import box_iou
+
+from utils3.union_find import UnionFind
+from utils3.label_io import read_labels, write_labels, io_stats, format_io_stats
+
+def has_valid_box(label):
+    """
+    バウンディングボックスの座標がすべて0以外かどうかを判定します（0座標のボックスは照合に使用しない）。
+    """
+    return label['x1']!=0 and label['y1']!=0 and label['x2']!=0 and label['y2']!=0
+
+def is_zero_box(label):
+    """
+    バウンディングボックスの座標がすべて0かどうかを判定します。
+    """
+    return label['x1']==0 and label['y1']==0 and label['x2']==0 and label['y2']==0
 
 def unify_instance_ids(base_dir, merge_dir,duration):
     """
     各セグメントフォルダ内のJSONファイルの 'instance_id' を統一し、順番にマージしていきます。
     同じファイル名が存在しない場合は、無条件で 'merge_dir' にコピーします。
 
+    複数のセグメントに存在するファイルで、バウンディングボックスが完全に一致し（IoU = 1）クラス名も
+    一致するラベルを同一オブジェクトとみなし、(セグメント番号, instance_id) を素集合（Union-Find）で統合します。
+    各グループの代表IDは、CCIDによる文字列のID（cc_id...）を優先し、なければ最小の整数IDとします。
+
     :param base_dir: セグメントフォルダが存在するベースディレクトリ
     :param merge_dir: マージ結果を保存するディレクトリ
+    :param duration: 0座標のラベルを削除する対象とする、merge_dir 内（前のバッチのファイルを含む）の最新のファイル数
+    :return: 読み書きしたファイル数・バイト数
     """
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
     # セグメントフォルダの一覧を取得し、フォルダ名でソート
     segment_dirs = [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
     segment_dirs.sort(key=lambda x: int(x.split('_')[-1]))  # 'segment_0', 'segment_1', ...
 
-    # 各セグメントのファイル名の集合を取得
-    segment_files = {}
+    # ファイル名ごとに、存在するセグメントのリストを作成
+    file_segments = {}  # {filename: [segment indices]}
     for idx, segment_dir in enumerate(segment_dirs):
         corrected_jsons_path = os.path.join(base_dir, segment_dir, 'corrected_jsons')
         if not os.path.exists(corrected_jsons_path):
             # print(f"'corrected_jsons' ディレクトリが見つかりません: {corrected_jsons_path}")
             continue
-        files = set(os.listdir(corrected_jsons_path))
-        segment_files[idx] = files
-
-    # すべてのファイル名の集合を取得
-    all_files = set()
-    for files in segment_files.values():
-        all_files.update(files)
+        for filename in os.listdir(corrected_jsons_path):
+            file_segments.setdefault(filename, []).append(idx)
     # ファイル名を昇順にソート
-    all_files = sorted(all_files)
-
-    # ファイル名ごとに、存在するセグメントのリストを作成
-    file_segments = {}  # {filename: [segment indices]}
-    for filename in all_files:
-        file_segments[filename] = []
-        for idx, files in segment_files.items():
-            if filename in files:
-                file_segments[filename].append(idx)
+    all_files = sorted(file_segments)
 
     os.makedirs(merge_dir, exist_ok=True)
 
-    # インスタンスIDのマッピングを初期化
-    instance_id_mapping = {}  # {('segment_index', old_instance_id): unified_instance_id}
+    # 各入力は1回だけ読み込み、各出力は1回だけ書き込む（読み書きしたバイト数は label_io.io_stats に集計）
+    def load(seg_idx, filename):
+        corrected_jsons_path = os.path.join(base_dir, segment_dirs[seg_idx], 'corrected_jsons')
+        return read_labels(os.path.join(corrected_jsons_path, filename))
+
+    def save(filename, data):
+        # コンパクトな形式（LABEL_FORMAT）で保存する
+        write_labels(os.path.join(merge_dir, filename), data)
 
-    # 各ファイルを処理
+    # 1. 複数のセグメントに存在するファイルを1回ずつ読み込み、同一オブジェクトのIDを統合する
+    #    {(セグメント番号, instance_id)} をノードとする素集合
+    instance_ids = UnionFind()
+    shared_data = {}  # {filename: {seg_idx: data}}
     for filename in all_files:
         segments_with_file = file_segments[filename]
-        # ファイルが複数のセグメントに存在する場合
-        if len(segments_with_file) > 1:
-            # 各セグメントからデータを読み込み
-            data_segments = {}
-            labels_segments = {}
-            bboxes_segments = {}
-            instance_ids_segments = {}
-            class_names_segments = {}
-            label_keys_segments = {}  # 修正：ラベルキーを保持
+        if len(segments_with_file) < 2:
+            continue
+        data_segments = {seg_idx: load(seg_idx, filename) for seg_idx in segments_with_file}
+        shared_data[filename] = data_segments
+
+        # (クラス名, x1, y1, x2, y2) が一致するラベルを同一オブジェクトとして統合する
+        first_node = {}
+        for seg_idx, data in data_segments.items():
+            for label in data.get('labels', {}).values():
+                if not has_valid_box(label):
+                    continue
+                node = (seg_idx, label.get('former_instance_id', label['instance_id']))
+                box_key = (label['class_name'], label['x1'], label['y1'], label['x2'], label['y2'])
+                other = first_node.setdefault(box_key, node)
+                if other[0] != seg_idx:
+                    instance_ids.union(other, node)
+
+    def unified(seg_idx, label):
+        label['former_instance_id'] = label.get('former_instance_id', label['instance_id'])
+        label['instance_id'] = instance_ids.find((seg_idx, label['former_instance_id']))[1]
+
+    # 2. 統合後のIDで各ファイルを1回ずつ書き出す
+    #    merge_dir 全体（前のバッチのファイルを含む）の最新 duration 件のファイルでは、0座標のラベルを削除する
+    merge_files = sorted(set(os.listdir(merge_dir)) | set(all_files))
+    num_files_to_clean = min(duration, len(merge_files))
+    files_to_clean = set(merge_files[len(merge_files) - num_files_to_clean:])
+    for filename in all_files:
+        segments_with_file = file_segments[filename]
+        if filename in shared_data:
+            # 各セグメントのラベルをマージ（メタデータは最後のセグメントのものを使用）
+            data_segments = shared_data.pop(filename)
+            merged_labels = {}
+            label_counter = 1
             for seg_idx in segments_with_file:
-                segment_dir = segment_dirs[seg_idx]
-                corrected_jsons_path = os.path.join(base_dir, segment_dir, 'corrected_jsons')
-                with open(os.path.join(corrected_jsons_path, filename), 'r') as f:
-                    data = json.load(f)
-                    data_segments[seg_idx] = data
-                    labels = data.get('labels', {})
-                    labels_segments[seg_idx] = labels
-                    bboxes = []
-                    instance_ids = []
-                    class_names = []
-                    label_keys = []  # 修正：ラベルキーを保持
-                    for key, label in labels.items():
-                        if label['x1']!=0 and label['y1']!=0 and label['x2']!=0 and label['y2']!=0:
-                            bbox = [label['x1'], label['y1'], label['x2'], label['y2']]
-                            bboxes.append(bbox)
-                            instance_ids.append(label['instance_id'])
-                            class_names.append(label['class_name'])
-                            label_keys.append(key)  # 修正：ラベルキーを追加
-                    # # バウンディングボックスをテンソルに変換
-                    # if bboxes:
-                    #     bboxes_tensor = torch.tensor(bboxes, dtype=torch.float32, device=device)
-                    #     # 同じファイル内でIoUを計算
-                    #     ious = box_iou(bboxes_tensor, bboxes_tensor)
-                    #     iou_threshold = 0.6
-                    #     num_labels = len(bboxes)
-                    #     for i in range(num_labels):
-                    #         label_i_key = label_keys[i]
-                    #         label_i = labels[label_i_key]
-                    #         label_i['former_instance_id'] = label_i.get('former_instance_id', label_i['instance_id'])
-                    #         old_id_i = label_i['former_instance_id']
-                    #         for j in range(i+1, num_labels):
-                    #             if ious[i, j] >= iou_threshold and class_names[i] == class_names[j]:
-                    #                 label_j_key = label_keys[j]
-                    #                 label_j = labels[label_j_key]
-                    #                 label_j['former_instance_id'] = label_j.get('former_instance_id', label_j['instance_id'])
-                    #                 old_id_j = label_j['former_instance_id']
-                    #                 if old_id_i == old_id_j:
-                    #                     # instance_idを統一
-                    #                     key_i = (seg_idx, old_id_i)
-                    #                     unified_id = instance_id_mapping.get(key_i, label_i['instance_id'])
-                    #                     label_i['instance_id'] = unified_id
-                    #                     label_j['instance_id'] = unified_id
-                    #                     # マッピングを更新
-                    #                     instance_id_mapping[(seg_idx, old_id_i)] = unified_id
-                    #                     instance_id_mapping[(seg_idx, old_id_j)] = unified_id
-                    bboxes_segments[seg_idx] = bboxes
-                    instance_ids_segments[seg_idx] = instance_ids
-                    class_names_segments[seg_idx] = class_names
-                    label_keys_segments[seg_idx] = label_keys  # 修正：ラベルキーを保存
-
-            for idx in range(len(segments_with_file)):
-            # for idx in range(len(segments_with_file) - 1, -1, -1):
-                # 最初のセグメントを基準にする
-                base_seg_idx = segments_with_file[idx]
-                base_bboxes = bboxes_segments[base_seg_idx]
-                base_instance_ids = instance_ids_segments[base_seg_idx]
-                base_class_names = class_names_segments[base_seg_idx]
-                base_label_keys = label_keys_segments[base_seg_idx]  # 修正：ラベルキーを取得
-
-                # バウンディングボックスをテンソルに変換
-                base_bboxes_tensor = torch.tensor(base_bboxes, dtype=torch.float32, device=device)
-                exclude_item = idx
-
-                # idx以外を抽出
-                filtered_list = [item for item in segments_with_file if item != exclude_item]
-
-                # print(f"base_bboxes{base_bboxes}")
-
-                # 他のセグメントと比較
-                # for other_seg_idx in segments_with_file[idx+1:]:
-                for other_seg_idx in filtered_list:
-                    other_bboxes = bboxes_segments[other_seg_idx]
-                    other_instance_ids = instance_ids_segments[other_seg_idx]
-                    other_class_names = class_names_segments[other_seg_idx]
-                    other_label_keys = label_keys_segments[other_seg_idx]  # 修正：ラベルキーを取得
-
-                    other_bboxes_tensor = torch.tensor(other_bboxes, dtype=torch.float32, device=device)
-
-                    # IoUを計算
-                    if base_bboxes_tensor.size(0) > 0 and other_bboxes_tensor.size(0) > 0:
-                        ious = box_iou(base_bboxes_tensor, other_bboxes_tensor)
-                        # print(ious)
-                        iou_threshold = 1
-                        matching_pairs = torch.nonzero(ious >= iou_threshold, as_tuple=False)
-                        # print(matching_pairs)
-                        # print(base_bboxes_tensor,other_bboxes_tensor)
-
-                        for idx_pair in matching_pairs:
-                            base_idx = idx_pair[0].item()
-                            other_idx = idx_pair[1].item()
-                            if base_class_names[base_idx] == other_class_names[other_idx]:
-                                base_id = base_instance_ids[base_idx]
-                                other_id = other_instance_ids[other_idx]
-
-                                base_label_key = base_label_keys[base_idx]  # ラベルキーを使用
-                                other_label_key = other_label_keys[other_idx]  # ラベルキーを使用
-
-                                # former_instance_idを追加
-                                labels_segments[base_seg_idx][base_label_key]['former_instance_id'] = base_id
-                                labels_segments[other_seg_idx][other_label_key]['former_instance_id'] = other_id
-
-                                # 既存のマッピングを確認
-                                unified_id_base = instance_id_mapping.get((base_seg_idx, base_id), base_id)
-                                unified_id_other = instance_id_mapping.get((other_seg_idx, other_id), other_id)
-
-                                if isinstance(unified_id_base, int) and isinstance(unified_id_other, int):
-                                    # 一貫性を保つため、すでにマッピングされているIDを優先
-                                    unified_id = min(unified_id_base, unified_id_other)  # 小さい方を選択して統一
-                                elif isinstance(unified_id_base, str):
-                                    unified_id = unified_id_base
-                                elif isinstance(unified_id_other, str):
-                                    unified_id = unified_id_other
-
-                                # 新しいマッピングを追加（既存のものを上書きしない）
-                                if (base_seg_idx, base_id) not in instance_id_mapping:
-                                    instance_id_mapping[(base_seg_idx, base_id)] = unified_id
-                                else:
-                                    if isinstance(unified_id, int):
-                                        # print(f"instance_id_mapping[(base_seg_idx, base_id)]{instance_id_mapping[(base_seg_idx, base_id)]}")
-                                        if instance_id_mapping[(base_seg_idx, base_id)] > unified_id:
-                                            instance_id_mapping[(base_seg_idx, base_id)]=unified_id
-                                    else:
-                                        instance_id_mapping[(base_seg_idx, base_id)]=unified_id
-
-                                if (other_seg_idx, other_id) not in instance_id_mapping:
-                                    instance_id_mapping[(other_seg_idx, other_id)] = unified_id
-                                else:
-                                    if isinstance(unified_id, int):
-                                        # print(f"instance_id_mapping[(other_seg_idx, other_id)]{instance_id_mapping[(other_seg_idx, other_id)]}")
-                                        if instance_id_mapping[(other_seg_idx, other_id)] > unified_id:
-                                            instance_id_mapping[(other_seg_idx, other_id)]=unified_id
-                                    else:
-                                        instance_id_mapping[(other_seg_idx, other_id)]=unified_id
-
-                                # instance_idを更新
-                                labels_segments[base_seg_idx][base_label_key]['instance_id'] = unified_id
-                                labels_segments[other_seg_idx][other_label_key]['instance_id'] = unified_id
-
-                # マージしたラベルを作成
-                merged_labels = {}
-                label_counter = 1
-                for seg_idx in segments_with_file:
-                    labels = labels_segments[seg_idx]
-                    for key in labels:
-                        label = labels[key]
-                        if 'former_instance_id' not in label:
-                            label['former_instance_id'] = label['instance_id']
-                            key_mapping = (seg_idx, label['instance_id'])
-                            label['instance_id'] = instance_id_mapping.get(key_mapping, label['instance_id'])
-                        merged_labels[str(label_counter)] = label
-                        label_counter +=1
-
-                # マージされたデータを保存
-                merged_data = data_segments[base_seg_idx]
-                merged_data['labels'] = merged_labels
-                with open(os.path.join(merge_dir, filename), 'w') as f:
-                    json.dump(merged_data, f, ensure_ascii=False, indent=4)
-
+                for label in data_segments[seg_idx].get('labels', {}).values():
+                    unified(seg_idx, label)
+                    merged_labels[str(label_counter)] = label
+                    label_counter +=1
+            data = data_segments[segments_with_file[-1]]
+            data['labels'] = merged_labels
         else:
             # ファイルが一つのセグメントにのみ存在する場合
             seg_idx = segments_with_file[0]
-            segment_dir = segment_dirs[seg_idx]
-            corrected_jsons_path = os.path.join(base_dir, segment_dir, 'corrected_jsons')
-            src_file = os.path.join(corrected_jsons_path, filename)
-            dst_file = os.path.join(merge_dir, filename)
-            shutil.copy2(src_file, dst_file)
-
-            # データを読み込み
-            with open(dst_file, 'r') as f:
-                data = json.load(f)
-
-            labels = data.get('labels', {})
-            bboxes = []
-            instance_ids = []
-            class_names = []
-            label_keys = []
-            for key, label in labels.items():
-                if label['x1']!=0 and label['y1']!=0 and label['x2']!=0 and label['y2']!=0:
-                    bbox = [label['x1'], label['y1'], label['x2'], label['y2']]
-                    bboxes.append(bbox)
-                    instance_ids.append(label['instance_id'])
-                    class_names.append(label['class_name'])
-                    label_keys.append(key)
-
-            # バウンディングボックスをテンソルに変換
-            if bboxes:
-                bboxes_tensor = torch.tensor(bboxes, dtype=torch.float32, device=device)
-                # 同じファイル内でIoUを計算
-                ious = box_iou(bboxes_tensor, bboxes_tensor)
-                iou_threshold = 0.8
-                num_labels = len(bboxes)
-                for i in range(num_labels):
-                    label_i_key = label_keys[i]
-                    label_i = labels[label_i_key]
-                    label_i['former_instance_id'] = label_i.get('former_instance_id', label_i['instance_id'])
-                    old_id_i = label_i['former_instance_id']
-                    label_i['update_camera_id'] = 0
-                    for j in range(i+1, num_labels):
-                        if ious[i, j] >= iou_threshold and class_names[i] == class_names[j]:
-                            label_j_key = label_keys[j]
-                            label_j = labels[label_j_key]
-                            label_j['former_instance_id'] = label_j.get('former_instance_id', label_j['instance_id'])
-                            old_id_j = label_j['former_instance_id']
-                            label_j['update_camera_id'] = 0
-                            if old_id_i == old_id_j:
-                                # instance_idを統一
-                                key_i = (seg_idx, old_id_i)
-                                unified_id = instance_id_mapping.get(key_i, label_i['instance_id'])
-                                label_i['instance_id'] = unified_id
-                                label_j['instance_id'] = unified_id
-                                # マッピングを更新
-                                instance_id_mapping[(seg_idx, old_id_i)] = unified_id
-                                instance_id_mapping[(seg_idx, old_id_j)] = unified_id
-
-            # instance_idをグローバルマッピングで更新
-            updated = False
-            for key in labels:
-                label = labels[key]
-                old_id = label['instance_id']
-                label['former_instance_id'] = label.get('former_instance_id', old_id)
+            data = load(seg_idx, filename)
+            for label in data.get('labels', {}).values():
+                unified(seg_idx, label)
                 label['update_camera_id'] = 0
-                key_mapping = (seg_idx, label['former_instance_id'])
-                if key_mapping in instance_id_mapping:
-                    unified_id = instance_id_mapping[key_mapping]
-                    if unified_id != old_id:
-                        label['instance_id'] = unified_id
-                        updated = True
-
-            # 更新されたデータを保存
-            with open(dst_file, 'w') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-        # print(instance_id_mapping,filename)
-    
-    # フォルダ内のファイル一覧を取得し、ソート
-    files = sorted(os.listdir(merge_dir))
-
-    #更新したいmerged_jsonの数を取得
-    num_files_to_copy = min(duration, len(files))
 
-    #更新するmerged_jsonを取得
-    files_to_copy = files[-num_files_to_copy:]
+        if filename in files_to_clean:
+            labels = data.get('labels', {})
+            for key in [key for key, label in labels.items() if is_zero_box(label)]:
+                del labels[key]
 
-    # print(f"num_files_to_copy{num_files_to_copy}")
-    # print(files_to_copy)
-    # print(instance_id_mapping)
+        save(filename, data)
 
-    # マージディレクトリ内のすべてのファイルの instance_id を最終更新
-    for json_file in files_to_copy:
-        file_path = os.path.join(merge_dir, json_file)
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+    # 3. 今回のセグメントにない前のバッチのファイルも、0座標のラベルがあれば削除して保存し直す
+    for filename in sorted(files_to_clean.difference(all_files)):
+        file_path = os.path.join(merge_dir, filename)
+        data = read_labels(file_path)
         labels = data.get('labels', {})
-        keys_to_delete = []
-        updated = False
-        for key in labels:
-            label = labels[key]
-            if label['x1']==0 and label['y1']==0 and label['x2']==0 and label['y2']==0:
-                keys_to_delete.append(key)
-            old_id = label['instance_id']
-            label['former_instance_id'] = label.get('former_instance_id', old_id)
-            # 全セグメントを探索
-            for seg_idx in range(len(segment_dirs)):
-                key_mapping = (seg_idx, label['former_instance_id'])
-                if key_mapping in instance_id_mapping:
-                    unified_id = instance_id_mapping[key_mapping]
-                    if unified_id != old_id:
-                        label['instance_id'] = unified_id
-                        updated = True
-                        break
-        # # ラベルを削除
+        keys_to_delete = [key for key, label in labels.items() if is_zero_box(label)]
+        if not keys_to_delete:
+            continue
         for key in keys_to_delete:
             del labels[key]
-            if len(keys_to_delete)!=0:
-                updated=True
-        if updated:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            # print("update")
+        write_labels(file_path, data)
+
+    return dict(io_stats)
 
 # def copy_merged_json(merged_json_folder,former_merged_json_folder,frame_count):
 
@@ -411,6 +205,7 @@ def main():
     args = parser.parse_args()
 
     unify_instance_ids(args.base_dir, args.merge_dir,args.duration)
+    print(format_io_stats("merge_segment"))
 
     #copy_merged_json(args.merge_dir,args.former_merge_dir,args.frame_count)
 
@@ -0,0 +1,46 @@
+"""
+rebuild_movie_index.py
+
+MOVIE_FOLDER の日付フォルダの画像インデックス（frame_index.tsv）を作り直すスクリプト。
+
+主な機能:
+- 指定した日付フォルダ、または MOVIE_FOLDER 配下のすべての日付フォルダを走査し、
+  画像ファイル名 -> サブフォルダのインデックスを作成する
+- インデックス導入前に作成されたフォルダや、手作業で画像を移動・削除したフォルダに使用する
+
+使用方法:
+```bash
+python module/rebuild_movie_index.py --day_folder ./1/MOVIE_FOLDER/20250528
+python module/rebuild_movie_index.py --movie_folder ./1/MOVIE_FOLDER
+```
+
+引数:
+    --day_folder : インデックスを作り直す日付フォルダ
+    --movie_folder : 配下のすべての日付フォルダのインデックスを作り直す MOVIE_FOLDER
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import argparse
+
+from utils3.movie_index import get_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MOVIE_FOLDER の画像インデックスの再作成')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--day_folder', type=str, help='インデックスを作り直す日付フォルダ')
+    group.add_argument('--movie_folder', type=str, help='配下のすべての日付フォルダのインデックスを作り直す MOVIE_FOLDER')
+    args = parser.parse_args()
+
+    if args.day_folder:
+        day_folders = [args.day_folder]
+    else:
+        day_folders = sorted(os.path.join(args.movie_folder, name) for name in os.listdir(args.movie_folder)
+                             if os.path.isdir(os.path.join(args.movie_folder, name)))
+
+    for day_folder in day_folders:
+        num_frames = get_index(day_folder).rebuild()
+        print(f"{day_folder}: {num_frames} frames")
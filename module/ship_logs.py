@@ -0,0 +1,67 @@
+"""
+ship_logs.py
+
+create_db.py がローカルのバッファ（<camera_id>/log_buffer.sqlite3）に残した未送信の検出ログを、DBに送るスクリプト。
+
+主な機能:
+- DBの停止などで送れなかった行を、古い順にまとめて cclog_db.logs に登録する
+- --interval を指定した場合は、指定秒ごとにバッファを確認し続ける（バックグラウンドでの送信用）
+- --local_db を指定した場合は、DBの代わりにローカルの SQLite に登録する（動作確認用）
+
+使用方法:
+```bash
+python module/ship_logs.py --camera_id 1
+python module/ship_logs.py --camera_id 1 --camera_id 2 --interval 5
+```
+
+引数:
+    --camera_id : 送信するバッファのカメラID（複数指定可）
+    --batch_size : 1回に送る行数（デフォルト: 500）
+    --interval : 送信を繰り返す間隔（秒）。省略時は1回だけ送信して終了する
+    --local_db : DBの代わりに登録するローカルのSQLiteファイル
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import time
+import argparse
+
+from utils3.DB_serch_camera_conf_utils import async_config
+from utils3.log_buffer import LogBuffer, MySQLLogSink, SQLiteLogSink
+
+
+def ship_all(buffers, sink, batch_size):
+    """
+    全カメラのバッファの未送信の行を送ります。送れなかったバッファは次回に再送します。
+    """
+    for camera_id, log_buffer in buffers.items():
+        try:
+            shipped = log_buffer.ship(sink, batch_size=batch_size)
+            if shipped:
+                print(f"camera {camera_id}: {shipped} rows shipped")
+        except Exception as e:
+            print(f"camera {camera_id}: DBへの登録に失敗しました（{log_buffer.pending_count()} 行が未送信）: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='未送信の検出ログの送信')
+    parser.add_argument('--camera_id', type=str, action='append', required=True, help='送信するバッファのカメラID（複数指定可）')
+    parser.add_argument('--batch_size', type=int, default=500, help='1回に送る行数')
+    parser.add_argument('--interval', type=float, default=None, help='送信を繰り返す間隔（秒）')
+    parser.add_argument('--local_db', type=str, default=None, help='DBの代わりに登録するローカルのSQLiteファイル')
+    args = parser.parse_args()
+
+    buffers = {camera_id: LogBuffer.for_camera(camera_id) for camera_id in args.camera_id}
+    sink = SQLiteLogSink(args.local_db) if args.local_db else MySQLLogSink(async_config)
+    try:
+        ship_all(buffers, sink, args.batch_size)
+        while args.interval is not None:
+            time.sleep(args.interval)
+            ship_all(buffers, sink, args.batch_size)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        for log_buffer in buffers.values():
+            log_buffer.close()
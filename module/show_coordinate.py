@@ -7,9 +7,9 @@ import shutil
 from datetime import datetime
 from subprocess import Popen
 import json
-from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 from utils3.Camera_conf_utils import CAMERA_AREA, camera_list
+from utils3.annotation import get_cc_name, draw_text
 
 def open_new_window(button_texts, date_folder_path, folder_path):
     # 新しいウィンドウを作成
@@ -236,13 +236,6 @@ def create_mapping_image(records, folder_path,folder_list):
         shutil.rmtree(destination_folder)
     os.makedirs(destination_folder)
 
-    #HACK 名前辞書読込 2024/11/15 torisato(削除予定)
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    #HACK　日本語フォント　2024/11/15 torisato(削除予定)
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
-
     # for id, chameleon_code,camera_id, transform_center_x, transform_center_y, log_datetime, TID ,update_camera_id in records:
     for folder in folder_list:
         image_path= os.path.join(folder_path,folder)
@@ -290,8 +283,7 @@ def create_mapping_image(records, folder_path,folder_list):
 
                 #HACK　取得したIDに文字列"cc_id"が含まれているかチェックする 2024/11/15 torisato(削除予定)
                 if chameleon_code is not None:
-                    cc = next((item for item in cc_name_dict if item['ccid'] == str(chameleon_code)), None)
-                    chameleon_code = cc['name']
+                    chameleon_code = get_cc_name(chameleon_code)
 
                 # 秒数が不一致の場合、新しい画像を読み込む
                 if former_log_datetime is None or former_log_datetime != current_log_datetime:
@@ -316,19 +308,11 @@ def create_mapping_image(records, folder_path,folder_list):
                 # 一致している場合、同じ画像に〇を描く
                 cv2.circle(image, ( round(center_x / 10) * 10, round(center_y / 10) * 10), 50, (0, 0, 0), 3)
 
-                #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-                image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-                #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-                draw = ImageDraw.Draw(image_pil)
-
                 # 画像にテキストを描画
                 if text == chameleon_code:
-                    draw.text((round(center_x / 10) * 10 - 30, round(center_y / 10) * 10 - 30), text, font=font, fill=(0, 0, 0))
+                    draw_text(image, (round(center_x / 10) * 10 - 30, round(center_y / 10) * 10 - 30), text, fill=(0, 0, 0))
                 else:
-                    draw.text((round(center_x / 10) * 10 - 20, round(center_y / 10) * 10 - 30), text, font=font, fill=(0, 0, 0))
-                # Pillow形式からcv2形式に戻す
-                image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
+                    draw_text(image, (round(center_x / 10) * 10 - 20, round(center_y / 10) * 10 - 30), text, fill=(0, 0, 0))
 
                 # former_created を更新
                 former_log_datetime = current_log_datetime
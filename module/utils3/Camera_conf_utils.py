@@ -194,6 +194,31 @@ bbox_list={
     f'{camera2}': [[1360,237,1748,1035],[1544,2,1695,407],[0,122,249,862],[1478,150,1762,841]],
     # f'{camera5}': [[1046,160,1434,1080],[1047,16,1279,679],[339,19,584,786],[1066,29,1306,673]],
 }
+#推論対象の作業エリア[x1,y1,x2,y2]（Noneの場合はフルフレームで推論）
+#"area"の場合はCAMERA_CONFIGのarea_sizeの外接矩形をROI_MARGINだけ広げた範囲（area_roi）で推論
+#area_sizeはキャリブレーション用のマットの位置のため、作業エリア全体が含まれるかを確認してから設定すること
+ROI_LIST={
+    f'{camera1}': None,
+    f'{camera2}': None,
+    # f'{camera1}': [0,0,1920,1080],
+}
+#ROI_LISTが"area"の場合に、area_sizeの外接矩形を広げる幅（px）
+ROI_MARGIN = 300
+#カメラ画像のサイズ（幅, 高さ）
+FRAME_SIZE = (1920, 1080)
+
+def area_roi(code, margin=ROI_MARGIN, frame_size=FRAME_SIZE):
+    """CAMERA_CONFIGのarea_sizeの外接矩形をmarginだけ広げ、画像内に収めた[x1,y1,x2,y2]を返します。"""
+    xs = [x for x, _ in CAMERA_CONFIG[code]['area_size']]
+    ys = [y for _, y in CAMERA_CONFIG[code]['area_size']]
+    return [max(min(xs) - margin, 0), max(min(ys) - margin, 0),
+            min(max(xs) + margin, frame_size[0]), min(max(ys) + margin, frame_size[1])]
+
+#作業エリアを切り出した後の縮小率（1.0で縮小なし）
+ROI_SCALE={
+    f'{camera1}': 1.0,
+    f'{camera2}': 1.0,
+}
 REDUCTION_RATIO = {
     f'{camera2}': (1080/WIDTH, 1920/HEIGHT),
     f'{camera1}': (1080/WIDTH2, 1920/HEIGHT2),
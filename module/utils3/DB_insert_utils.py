@@ -37,11 +37,31 @@ def get_timestamp_conversion(time_stamp_number):
 
     return formatted_time
 
+# INSERT をまとめて実行する件数（1トランザクションあたりの行数）
+INSERT_CHUNK_SIZE = 500
+
+# logs テーブルの列（CCIDなし / CCIDあり）。並びは create_db.call_insert の INSERT_DATA_LIST の行と同じ
+LOG_COLUMNS = ("company_id", "top_left_x", "top_left_y", "bottom_right_x", "bottom_right_y", "center_x", "center_y",
+               "log_datetime", "created", "modified", "TID", "camera_id", "transform_center_x", "transform_center_y")
+CC_LOG_COLUMNS = ("company_id", "chameleon_code", "top_left_x", "top_left_y", "bottom_right_x", "bottom_right_y", "center_x", "center_y",
+                  "log_datetime", "created", "modified", "camera_id", "transform_center_x", "transform_center_y")
+
+def insert_sql(columns, placeholder="%s"):
+    """logs テーブルへの INSERT 文を作成する（MySQL は %s、SQLite は ?）"""
+    return f"INSERT INTO logs ({','.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+
+LOG_INSERT_SQL = insert_sql(LOG_COLUMNS)
+CC_LOG_INSERT_SQL = insert_sql(CC_LOG_COLUMNS)
+
 async def createpool(config, loop):
-    config['loop'] = loop
-    pool = await aiomysql.create_pool(**config)
+    # 呼び出し元の設定（async_config）は書き換えない
+    pool = await aiomysql.create_pool(**dict(config, loop=loop))
     return pool
 
+async def closepool(pool):
+    pool.close()
+    await pool.wait_closed()
+
 # 一秒以上経過 → INSERT(一秒未満 → 処理なし)
 # async def insert(pool, list_result, cc_detection_flg_list):
 #     #INSERTする間隔の設定(1秒間隔)
@@ -75,37 +95,52 @@ async def createpool(config, loop):
 #                 # コミット処理
 #                 await conn.commit()
 
-async def insert(pool, list_result, cc_detection_flg_list):
-    #INSERTする間隔の設定(1秒間隔)
+async def insert(pool, list_result, cc_detection_flg_list, chunk_size=INSERT_CHUNK_SIZE, single_transaction=False):
+    """
+    logs テーブルに検出結果をまとめて INSERT する。
+
+    CCIDの有無で2種類の INSERT 文に振り分け、chunk_size 行ごとに executemany（複数行の INSERT 文になる）で
+    1トランザクションとして登録する。途中でエラーになった場合、そのトランザクションはロールバックして例外を送出する。
+
+    :param pool: createpool() で作成したコネクションプール
+    :param list_result: INSERT_DATA_LIST（create_db.call_insert で作成した行のリスト）
+    :param cc_detection_flg_list: 各行がCCIDありの行かどうか
+    :param chunk_size: 1回の executemany で登録する行数
+    :param single_transaction: True の場合は全ての行を1トランザクションで登録する
+        （失敗時に全体を送り直す LogBuffer.ship で、一部の行だけが登録済みになって二重に登録されるのを防ぐ）
+    :return: 登録した行数
+    """
+    groups = {LOG_INSERT_SQL: [], CC_LOG_INSERT_SQL: []}
+    for row, cc_detection_flg in zip(list_result, cc_detection_flg_list):
+        groups[CC_LOG_INSERT_SQL if cc_detection_flg else LOG_INSERT_SQL].append(tuple(row[:14]))
+
+    num_rows = 0
     async with pool.acquire() as conn:
         async with conn.cursor() as cursor:
-            for row, cc_detection_flg in zip(list_result, cc_detection_flg_list):
-                #SQL文
-                SQL  = "INSERT INTO "
-                SQL += "    logs "
-                #カメレオンコードが検知されているかどうか
-                if cc_detection_flg == False:
-                    # SQL += "    (company_id,top_left_x,top_left_y,bottom_right_x,bottom_right_y,center_x,center_y,log_datetime,created,modified,TID,camera_id) "
-                    SQL += "    (company_id,top_left_x,top_left_y,bottom_right_x,bottom_right_y,center_x,center_y,log_datetime,created,modified,TID,camera_id,transform_center_x,transform_center_y) "
-                    SQL += "VALUES "
-                    # SQL += "    (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-                    SQL += "    (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-                    # params = (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8], row[9], row[10], row[11])
-                    params = (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8], row[9], row[10], row[11], row[12], row[13])
-                else:
-                    # SQL += "    (company_id,chameleon_code,top_left_x,top_left_y,bottom_right_x,bottom_right_y,center_x,center_y,log_datetime,created,modified,camera_id) "
-                    SQL += "    (company_id,chameleon_code,top_left_x,top_left_y,bottom_right_x,bottom_right_y,center_x,center_y,log_datetime,created,modified,camera_id,transform_center_x,transform_center_y) "
-                    SQL += "VALUES "
-                    SQL += "    (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-                    # params = (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8], row[9], row[10], row[11])
-                    params = (row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7], row[8], row[9], row[10], row[11], row[12], row[13])
-                # クエリを実行
-                # if cc_detection_flg == True:
+            if single_transaction:
                 await conn.begin()
-                await cursor.execute(SQL, params)
-                # コミット処理
-                await conn.commit()
-
+                try:
+                    for sql, rows in groups.items():
+                        for start in range(0, len(rows), chunk_size):
+                            await cursor.executemany(sql, rows[start:start + chunk_size])
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+                return sum(len(rows) for rows in groups.values())
+
+            for sql, rows in groups.items():
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    await conn.begin()
+                    try:
+                        await cursor.executemany(sql, chunk)
+                        await conn.commit()
+                    except Exception:
+                        await conn.rollback()
+                        raise
+                    num_rows += len(chunk)
+    return num_rows
 
 # #高速化したバルク対応 2025.05.07 torisato
 # async def insert(pool, list_result, cc_detection_flg_list):
@@ -1,4 +1,6 @@
+import time
 import mysql.connector
+import mysql.connector.pooling
 import xml.etree.ElementTree as ET
 
 # XMLファイルをパース
@@ -35,6 +37,49 @@ async_config = {
     'port': int(port)  # ポート番号
 }
 
+# プロセス内で共有するコネクションプール（最初の get_connection() で作成）
+_connection_pool = None
+
+# 再試行する一時的なエラー（デッドロック・ロック待ちタイムアウト・接続断）
+TRANSIENT_ERRNOS = {1205, 1213, 2006, 2013}
+
+def get_connection():
+    """コネクションプールから接続を取得する（close() でプールに返却される）"""
+    global _connection_pool
+    if _connection_pool is None:
+        _connection_pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name="cclog_pool", pool_size=2, pool_reset_session=True, **config)
+    return _connection_pool.get_connection()
+
+def run_in_transaction(func, retries=3, wait=1.0):
+    """
+    プールの接続1つで func(connection, cursor) を1トランザクションとして実行する。
+    一時的なエラーの場合はロールバックして再試行する。
+    """
+    for attempt in range(retries + 1):
+        connection = get_connection()
+        db = connection.cursor()
+        try:
+            connection.start_transaction()
+            result = func(connection, db)
+            connection.commit()
+            return result
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError,
+                mysql.connector.errors.DatabaseError) as e:
+            try:
+                connection.rollback()
+            except mysql.connector.Error:
+                pass
+            transient = e.errno in TRANSIENT_ERRNOS or isinstance(
+                e, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError))
+            if not transient or attempt == retries:
+                raise
+            print(f"DBエラーのため再試行します({attempt + 1}/{retries}): {e}")
+            time.sleep(wait * (attempt + 1))
+        finally:
+            db.close()
+            connection.close()
+
 def login_user(login_id, passwd):
     """ログイン情報の認証確認"""
     connection = mysql.connector.connect(**config)
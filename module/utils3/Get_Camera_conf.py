@@ -1,15 +1,19 @@
-from DB_serch_camera_conf_utils import fetch_camera_info
+from DB_serch_camera_conf_utils import config
+from camera_config_cache import CameraConfigService
 
 """
 いろあとDBからカメラの有効区分が有効なcamera_ipを取得する
 Return: ID, camera_ip
+
+起動時にDBの変更を確認し、カメラ設定のキャッシュ（camera_config_cache.json）を更新する。
+各処理（create_db.py など）はこのキャッシュからカメラ設定を読み込む。
 """
 
 cameras = []
 
-records = fetch_camera_info()
+records = CameraConfigService(config, max_age=0).refresh()
 
 for record in records:
     id = record['id']
     camera_ip = record['ip_address']
-    print(f'{id} {camera_ip} ')
\ No newline at end of file
+    print(f'{id} {camera_ip} ')
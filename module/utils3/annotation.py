@@ -0,0 +1,115 @@
+"""
+annotation.py
+
+画像（cv2 の BGR 形式の numpy 配列）に CCID の名称などの文字列を描画するための共通モジュール。
+
+主な機能:
+- cc_name.txt を読み込み、ccid -> 名称 の辞書として保持する（ファイルが更新された場合のみ読み直す）
+- 日本語フォント（NotoSansJP-VariableFont_wght.ttf）はプロセス内で1回だけ読み込む
+- 文字列ごとに描画済みの画像（アルファ値と色）を LRU キャッシュに保持し、
+  フレームには必要な範囲だけをアルファブレンドで書き込む
+  （フレーム全体を BGR -> PIL -> BGR に変換して描画する必要がなくなる）
+
+使用方法:
+    from utils3.annotation import get_cc_name, draw_text
+    text = get_cc_name(ccid)
+    draw_text(image, (x, y), text, fill=(0, 255, 0))
+
+注意:
+- fill は PIL の draw.text と同じく RGB で指定する。
+- 描画位置・見た目は PIL の draw.text((x, y), text, font=font, fill=fill) と同じ（左上基準）。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import json
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+CC_NAME_FILE = "cc_name.txt"
+FONT_FILE = "NotoSansJP-VariableFont_wght.ttf"
+FONT_SIZE = 60
+
+# cc_name.txt のパス -> (更新日時, {ccid: 名称})
+_cc_names = {}
+
+
+def load_cc_names(path=CC_NAME_FILE):
+    """
+    cc_name.txt（[{"ccid": str, "name": str}, ...]）を ccid -> 名称 の辞書として返します。
+    前回の読み込みからファイルが更新されていない場合は、読み込み済みの辞書を返します。
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cc_names.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as file:
+        names = {str(item['ccid']): item['name'] for item in json.load(file)}
+    _cc_names[path] = (mtime, names)
+    return names
+
+
+def get_cc_name(ccid, path=CC_NAME_FILE):
+    """
+    ccid（数値または "cc_id123" のような文字列）に対応する名称を返します。見つからない場合は None。
+    """
+    return load_cc_names(path).get(str(ccid).replace("cc_id", ""))
+
+
+@lru_cache(maxsize=None)
+def get_font(font_path=FONT_FILE, size=FONT_SIZE):
+    """
+    フォントを読み込みます（同じフォント・サイズはプロセス内で1回だけ読み込む）。
+    """
+    return ImageFont.truetype(font_path, size)
+
+
+@lru_cache(maxsize=512)
+def render_text(text, fill, font_path=FONT_FILE, size=FONT_SIZE):
+    """
+    文字列を描画した画像を作成します。
+
+    :return: (アルファ値 (h, w, 1) の float32 配列, BGR の色 (3,) の float32 配列, 描画位置からのずれ (x, y))
+    """
+    font = get_font(font_path, size)
+    left, top, right, bottom = font.getbbox(text)
+    mask = Image.new('L', (max(right - left, 1), max(bottom - top, 1)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, font=font, fill=255)
+    alpha = np.asarray(mask, dtype=np.float32)[:, :, None] / 255.0
+    alpha.setflags(write=False)
+    color = np.array(fill[::-1], dtype=np.float32)
+    color.setflags(write=False)
+    return alpha, color, (left, top)
+
+
+def draw_text(image, xy, text, fill=(0, 255, 0), font_path=FONT_FILE, size=FONT_SIZE):
+    """
+    画像（BGR の numpy 配列）に文字列を描画します（画像を直接書き換える）。
+
+    :param image: 描画先の画像
+    :param xy: 描画位置（PIL の draw.text と同じ左上基準）
+    :param text: 描画する文字列（None または空文字の場合は何もしない）
+    :param fill: 文字の色（RGB）
+    :return: 描画後の画像（引数の image と同じオブジェクト）
+    """
+    if image is None or not text:
+        return image
+    alpha, color, (left, top) = render_text(str(text), tuple(fill), font_path, size)
+    x = int(xy[0]) + left
+    y = int(xy[1]) + top
+    h, w = alpha.shape[:2]
+
+    # 画像からはみ出す部分を除く
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + w, image.shape[1]), min(y + h, image.shape[0])
+    if x1 >= x2 or y1 >= y2:
+        return image
+    a = alpha[y1 - y:y2 - y, x1 - x:x2 - x]
+    region = image[y1:y2, x1:x2].astype(np.float32)
+    region += (color - region) * a
+    image[y1:y2, x1:x2] = np.rint(region).astype(image.dtype)
+    return image
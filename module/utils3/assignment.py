@@ -0,0 +1,177 @@
+"""
+assignment.py
+
+割当問題（ハンガリアン法）による、2つの集合の要素同士の1対1の対応付け。
+
+- linear_sum_assignment(cost): コスト行列の合計が最小になる行と列の組を返す
+  （scipy がインストールされていれば scipy.optimize.linear_sum_assignment を使い、なければ本モジュールの実装を使う）。
+- assign_edges(edges): 二部グラフの辺だけを対象に、対応付けられる組の数が最大で、
+  その中で合計コストが最小になる辺を返す（距離の閾値以内の組だけを辺にすることで、閾値付きの対応付けに使用する）。
+"""
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_linear_sum_assignment
+except ImportError:
+    _scipy_linear_sum_assignment = None
+
+# 行数・列数がこの値以下の場合は、numpy の呼び出しのオーバーヘッドを避けて Python のリストで解く
+SMALL_SIZE = 16
+
+
+def _hungarian_small(cost):
+    """
+    _hungarian と同じ処理を Python のリストで行う（小さいコスト行列用）。
+
+    :param cost: 行数 <= 列数 のコスト行列（リストのリスト）
+    :return: 各行に割り当てた列のインデックスのリスト
+    """
+    n, m = len(cost), len(cost[0])
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    reduced = row[j - 1] - u[i0] - v[j]
+                    if reduced < minv[j]:
+                        minv[j] = reduced
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    row_to_col = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            row_to_col[p[j] - 1] = j - 1
+    return row_to_col
+
+
+def _hungarian(cost):
+    """
+    行数 <= 列数 のコスト行列に対する最短増加路によるハンガリアン法（O(n^2 m)）。
+    列ごとの処理は numpy でまとめて行う。
+
+    :return: 各行に割り当てた列のインデックスの配列
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # p[j]: 列 j に割り当てた行（1始まり、0 は未割当）。列 0 は探索中の行の置き場所
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = np.flatnonzero(~used[1:]) + 1
+            reduced = cost[i0 - 1, free - 1] - u[i0] - v[free]
+            better = reduced < minv[free]
+            minv[free[better]] = reduced[better]
+            way[free[better]] = j0
+            j1 = free[np.argmin(minv[free])]
+            delta = minv[j1]
+            used_cols = np.flatnonzero(used)
+            u[p[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # 増加路に沿って割当を入れ替える
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    row_to_col = np.empty(n, dtype=np.int64)
+    cols = np.flatnonzero(p[1:])
+    row_to_col[p[cols + 1] - 1] = cols
+    return row_to_col
+
+
+def linear_sum_assignment(cost):
+    """
+    コスト行列 (n, m) の合計が最小になる行と列の組を返します（min(n, m) 組）。
+
+    :return: (行のインデックスの配列, 列のインデックスの配列)。行の昇順
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if _scipy_linear_sum_assignment is not None:
+        return _scipy_linear_sum_assignment(cost)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    if cost.shape[1] <= SMALL_SIZE:
+        cols = np.array(_hungarian_small(cost.tolist()), dtype=np.int64)
+    else:
+        cols = _hungarian(cost)
+    if not transposed:
+        return np.arange(cost.shape[0]), cols
+    order = np.argsort(cols)
+    return cols[order], order
+
+
+def assign_edges(edges):
+    """
+    二部グラフの辺（行と列の組とコスト）から、対応付ける組の数が最大で、その中でコストの合計が最小になる辺を選びます。
+    辺のない行と列の組は対応付けません（距離の閾値を超えた組を辺に含めないことで、閾値付きの対応付けになる）。
+
+    :param edges: 辺のリスト [(row, col, cost), ...]。row / col はハッシュ可能な任意の値
+    :return: 選んだ辺の edges 内のインデックスのリスト
+    """
+    if not edges:
+        return []
+    rows = {}
+    cols = {}
+    for row, col, _ in edges:
+        rows.setdefault(row, len(rows))
+        cols.setdefault(col, len(cols))
+    # 辺のない組のコストは、辺を1つ増やすほうが必ず小さくなる値にする
+    max_cost = max(max(cost for _, _, cost in edges), 1.0)
+    penalty = max_cost * (min(len(rows), len(cols)) + 1)
+    matrix = [[penalty] * len(cols) for _ in rows]
+    edge_index = {}
+    for index, (row, col, cost) in enumerate(edges):
+        r, c = rows[row], cols[col]
+        if (r, c) not in edge_index or cost < matrix[r][c]:
+            matrix[r][c] = cost
+            edge_index[(r, c)] = index
+
+    if len(rows) <= len(cols) <= SMALL_SIZE:
+        assigned = enumerate(_hungarian_small(matrix))
+    else:
+        row_ind, col_ind = linear_sum_assignment(matrix)
+        assigned = zip(row_ind.tolist(), col_ind.tolist())
+    return sorted(edge_index[(r, c)] for r, c in assigned if (r, c) in edge_index)
@@ -0,0 +1,78 @@
+"""
+box_geometry.py
+
+バウンディングボックス [x1, y1, x2, y2] の幾何計算（IoU・包含率など）を numpy で行うユーティリティ。
+
+- マージ処理で扱うボックスは1フレームあたり数十個程度のため、torch / torchvision を読み込んで
+  GPU を初期化するよりも numpy で一括計算した方が速い（プロセスの起動も速くなる）。
+- 計算結果は torchvision.ops.box_iou と同じ（面積0のボックス同士は 0 / 0 にならないよう 0 とする）。
+"""
+
+import numpy as np
+
+
+def as_boxes(boxes):
+    """
+    ボックスのリストを (N, 4) の float32 配列に変換します（空の場合は (0, 4)）。
+    閾値判定の結果を従来の torch の計算と一致させるため float32 で計算する。
+    """
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def box_area(boxes):
+    """
+    各ボックスの面積 (N,) を返します。
+    """
+    boxes = as_boxes(boxes)
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def box_intersection(boxes1, boxes2):
+    """
+    ボックス同士の共通部分の面積 (N, M) を返します。
+    """
+    boxes1 = as_boxes(boxes1)
+    boxes2 = as_boxes(boxes2)
+    left_top = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    right_bottom = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    wh = np.clip(right_bottom - left_top, 0, None)
+    return wh[:, :, 0] * wh[:, :, 1]
+
+
+def _safe_divide(numerator, denominator):
+    out = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def box_iou(boxes1, boxes2):
+    """
+    ボックス同士のIoU (N, M) を返します（torchvision.ops.box_iou と同じ定義）。
+    """
+    inter = box_intersection(boxes1, boxes2)
+    union = box_area(boxes1)[:, None] + box_area(boxes2)[None, :] - inter
+    return _safe_divide(inter, union)
+
+
+def box_containment(boxes1, boxes2):
+    """
+    boxes1 の各ボックスが boxes2 の各ボックスに含まれる割合（共通部分の面積 / boxes1 の面積）(N, M) を返します。
+    """
+    inter = box_intersection(boxes1, boxes2)
+    return _safe_divide(inter, np.broadcast_to(box_area(boxes1)[:, None], inter.shape))
+
+
+def box_overlap_ratio(boxes1, boxes2):
+    """
+    共通部分の面積を、小さい方のボックスの面積で割った値 (N, M) を返します。
+    """
+    inter = box_intersection(boxes1, boxes2)
+    smaller = np.minimum(box_area(boxes1)[:, None], box_area(boxes2)[None, :])
+    return _safe_divide(inter, smaller)
+
+
+def matching_pairs(ious, threshold):
+    """
+    IoUなどの行列が threshold 以上となる (行, 列) の組を、行優先の順に返します。
+    """
+    return list(zip(*(index.tolist() for index in np.nonzero(ious >= threshold))))
@@ -0,0 +1,180 @@
+"""
+camera_config_cache.py
+
+有効なカメラの情報（id / code / ip_address）とキャリブレーション値（camera_data）を、各処理で使い回すための
+カメラ設定のキャッシュ。
+
+主な機能:
+- cameras と camera_data を1回のクエリ（LEFT JOIN）でまとめて取得する
+  （mtx / dist / new_mtx / area_size / transform_size と、縮尺用の total_width / total_height）
+- 取得した設定はプロセス内とディスク（camera_config_cache.json）に、テーブルのバージョン（CHECKSUM TABLE の値）と共に保存する
+- ディスクのキャッシュは max_age 秒の間はDBに問い合わせずにそのまま使う。
+  max_age を過ぎた場合はバージョンだけを問い合わせ、テーブルが変わっていた場合のみ設定を取得し直す
+- DBに接続できない場合は、古くてもディスクのキャッシュを使う
+
+使用方法:
+    from utils3.camera_config_cache import CameraConfigService
+    camera_configs = CameraConfigService(config)
+    camera = camera_configs.get_camera(camera_id)
+    camera['code'], camera['ip_address']
+
+注意:
+- calibration / reduction_ratio は camera_data の値をそのまま保持するだけで、各処理の座標変換には使わない
+  （歪み補正・縮尺は従来通り Camera_conf_utils の CAMERA_CONFIG / REDUCTION_RATIO を使う）。
+  camera_data に値がない場合は None になる。
+- 起動時（Get_Camera_conf.py）に max_age=0 で呼び出し、DBの変更をキャッシュに反映しておく。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import sys
+import ast
+import json
+import time
+
+import mysql.connector
+
+CACHE_FILE = "camera_config_cache.json"
+# ディスクのキャッシュをDBに問い合わせずに使う時間（秒）
+MAX_AGE = 300
+
+CAMERA_QUERY = (
+    "SELECT c.id AS cameras_id, c.code AS cameras_code, c.ip_address AS cameras_ip_address, cd.*"
+    " FROM cameras AS c LEFT JOIN cclog_db.camera_data AS cd ON cd.camera_id = c.ip_address"
+    " WHERE c.status = %s ORDER BY c.id, cd.id;"
+)
+VERSION_QUERY = "CHECKSUM TABLE cameras, cclog_db.camera_data;"
+
+
+def _literal(value):
+    # camera_data の値は "[[...], ...]" のような文字列で保存されている
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    if isinstance(value, str):
+        value = value.strip()
+        if not value or value == 'None':
+            return None
+        return ast.literal_eval(value)
+    return value
+
+
+def _to_camera(row):
+    """クエリの1行を、キャッシュに保存するカメラの設定に変換します。"""
+    calibration = {
+        'transform_size': _literal(row.get('transform_size')),
+        'area_size': _literal(row.get('area_size')),
+        'mtx': _literal(row.get('camera_matrix')),
+        'dist': _literal(row.get('dist')),
+        'new_mtx': _literal(row.get('new_camera_matrix')),
+    }
+    if any(value is None for value in calibration.values()):
+        calibration = None
+    total_width = _literal(row.get('total_width'))
+    total_height = _literal(row.get('total_height'))
+    reduction_ratio = None
+    if total_width and total_height:
+        reduction_ratio = [1080 / total_width, 1920 / total_height]
+    return {
+        'id': int(row['cameras_id']),
+        'code': row['cameras_code'],
+        'ip_address': row['cameras_ip_address'],
+        'calibration': calibration,
+        'reduction_ratio': reduction_ratio,
+    }
+
+
+class CameraConfigService:
+    def __init__(self, config, cache_path=CACHE_FILE, max_age=MAX_AGE):
+        """
+        :param config: mysql.connector の接続設定（DB_serch_camera_conf_utils.config）
+        :param cache_path: ディスクのキャッシュのファイルパス
+        :param max_age: ディスクのキャッシュをDBに問い合わせずに使う時間（秒）。0 の場合は毎回バージョンを確認する
+        """
+        self.config = config
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self._cache = None
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, cache):
+        # 複数のプロセスが同時に読み書きするため、一時ファイルに書き込んでから置き換える
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def _fetch(self, version):
+        """バージョンが version と異なる場合のみ設定を取得します（同じ場合は None）。"""
+        connection = mysql.connector.connect(**self.config)
+        db = connection.cursor(dictionary=True)
+        try:
+            db.execute(VERSION_QUERY)
+            checksums = db.fetchall()
+            # CHECKSUM TABLE に対応していない場合（Checksum が NULL）は毎回取得し直す
+            current = None
+            if all(row['Checksum'] is not None for row in checksums):
+                current = ",".join(f"{row['Table']}:{row['Checksum']}" for row in checksums)
+            if current is not None and current == version:
+                return None
+            db.execute(CAMERA_QUERY, ['1'])  # 有効な区分のカメラのみ取得
+            cameras = {}
+            for row in db.fetchall():
+                # 1台のカメラに camera_data が複数ある場合は、write_camera_conf.py と同じく最後の行（id が最大の行）で上書きする
+                cameras[int(row['cameras_id'])] = _to_camera(row)
+            return {'version': current, 'cameras': list(cameras.values())}
+        finally:
+            db.close()
+            connection.close()
+
+    def refresh(self, force=False):
+        """
+        設定を読み込みます。ディスクのキャッシュが max_age 秒以内に確認したものであれば、DBには問い合わせません。
+
+        :param force: True の場合はバージョンに関係なくDBから取得し直す
+        :return: カメラの設定のリスト
+        """
+        cache = self._read_cache()
+        if not force and cache is not None and time.time() - cache.get('checked_at', 0) < self.max_age:
+            self._cache = cache
+            return cache['cameras']
+
+        version = None if force or cache is None else cache.get('version')
+        try:
+            fetched = self._fetch(version)
+        except mysql.connector.Error as e:
+            if cache is None:
+                raise
+            # 標準出力は Get_Camera_conf.py のカメラ一覧に使うため、標準エラー出力に表示する
+            print(f"カメラ情報の取得に失敗したため、キャッシュを使用します: {e}", file=sys.stderr)
+            self._cache = cache
+            return cache['cameras']
+
+        if fetched is not None:
+            cache = fetched
+        cache['checked_at'] = time.time()
+        self._write_cache(cache)
+        self._cache = cache
+        return cache['cameras']
+
+    def get_cameras(self):
+        """有効なカメラの設定のリスト（id 順）を返します。プロセス内では最初の1回だけ読み込みます。"""
+        if self._cache is None:
+            return self.refresh()
+        return self._cache['cameras']
+
+    def get_camera(self, camera_id):
+        """カメラIDの設定を返します。有効なカメラにない場合は None。"""
+        for camera in self.get_cameras():
+            if camera['id'] == int(camera_id):
+                return camera
+        return None
@@ -0,0 +1,93 @@
+"""
+camera_transform.py
+
+カメラ画像上のピクセル座標を、歪み補正と射影変換によって平面マップ上の座標に変換するモジュール。
+
+主な機能:
+- CAMERA_CONFIG の1台分の設定（mtx / dist / new_mtx / area_size / transform_size）から、
+  歪み補正のパラメータと射影変換行列を1回だけ作成して保持する
+- 複数の座標をまとめて変換する pixels_to_world()（cv2.undistortPoints の1回の呼び出しと行列積で変換する）
+- 同じカメラ・同じキャリブレーション値の変換はプロセス内で使い回す（キャリブレーション値のハッシュで管理）
+
+使用方法:
+    from utils3.camera_transform import get_camera_transform
+    camera_transform = get_camera_transform(code, CAMERA_CONFIG[code])
+    world_points = camera_transform.pixels_to_world([(x1, y1), (x2, y2), ...])
+
+注意:
+- 変換結果は、1点ずつ cv2.undistortPoints と get_transform_pt.transform_pt で変換した値と同じ
+  （transform_pt と同じく整数に切り捨てる場合は pixels_to_world(...).astype(int) とする）。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import json
+import hashlib
+
+import cv2
+import numpy as np
+
+# (カメラコード, キャリブレーション値のハッシュ) -> CameraTransform
+_transforms = {}
+
+
+def calibration_hash(camera_config):
+    """
+    変換に使用するキャリブレーション値（mtx / dist / new_mtx / area_size / transform_size）のハッシュを返します。
+    """
+    keys = ('mtx', 'dist', 'new_mtx', 'area_size', 'transform_size')
+    values = {key: np.asarray(camera_config[key], dtype=np.float64).tolist() for key in keys}
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CameraTransform:
+    def __init__(self, camera_config):
+        """
+        :param camera_config: CAMERA_CONFIG の1台分の設定
+        """
+        self.mtx = np.array(camera_config['mtx'])
+        self.dist = np.array(camera_config['dist'])
+        self.new_mtx = np.array(camera_config['new_mtx'])
+        # 基準とする四隅(カメラ視点)の写真上の座標（px)と、変換後の座標から射影行列を作成（get_transform_pt.to_two_dimension と同じ）
+        pts1 = np.array(camera_config['area_size'], dtype=np.float32)
+        pts2 = np.array(camera_config['transform_size'], dtype=np.float32)
+        self.M = cv2.getPerspectiveTransform(pts1, pts2)
+
+    def undistort(self, points):
+        """
+        ピクセル座標 (N, 2) の歪みを補正した座標 (N, 2) を返します。
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if len(points) == 0:
+            return np.zeros((0, 2), dtype=np.float64)
+        return cv2.undistortPoints(points, self.mtx, self.dist, None, self.new_mtx).reshape(-1, 2)
+
+    def pixels_to_world(self, points):
+        """
+        ピクセル座標 (N, 2) を歪み補正・射影変換して、平面座標 (N, 2) を返します。
+        """
+        undistorted = self.undistort(points)
+        homogeneous = np.hstack([undistorted, np.ones((len(undistorted), 1))])
+        transformed = homogeneous @ self.M.T
+        return transformed[:, :2] / transformed[:, 2:3]
+
+    def pixel_to_world(self, point):
+        """
+        1点のピクセル座標を変換し、transform_pt と同じく整数に切り捨てた (x, y) を返します。
+        """
+        return tuple(self.pixels_to_world([point])[0].astype(int).tolist())
+
+
+def get_camera_transform(code, camera_config):
+    """
+    カメラの変換を返します。同じカメラ・同じキャリブレーション値の変換はプロセス内で使い回します。
+
+    :param code: カメラコード
+    :param camera_config: CAMERA_CONFIG[code]
+    """
+    key = (code, calibration_hash(camera_config))
+    transform = _transforms.get(key)
+    if transform is None:
+        transform = _transforms[key] = CameraTransform(camera_config)
+    return transform
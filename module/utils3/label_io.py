@@ -0,0 +1,158 @@
+"""
+label_io.py
+
+ラベルファイル（mask_*.json など）の読み書きを行う共通モジュール。
+
+主な機能:
+- 書き込み形式を切り替えられるシリアライザ
+  - "json": インデントなしのコンパクトなJSON（orjson がインストールされていれば使用し、なければ標準の json）
+  - "msgpack": labels を列指向（フィールドごとの配列）に変換した MessagePack 形式（msgpack が必要）
+- 読み込み時はファイルの内容から形式を自動判定するため、JSON と MessagePack が混在していても読み込める
+  （ファイル名は形式によらず *.json のままとし、パイプライン内のファイル名の対応関係は変更しない）
+- 読み書きしたファイル数・バイト数の集計
+
+使用方法:
+    from utils3.label_io import read_labels, write_labels
+    data = read_labels(path)
+    write_labels(path, data)
+
+    書き込み形式は環境変数 LABEL_FORMAT（"json" または "msgpack"、デフォルト: "json"）で指定する。
+
+注意:
+- gsam2 側のスクリプトからは gsam2/utils2/label_io.py 経由で本モジュールを `utils2.label_io` として使用する。
+- 既存のフォルダの形式変換には module/convert_labels.py、速度・サイズの比較には module/bench_label_io.py を使用する。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ("json", "msgpack")
+DEFAULT_FORMAT = os.environ.get("LABEL_FORMAT", "json")
+
+# 列指向形式の識別子
+COLUMNAR_VERSION = "labels-columnar-v1"
+
+# 読み書きしたファイル数・バイト数
+io_stats = {'files_read': 0, 'bytes_read': 0, 'files_written': 0, 'bytes_written': 0}
+
+
+def _to_columnar(data):
+    """
+    labels（{key: {フィールド: 値}}）をフィールドごとの配列に変換します。
+    ラベルごとにフィールドが異なる場合は、行形式のまま保持します。
+    """
+    labels = data.get('labels')
+    if not isinstance(labels, dict):
+        return {'format': COLUMNAR_VERSION, 'data': data}
+    meta = {k: v for k, v in data.items() if k != 'labels'}
+    keys = list(labels)
+    rows = list(labels.values())
+    fields = list(rows[0]) if rows else []
+    if any(list(row) != fields for row in rows):
+        return {'format': COLUMNAR_VERSION, 'meta': meta, 'keys': keys, 'rows': rows}
+    columns = {field: [row[field] for row in rows] for field in fields}
+    return {'format': COLUMNAR_VERSION, 'meta': meta, 'keys': keys, 'fields': fields, 'columns': columns}
+
+
+def _from_columnar(packed):
+    """
+    列指向形式からラベルデータ（dict）に戻します。
+    """
+    if 'data' in packed:
+        return packed['data']
+    data = dict(packed['meta'])
+    keys = packed['keys']
+    if 'rows' in packed:
+        data['labels'] = dict(zip(keys, packed['rows']))
+    else:
+        fields = packed['fields']
+        columns = [packed['columns'][field] for field in fields]
+        data['labels'] = {key: dict(zip(fields, values)) for key, values in zip(keys, zip(*columns))}
+    return data
+
+
+def dumps_labels(data, fmt=None):
+    """
+    ラベルデータをバイト列に変換します。
+
+    :param data: ラベルデータ（dict）
+    :param fmt: 形式（"json" または "msgpack"）。Noneの場合は DEFAULT_FORMAT
+    """
+    fmt = fmt or DEFAULT_FORMAT
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise ImportError("LABEL_FORMAT=msgpack を使用するには msgpack をインストールしてください")
+        return msgpack.packb(_to_columnar(data), use_bin_type=True)
+    if fmt != "json":
+        raise ValueError(f"未対応の形式です: {fmt} (対応形式: {FORMATS})")
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_labels(raw):
+    """
+    バイト列からラベルデータを読み込みます（JSON / MessagePack を自動判定）。
+    """
+    if raw.lstrip()[:1] in (b'{', b'[', b''):
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw)
+    if msgpack is None:
+        raise ImportError("MessagePack 形式のラベルファイルを読み込むには msgpack をインストールしてください")
+    packed = msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    if isinstance(packed, dict) and packed.get('format') == COLUMNAR_VERSION:
+        return _from_columnar(packed)
+    return packed
+
+
+def read_labels(path):
+    """
+    ラベルファイルを読み込みます。
+
+    :param path: ラベルファイルのパス
+    :return: ラベルデータ（dict）
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    io_stats['files_read'] += 1
+    io_stats['bytes_read'] += len(raw)
+    return loads_labels(raw)
+
+
+def write_labels(path, data, fmt=None):
+    """
+    ラベルファイルを書き込みます。
+
+    :param path: ラベルファイルのパス
+    :param data: ラベルデータ（dict）
+    :param fmt: 形式（"json" または "msgpack"）。Noneの場合は DEFAULT_FORMAT
+    :return: 書き込んだバイト数
+    """
+    raw = dumps_labels(data, fmt)
+    with open(path, 'wb') as f:
+        f.write(raw)
+    io_stats['files_written'] += 1
+    io_stats['bytes_written'] += len(raw)
+    return len(raw)
+
+
+def format_io_stats(label):
+    """
+    読み書きしたファイル数・バイト数を表示用の文字列にします。
+    """
+    return (f"{label}: read {io_stats['files_read']} files / {io_stats['bytes_read']} bytes, "
+            f"wrote {io_stats['files_written']} files / {io_stats['bytes_written']} bytes")
@@ -0,0 +1,259 @@
+"""
+log_buffer.py
+
+create_db.py の検出ログ（INSERT_DATA_LIST の行）を、MySQL に登録する前にローカルの SQLite（WAL モード）に
+書き込んでおくための先行書き込みバッファ。
+
+- 行はまず `<camera_id>/log_buffer.sqlite3` に追記され（ローカルのディスクへの書き込みのみ）、
+  その後 ship() で古い順にまとめて MySQL（cclog_db.logs）に送られる。
+- 送信に失敗した行（DB停止・タイムアウトなど）はバッファに残り、次回の ship() で古い順に再送される。
+  そのため、DBが停止していてもバッチの処理は止まらず、検出ログも失われない。
+- 送信する行は短いトランザクションで「送信中」として確保（claim）してからロックを解放し、MySQL に送った後に削除する。
+  MySQL が応答しない間も SQLite はロックされないため、append() は待たされない。
+  同じバッファを複数のプロセスが同時に送信しても、確保済みの行は他のプロセスからは送られない
+  （確保から CLAIM_TIMEOUT 秒を過ぎた行は、送信中に止まったプロセスの行とみなして再送する。
+  MySQL への登録成功後、削除前にプロセスが止まった場合のみ重複しうる）。
+- LogShipper は別スレッドで送信を繰り返すため、DBが遅い場合でも呼び出し元の処理は止まらない。
+- MySQL の代わりにローカルの SQLite に送る SQLiteLogSink を用意している（DBなしでの動作確認用）。
+"""
+
+import os
+import json
+import uuid
+import time
+import asyncio
+import sqlite3
+import threading
+
+from utils3.DB_insert_utils import LOG_COLUMNS, CC_LOG_COLUMNS, insert_sql, createpool, closepool, insert
+
+DB_FILE_NAME = "log_buffer.sqlite3"
+# 送信中として確保した行を、送信中に止まったプロセスの行とみなすまでの時間（秒）
+CLAIM_TIMEOUT = 600
+
+
+def _to_json(value):
+    # numpy の数値型などは Python の値に変換する
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"{type(value)} は JSON に変換できません")
+
+
+class LogBuffer:
+    def __init__(self, db_path):
+        """
+        :param db_path: バッファのファイルパス（例: "1/log_buffer.sqlite3"）
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_logs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " cc_detection INTEGER NOT NULL,"
+            " row TEXT NOT NULL)"
+        )
+        # 送信中の確保用の列（以前のバッファのファイルには列を追加する）
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(pending_logs)")]
+        if 'claim' not in columns:
+            self.conn.execute("ALTER TABLE pending_logs ADD COLUMN claim TEXT")
+            self.conn.execute("ALTER TABLE pending_logs ADD COLUMN claimed_at REAL")
+
+    @classmethod
+    def for_camera(cls, camera_dir):
+        """カメラごとのフォルダ（例: "1"）のバッファを開きます。"""
+        os.makedirs(str(camera_dir), exist_ok=True)
+        return cls(os.path.join(str(camera_dir), DB_FILE_NAME))
+
+    def append(self, rows, cc_detection_flgs):
+        """
+        行をバッファに追記します（1トランザクション）。
+
+        :param rows: INSERT_DATA_LIST の行のリスト
+        :param cc_detection_flgs: 各行がCCIDありの行かどうか
+        :return: 追記した最後の行のID（追記する行がない場合は None）
+        """
+        records = [(int(bool(flg)), json.dumps(list(row), default=_to_json))
+                   for row, flg in zip(rows, cc_detection_flgs)]
+        if not records:
+            return None
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("INSERT INTO pending_logs (cc_detection, row) VALUES (?, ?)", records)
+            last_id = self.conn.execute("SELECT MAX(id) FROM pending_logs").fetchone()[0]
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return last_id
+
+    def pending_count(self, up_to_id=None):
+        """
+        未送信の行数を返します。
+
+        :param up_to_id: 指定した場合は、ID がこの値以下の行（この時点までに追記した行）だけを数える
+        """
+        if up_to_id is None:
+            return self.conn.execute("SELECT COUNT(*) FROM pending_logs").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM pending_logs WHERE id <= ?", (up_to_id,)).fetchone()[0]
+
+    def _claim(self, batch_size):
+        # 未確保（または確保から CLAIM_TIMEOUT 秒を過ぎた）行を古い順に確保する。ロックはこの間だけ保持する
+        claim = uuid.uuid4().hex
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            records = self.conn.execute(
+                "SELECT id, cc_detection, row FROM pending_logs"
+                " WHERE claim IS NULL OR claimed_at < ? ORDER BY id LIMIT ?",
+                (now - CLAIM_TIMEOUT, batch_size)
+            ).fetchall()
+            self.conn.executemany("UPDATE pending_logs SET claim = ?, claimed_at = ? WHERE id = ?",
+                                  [(claim, now, record[0]) for record in records])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return claim, records
+
+    def ship(self, sink, batch_size=500, max_batches=None):
+        """
+        未送信の行を古い順に batch_size 行ずつ sink に送り、送信できた行をバッファから削除します。
+        SQLite のロックは行の確保と削除の間だけ保持し、sink の呼び出し中は保持しません。
+        sink が例外を送出した場合は、その行の確保を解除してバッファに残したまま例外を送出します。
+
+        :param sink: sink(rows, cc_detection_flgs) の形で呼び出す送信関数
+        :param batch_size: 1回に送る行数
+        :param max_batches: 1回の呼び出しで送る最大回数（Noneの場合は送信できる行がなくなるまで）
+        :return: 送信した行数
+        """
+        shipped = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            claim, records = self._claim(batch_size)
+            if not records:
+                break
+            try:
+                sink([json.loads(row) for _, _, row in records], [bool(flg) for _, flg, _ in records])
+            except Exception:
+                with self.conn:
+                    self.conn.execute("UPDATE pending_logs SET claim = NULL, claimed_at = NULL WHERE claim = ?", (claim,))
+                raise
+            with self.conn:
+                self.conn.execute("DELETE FROM pending_logs WHERE claim = ?", (claim,))
+            shipped += len(records)
+            batches += 1
+        return shipped
+
+    def close(self):
+        self.conn.close()
+
+
+class MySQLLogSink:
+    def __init__(self, config):
+        """
+        cclog_db.logs に行を登録する送信先。コネクションプールは最初の送信時に作成し、プロセス内で使い回す
+        （DBが停止している場合は次の送信時に作成し直す）。
+
+        :param config: aiomysql の接続設定（async_config）
+        """
+        self.config = config
+        self.loop = asyncio.new_event_loop()
+        self.pool = None
+
+    def __call__(self, rows, cc_detection_flgs):
+        if self.pool is None:
+            self.pool = self.loop.run_until_complete(createpool(self.config, loop=self.loop))
+        try:
+            # CCIDあり・なしの行を1トランザクションで登録する（失敗時はバッチ全体を送り直すため）
+            self.loop.run_until_complete(insert(self.pool, rows, cc_detection_flgs, single_transaction=True))
+        except Exception:
+            # 接続が切れている可能性があるため、次の送信ではプールを作り直す
+            self.pool.terminate()
+            self.pool = None
+            raise
+
+    def close(self):
+        if self.pool is not None:
+            self.loop.run_until_complete(closepool(self.pool))
+            self.pool = None
+        self.loop.close()
+
+
+class SQLiteLogSink:
+    def __init__(self, db_path):
+        """
+        MySQL の代わりに、logs テーブルを持つローカルの SQLite に行を登録する送信先。
+
+        :param db_path: 登録先の SQLite のファイルパス
+        """
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        columns = list(dict.fromkeys(LOG_COLUMNS + CC_LOG_COLUMNS))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            + ", ".join(columns)
+            + ", update_camera_id, update_flg)"
+        )
+        self.conn.commit()
+        self.log_sql = insert_sql(LOG_COLUMNS, "?")
+        self.cc_log_sql = insert_sql(CC_LOG_COLUMNS, "?")
+
+    def __call__(self, rows, cc_detection_flgs):
+        with self.conn:
+            self.conn.executemany(self.log_sql, [row for row, flg in zip(rows, cc_detection_flgs) if not flg])
+            self.conn.executemany(self.cc_log_sql, [row for row, flg in zip(rows, cc_detection_flgs) if flg])
+
+    def close(self):
+        self.conn.close()
+
+
+class LogShipper:
+    def __init__(self, db_path, make_sink, batch_size=500, interval=1.0):
+        """
+        バッファの未送信の行を、別スレッドで繰り返しDBに送る送信処理。
+        SQLite の接続と送信先はスレッド内で作成する（呼び出し元の LogBuffer とは別の接続を使う）。
+
+        :param db_path: バッファのファイルパス（LogBuffer.db_path）
+        :param make_sink: 送信先を作成する関数（例: lambda: MySQLLogSink(async_config)）
+        :param batch_size: 1回に送る行数
+        :param interval: 送信する行がない場合・送信に失敗した場合に、次に送信するまでの待ち時間（秒）
+        """
+        self.db_path = db_path
+        self.make_sink = make_sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.last_error = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """行を追記したことを送信スレッドに知らせます（待ち時間なしで送信する）。"""
+        self._wakeup.set()
+
+    def _run(self):
+        log_buffer = LogBuffer(self.db_path)
+        sink = self.make_sink()
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    log_buffer.ship(sink, batch_size=self.batch_size)
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                    print(f"DBへの登録に失敗しました（未送信の行はバッファに残します）: {e}")
+                if self._stop.is_set():
+                    return
+                self._wakeup.wait(self.interval)
+        finally:
+            sink.close()
+            log_buffer.close()
+
+    def close(self):
+        """送信中の行を送り終えてから、送信スレッドを終了します。"""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
@@ -0,0 +1,128 @@
+"""
+mask_containment.py
+
+マスク画像に対して「矩形がマスク（背景以外）に完全に含まれているか」「矩形内にどのIDが含まれているか」を
+累積和テーブル（Summed-Area Table / 積分画像）を用いて判定するためのユーティリティ。
+
+- マスクごとに1回だけ累積和テーブルを作成し、以降は矩形1つあたり4回の参照（O(1)）で判定する。
+- 同じフレームに対する複数の矩形（CSVの複数行）をまとめて1回の呼び出しで処理する。
+- オブジェクトIDごとの累積和テーブルは、そのオブジェクトの外接矩形の範囲のみ作成する（メモリ削減のため）。
+"""
+
+import torch
+
+
+def _integral(binary):
+    """
+    2値画像 (H, W) から、先頭に0の行・列を追加した累積和テーブル (H+1, W+1) を作成する。
+    """
+    height, width = binary.shape
+    table = torch.zeros((height + 1, width + 1), dtype=torch.int32, device=binary.device)
+    table[1:, 1:] = binary.to(torch.int32).cumsum(0, dtype=torch.int32).cumsum(1, dtype=torch.int32)
+    return table
+
+
+def _box_sum(table, x_min, y_min, x_max, y_max):
+    """
+    累積和テーブルから、矩形 [x_min, x_max] x [y_min, y_max]（両端を含む）の画素数を求める。
+    各引数は同じ長さの1次元テンソル。空の矩形（x_max < x_min など）は0になる。
+    """
+    x_max = torch.maximum(x_max, x_min - 1)
+    y_max = torch.maximum(y_max, y_min - 1)
+    return (
+        table[y_max + 1, x_max + 1]
+        - table[y_min, x_max + 1]
+        - table[y_max + 1, x_min]
+        + table[y_min, x_min]
+    )
+
+
+class MaskContainment:
+    def __init__(self, mask):
+        """
+        マスクから背景以外の領域の累積和テーブルと、オブジェクトIDごとの累積和テーブルを作成します。
+
+        :param mask: マスクの2次元テンソル（値はオブジェクトID、0は背景）
+        """
+        self.device = mask.device
+        self.height, self.width = mask.shape
+        self.coverage = _integral(mask > 0)
+
+        # オブジェクトIDごとの外接矩形 (x_min, y_min, x_max, y_max) と、その範囲の累積和テーブル
+        self.object_ids = []
+        self.object_boxes = []
+        self.object_tables = []
+        unique_ids = torch.unique(mask)
+        unique_ids = unique_ids[unique_ids != 0]  # 背景を除外
+        for obj_id in unique_ids.tolist():
+            obj_mask = mask == obj_id
+            rows = torch.nonzero(obj_mask.any(dim=1)).flatten()
+            cols = torch.nonzero(obj_mask.any(dim=0)).flatten()
+            y_min, y_max = rows[0].item(), rows[-1].item()
+            x_min, x_max = cols[0].item(), cols[-1].item()
+            self.object_ids.append(obj_id)
+            self.object_boxes.append((x_min, y_min, x_max, y_max))
+            self.object_tables.append(_integral(obj_mask[y_min:y_max + 1, x_min:x_max + 1]))
+
+    def clip_rectangles(self, rectangles):
+        """
+        矩形の配列 (N, 4) [x_min, y_min, x_max, y_max] をマスクの範囲内にクリップします。
+        """
+        rectangles = torch.as_tensor(rectangles, dtype=torch.int64, device=self.device).reshape(-1, 4)
+        x_min = rectangles[:, 0].clamp(min=0)
+        y_min = rectangles[:, 1].clamp(min=0)
+        x_max = rectangles[:, 2].clamp(max=self.width - 1)
+        y_max = rectangles[:, 3].clamp(max=self.height - 1)
+        return x_min, y_min, x_max, y_max
+
+    def contains(self, rectangles):
+        """
+        各矩形がマスク（背景以外）に完全に含まれているかを判定します。
+
+        :param rectangles: 矩形の配列 (N, 4) [x_min, y_min, x_max, y_max]（両端を含む）
+        :return: 長さNのboolテンソル
+        """
+        x_min, y_min, x_max, y_max = self.clip_rectangles(rectangles)
+        area = (x_max - x_min + 1).clamp(min=0) * (y_max - y_min + 1).clamp(min=0)
+        # 範囲外の矩形は x_min > x_max などになるため、x_min / y_min もテーブルの範囲内に収める
+        covered = _box_sum(
+            self.coverage,
+            x_min.clamp(max=self.width), y_min.clamp(max=self.height),
+            x_max.clamp(min=-1), y_max.clamp(min=-1),
+        )
+        return covered == area
+
+    def ids_in_rectangles(self, rectangles):
+        """
+        各矩形について、マスクに完全に含まれている場合はその領域内のオブジェクトID（昇順）のリストを、
+        含まれていない場合はNoneを返します。
+
+        :param rectangles: 矩形の配列 (N, 4) [x_min, y_min, x_max, y_max]（両端を含む）
+        :return: 長さNのリスト
+        """
+        inside = self.contains(rectangles)
+        x_min, y_min, x_max, y_max = self.clip_rectangles(rectangles)
+
+        # (N, K) 各矩形に各オブジェクトの画素が含まれるか
+        present = torch.zeros((len(inside), len(self.object_ids)), dtype=torch.bool, device=self.device)
+        for k, ((bx_min, by_min, bx_max, by_max), table) in enumerate(zip(self.object_boxes, self.object_tables)):
+            # 矩形とオブジェクトの外接矩形の共通部分（外接矩形内の座標）
+            ix_min = x_min.clamp(min=bx_min) - bx_min
+            iy_min = y_min.clamp(min=by_min) - by_min
+            ix_max = x_max.clamp(max=bx_max) - bx_min
+            iy_max = y_max.clamp(max=by_max) - by_min
+            valid = (ix_min <= ix_max) & (iy_min <= iy_max)
+            counts = _box_sum(
+                table,
+                ix_min.clamp(max=bx_max - bx_min), iy_min.clamp(max=by_max - by_min),
+                ix_max.clamp(min=0), iy_max.clamp(min=0),
+            )
+            present[:, k] = valid & (counts > 0)
+
+        results = []
+        for is_inside, row in zip(inside.tolist(), present.tolist()):
+            if not is_inside:
+                results.append(None)
+            else:
+                results.append([obj_id for obj_id, p in zip(self.object_ids, row) if p])
+        return results
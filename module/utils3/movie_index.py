@@ -0,0 +1,216 @@
+"""
+movie_index.py
+
+MOVIE_FOLDER の日付フォルダごとに、描画済み画像のファイル名（例: 134917200.jpg）と
+保存先のサブフォルダ（例: 134850000）の対応を記録するインデックス。
+
+主な機能:
+- create_movie.py が画像を書き出した際に、日付フォルダ直下の frame_index.tsv に追記する
+- merge_json_merge.py / id_handover.py / start_movie*.py の find_file は、os.walk で日付フォルダ全体を
+  検索する代わりに、このインデックスを辞書として引く（ファイル名 -> フォルダ）
+- インデックスは追記のみのため、他のプロセスが追記した分はファイルサイズの変化を見て差分だけ読み込む
+- インデックスが存在しない日付フォルダ（導入前に作成されたフォルダ）は、最初の参照時に一度だけ走査して作成する
+
+使用方法:
+    from utils3.movie_index import find_frame, add_frames
+    add_frames(day_folder, "134850000", ["134917200.jpg", ...])
+    image_file, current_folder_name = find_frame(day_folder, "134917200.jpg")
+
+    既存のフォルダのインデックスを作り直す場合は module/rebuild_movie_index.py を使用する。
+
+注意:
+- 同じファイル名が複数のサブフォルダに存在する場合（動画間の重なりフレーム）は、先に登録されたフォルダを返す。
+- インデックスにあるのに画像が存在しない場合（削除された場合）は、日付フォルダを走査してインデックスを作り直す。
+- インデックスにない画像は、日付フォルダを走査して探す（作り直しと同時に追記された分が失われた場合に備える）。
+- 1行は "ファイル名<TAB>サブフォルダ" の形式。書き込み途中の行（改行で終わっていない行）は読み飛ばす。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+
+INDEX_FILE_NAME = "frame_index.tsv"
+
+# 日付フォルダのパス -> MovieFrameIndex
+_indexes = {}
+
+
+class MovieFrameIndex:
+    def __init__(self, day_folder):
+        """
+        :param day_folder: 日付フォルダのパス（例: 1/MOVIE_FOLDER/20250528）
+        """
+        self.day_folder = day_folder
+        self.index_path = os.path.join(day_folder, INDEX_FILE_NAME)
+        # ファイル名 -> サブフォルダ名
+        self.entries = {}
+        # 読み込み済みのバイト数と、読み込んだファイルの inode
+        self.offset = 0
+        self.inode = None
+
+    def _reset(self):
+        self.entries = {}
+        self.offset = 0
+        self.inode = None
+
+    def refresh(self):
+        """
+        インデックスファイルの追記された分を読み込みます。
+        ファイルが存在しない場合は日付フォルダを走査して作成します。
+
+        :return: インデックスが利用できるかどうか（日付フォルダが存在しない場合は False）
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            if not os.path.isdir(self.day_folder):
+                return False
+            self.rebuild()
+            return True
+
+        # 作り直された（置き換えられた）場合は最初から読み込む
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self._reset()
+            self.inode = stat.st_ino
+        if stat.st_size == self.offset:
+            return True
+
+        with open(self.index_path, 'rb') as f:
+            f.seek(self.offset)
+            raw = f.read()
+        # 書き込み途中の行は次回に読み込む
+        end = raw.rfind(b'\n') + 1
+        for line in raw[:end].decode('utf-8').splitlines():
+            name, sep, folder = line.partition('\t')
+            if sep:
+                self.entries.setdefault(name, folder)
+        self.offset += end
+        return True
+
+    def rebuild(self):
+        """
+        日付フォルダを走査してインデックスファイルを作り直します。
+
+        :return: 登録した画像の数
+        """
+        entries = {}
+        for root, dirs, files in os.walk(self.day_folder):
+            # 先に作成されたサブフォルダを優先する
+            dirs.sort()
+            folder = os.path.relpath(root, self.day_folder)
+            for name in sorted(files):
+                if name.lower().endswith('.jpg'):
+                    entries.setdefault(name, folder)
+
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{name}\t{folder}\n" for name, folder in entries.items())
+        os.replace(tmp_path, self.index_path)
+
+        stat = os.stat(self.index_path)
+        self.entries = entries
+        self.offset = stat.st_size
+        self.inode = stat.st_ino
+        return len(entries)
+
+    def add(self, folder, names):
+        """
+        サブフォルダに書き出した画像をインデックスに追記します。
+
+        :param folder: 日付フォルダからのサブフォルダ名（例: 134850000）
+        :param names: 画像ファイル名のリスト（例: ["134917200.jpg", ...]）
+        """
+        self.refresh()
+        lines = []
+        for name in names:
+            if self.entries.get(name) == folder:
+                continue
+            self.entries.setdefault(name, folder)
+            lines.append(f"{name}\t{folder}\n")
+        if not lines:
+            return
+        # 1回の write でまとめて追記する（他のプロセスの追記と行が混ざらないようにする）
+        raw = "".join(lines).encode('utf-8')
+        with open(self.index_path, 'ab') as f:
+            f.write(raw)
+        # 自分の追記分は読み込み済みとする（他のプロセスの追記が間にあった場合は次の refresh で読み直す）
+        stat = os.stat(self.index_path)
+        if stat.st_ino == self.inode and stat.st_size == self.offset + len(raw):
+            self.offset = stat.st_size
+
+    def _scan(self, name):
+        """
+        日付フォルダを走査して、画像が保存されているサブフォルダ名を返します（rebuild と同じく先に作成されたサブフォルダを優先）。
+
+        :return: サブフォルダ名。見つからない場合は None
+        """
+        for root, dirs, files in os.walk(self.day_folder):
+            dirs.sort()
+            if name in files:
+                return os.path.relpath(root, self.day_folder)
+        return None
+
+    def lookup(self, name):
+        """
+        画像ファイルのパスと、画像が保存されているフォルダのパスを返します。
+
+        :param name: 画像ファイル名（例: "134917200.jpg"）
+        :return: (画像ファイルのパス, フォルダのパス)。見つからない場合は (None, None)
+        """
+        folder = self.entries.get(name)
+        if folder is None:
+            # 他のプロセスが追記した分を読み込んでから再度探す
+            if not self.refresh():
+                return None, None
+            folder = self.entries.get(name)
+            if folder is None:
+                # rebuild() と同時に追記された分はインデックスから失われるため、日付フォルダを走査して探し、
+                # 見つかった場合はインデックスに追記する
+                folder = self._scan(name)
+                if folder is None:
+                    return None, None
+                self.add(folder, [name])
+        root = os.path.normpath(os.path.join(self.day_folder, folder))
+        image_file = os.path.join(root, name)
+        if os.path.exists(image_file):
+            return image_file, root
+
+        # 画像やサブフォルダが削除されていた場合は、日付フォルダを走査し直してから一度だけ探し直す
+        if not os.path.isdir(self.day_folder):
+            return None, None
+        self.rebuild()
+        folder = self.entries.get(name)
+        if folder is None:
+            return None, None
+        root = os.path.normpath(os.path.join(self.day_folder, folder))
+        return os.path.join(root, name), root
+
+
+def get_index(day_folder):
+    """
+    日付フォルダのインデックスを返します（プロセス内で使い回す）。
+    """
+    key = os.path.normpath(day_folder)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = MovieFrameIndex(key)
+    return index
+
+
+def find_frame(day_folder, name):
+    """
+    日付フォルダ内の画像ファイルを探します。
+
+    :param day_folder: 日付フォルダのパス（例: 1/MOVIE_FOLDER/20250528）
+    :param name: 画像ファイル名（例: "134917200.jpg"）
+    :return: (画像ファイルのパス, フォルダのパス)。見つからない場合は (None, None)
+    """
+    return get_index(day_folder).lookup(name)
+
+
+def add_frames(day_folder, folder, names):
+    """
+    サブフォルダに書き出した画像を日付フォルダのインデックスに追記します。
+    """
+    get_index(day_folder).add(folder, names)
@@ -0,0 +1,197 @@
+"""
+movie_render.py
+
+ラベル更新後の動画（output2.mp4）の再作成をまとめて行うスケジューラ。
+
+主な機能:
+- 画像を書き換えたフォルダを request() で登録し、同じフォルダへの要求を1回にまとめる
+  （最後の要求から window 秒間、同じフォルダへの要求がなくなってから作成する）
+- 同じフォルダの動画は window 秒に最大1回だけ、バックグラウンドのスレッドプールで作成する
+- window=None の場合は flush() / close() を呼ぶまで作成しない（一連の書き換えが終わってからまとめて作成するバッチ処理用）
+- フォルダ内の画像（ファイル名・サイズ・更新日時）が前回の作成時から変わっていない場合は作成を省略する
+  （前回の画像の状態は output2.sig に保存するため、プロセスをまたいでも判定できる）
+
+使用方法:
+    from utils3.movie_render import MovieRenderScheduler
+    render_scheduler = MovieRenderScheduler()
+    render_scheduler.request(folder)   # 画像を書き換えるたびに呼ぶ
+    render_scheduler.close()           # 残りの動画をすべて作成して終了する
+
+注意:
+- close() / flush() を呼ばずにプロセスを終了すると、作成待ちの動画は作成されない。
+
+作成日：2025年5月
+作成者：インフォファーム
+"""
+
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+OUTPUT_NAME = "output2.mp4"
+SIGNATURE_NAME = "output2.sig"
+
+
+def frame_signature(root_folder):
+    """
+    フォルダ内の .jpg ファイルのファイル名・サイズ・更新日時から、画像の状態を表す文字列を作成します。
+
+    :return: (ファイル名順の .jpg ファイル名のリスト, 状態を表す文字列)
+    """
+    entries = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                     for entry in os.scandir(root_folder)
+                     if entry.is_file() and entry.name.lower().endswith('.jpg'))
+    digest = hashlib.sha1(repr(entries).encode('utf-8')).hexdigest()
+    return [name for name, _, _ in entries], digest
+
+
+def encode_folder(root_folder, fps=5.0, size=(1920, 1080)):
+    """
+    フォルダ内の全てのJPEG画像をファイル名順に結合して output2.mp4 を作成します。
+    画像が前回の作成時から変わっていない場合は作成しません。
+
+    :param root_folder: 画像フォルダのパス。動画もこのフォルダ内に保存される
+    :return: 動画を作成した場合は True、省略した場合は False
+    """
+    output_path = os.path.join(root_folder, OUTPUT_NAME)
+    signature_path = os.path.join(root_folder, SIGNATURE_NAME)
+    jpg_files, signature = frame_signature(root_folder)
+
+    if os.path.exists(output_path) and os.path.exists(signature_path):
+        with open(signature_path, 'r', encoding='utf-8') as f:
+            if f.read() == signature:
+                return False
+
+    # 同名のMP4ファイルが存在する場合は削除
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    # 動画作成のための VideoWriter オブジェクトを作成
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # mp4形式で保存
+    video = cv2.VideoWriter(output_path, fourcc, fps, size)
+    try:
+        for file in jpg_files:
+            image = cv2.imread(os.path.join(root_folder, file))
+            video.write(image)  # 動画ファイルに書き込み
+    finally:
+        video.release()
+
+    with open(signature_path, 'w', encoding='utf-8') as f:
+        f.write(signature)
+    return True
+
+
+class MovieRenderScheduler:
+    def __init__(self, render=encode_folder, window=1.0, max_workers=2):
+        """
+        :param render: フォルダの動画を作成する関数（作成した場合 True、省略した場合 False を返す）
+        :param window: 同じフォルダへの要求をまとめる時間（秒）。最後の要求からこの時間が経ってから作成し、
+            同じフォルダの動画はこの間隔より短い間隔では作成しない。None の場合は flush() / close() まで作成しない
+        :param max_workers: 動画を作成するスレッド数
+        """
+        self.render = render
+        self.window = window
+        self.stats = {'requested': 0, 'rendered': 0, 'skipped': 0, 'failed': 0}
+        # フォルダ -> 作成予定時刻（None は flush() まで作成しない）
+        self._pending = {}
+        # 作成中のフォルダ
+        self._running = set()
+        # フォルダ -> 前回の作成が終わった時刻
+        self._last_render = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    def request(self, root_folder):
+        """
+        フォルダの動画の作成を要求します。作成待ちのフォルダへの要求は1回にまとめられ、作成予定時刻は
+        最後の要求から window 秒後に延ばされます（書き換え中のフォルダを途中で作成しないようにする）。
+        """
+        if not root_folder:
+            return
+        root_folder = os.path.normpath(root_folder)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MovieRenderScheduler は終了しています")
+            self.stats['requested'] += 1
+            due = None
+            if self.window is not None:
+                due = time.monotonic() + self.window
+                last = self._last_render.get(root_folder)
+                if last is not None:
+                    due = max(due, last + self.window)
+            self._pending[root_folder] = due
+            self._cond.notify_all()
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                if self._closed and not self._pending:
+                    return
+                now = time.monotonic()
+                waiting = {folder: due for folder, due in self._pending.items()
+                           if folder not in self._running and due is not None}
+                ready = [folder for folder, due in waiting.items() if due <= now]
+                for folder in ready:
+                    del self._pending[folder]
+                    self._running.add(folder)
+                    self._executor.submit(self._run, folder)
+                if ready:
+                    continue
+                # 次の作成予定時刻まで（作成予定時刻のあるフォルダがない場合は、要求・flush()・作成の終了まで）待つ
+                timeout = min(waiting.values()) - now if waiting else None
+                self._cond.wait(timeout)
+
+    def _run(self, root_folder):
+        try:
+            rendered = self.render(root_folder)
+            result = 'rendered' if rendered or rendered is None else 'skipped'
+        except Exception as e:
+            print(f"動画の作成に失敗しました: {root_folder}: {e}")
+            result = 'failed'
+        with self._cond:
+            self.stats[result] += 1
+            self._running.discard(root_folder)
+            self._last_render[root_folder] = time.monotonic()
+            self._cond.notify_all()
+
+    def flush(self):
+        """
+        作成待ちのフォルダの動画を待ち時間なしで作成し、すべての作成が終わるまで待ちます。
+        """
+        with self._cond:
+            for folder in self._pending:
+                self._pending[folder] = 0
+            self._cond.notify_all()
+            while self._pending or self._running:
+                self._cond.wait()
+
+    def close(self):
+        """
+        残りの動画をすべて作成してから、スレッドを終了します。
+        """
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def format_stats(self, label):
+        """
+        要求数・作成数・省略数を表示用の文字列にします。
+        """
+        return (f"{label}: {self.stats['requested']} requests, {self.stats['rendered']} rendered, "
+                f"{self.stats['skipped']} skipped, {self.stats['failed']} failed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
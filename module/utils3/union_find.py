@@ -0,0 +1,80 @@
+"""
+union_find.py
+
+素集合データ構造（Union-Find）。同一オブジェクトと判定されたID同士を統合し、
+各グループの代表IDを決定するために使用する。
+
+- 経路圧縮と、サイズによる併合で、ほぼ定数時間で find / union を行う。
+- 代表値の決定規則（優先順位）は `key` 関数で指定する（値が小さいほど優先）。
+"""
+
+
+def instance_id_priority(node):
+    """
+    (セグメント番号, instance_id) などのノードの代表値の優先順位。
+    CCIDによる文字列のID（例: "cc_id123"）を優先し、それ以外は小さい整数IDを優先する。
+    """
+    instance_id = node[-1] if isinstance(node, tuple) else node
+    if isinstance(instance_id, str):
+        return (0, instance_id)
+    return (1, instance_id)
+
+
+class UnionFind:
+    def __init__(self, key=instance_id_priority):
+        """
+        :param key: 代表値の優先順位を返す関数（値が小さいノードが代表になる）
+        """
+        self.key = key
+        self.parent = {}
+        self.size = {}
+        # 根ノード -> グループの代表ノード
+        self.representative = {}
+
+    def add(self, node):
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 1
+            self.representative[node] = node
+
+    def __contains__(self, node):
+        return node in self.parent
+
+    def find_root(self, node):
+        """ノードの根を返します（経路圧縮あり）。"""
+        root = node
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+        return root
+
+    def union(self, a, b):
+        """ノードaとbを同じグループに統合します。"""
+        self.add(a)
+        self.add(b)
+        root_a = self.find_root(a)
+        root_b = self.find_root(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size.pop(root_b)
+        rep_a = self.representative[root_a]
+        rep_b = self.representative.pop(root_b)
+        self.representative[root_a] = min(rep_a, rep_b, key=self.key)
+        return root_a
+
+    def find(self, node):
+        """ノードが属するグループの代表ノードを返します（未登録のノードはそのまま返す）。"""
+        if node not in self.parent:
+            return node
+        return self.representative[self.find_root(node)]
+
+    def groups(self):
+        """{代表ノード: [ノード, ...]} を返します。"""
+        result = {}
+        for node in self.parent:
+            result.setdefault(self.find(node), []).append(node)
+        return result
@@ -10,10 +10,12 @@ from module.utils3.DB_serch_camera_conf_utils import config
 from tkinter import messagebox
 import json
 import re
-from PIL import Image, ImageDraw , ImageFont
 import shutil
 from datetime import datetime
 from module.utils3.Camera_conf_utils import camera_list, world_map
+from module.utils3.movie_index import find_frame
+from module.utils3.movie_render import MovieRenderScheduler, encode_folder
+from module.utils3.annotation import get_cc_name, draw_text
 
 # 画像を更新する関数
 def update_image(index):
@@ -174,13 +176,7 @@ def update_data(ccid, log_datetime, TID):
         connection.close()
 
 def update_images(update_records, before_id, ccid, camera_id):
-    last_folder_name = ""
-    #HACK 名前辞書読込 2024/11/15 torisato(削除予定)
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    #HACK　日本語フォント　2024/11/15 torisato(削除予定)
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
+    render_scheduler = MovieRenderScheduler(movie_create)
     
     list_camera_id = before_id.split('_')[0]
     TID=before_id.split('_')[1]
@@ -200,28 +196,18 @@ def update_images(update_records, before_id, ccid, camera_id):
         # 画像を読み込む
         if image_file != None:
             image = cv2.imread(image_file)
-            cc = next((item for item in cc_name_dict if item['ccid'] == str(ccid)), None)
-            text = cc['name']
-            #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-            image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-            #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-            draw = ImageDraw.Draw(image_pil)
-
+            text = get_cc_name(ccid)
             # 画像にテキストを描画
             if ccid not in id_lists:
                 # draw.text((label['x1'], int((label['y1']+label['y2'])/2-40)), text, font=font, fill=(0, 255, 255))
-                draw.text((int(record[3]), int((int(record[4])+int(record[6]))/2-40)), text, font=font, fill=(0, 255, 255))
-                # Pillow形式からcv2形式に戻す
-                image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
+                draw_text(image, (int(record[3]), int((int(record[4])+int(record[6]))/2-40)), text, fill=(0, 255, 255))
             # image = cv2.putText(image, str(item[1]), (label['x1'], int((label['y1']+label['y2'])/2-40)), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
                 cv2.imwrite(image_file,image)
                 id_lists.append(ccid)
-            if last_folder_name != current_folder_name and last_folder_name != "":
-                movie_create(last_folder_name)
-            last_folder_name=current_folder_name
-    if last_folder_name != "":
-            movie_create(last_folder_name)
+            # 同じフォルダへの要求はまとめて、動画は後でバックグラウンドで作成する
+            render_scheduler.request(current_folder_name)
+    # 作成待ちの動画をすべて作成する
+    render_scheduler.close()
 
 # 数値検証関数
 def validate_numeric_input(new_value):
@@ -236,28 +222,12 @@ def get_day_and_timestamp(filename,formatted_date,camera_id):
     return camera_id+"/MOVIE_FOLDER"+"/"+formatted_date,str(filename)+".jpg"
 
 def find_file(root_folder, target_file_name):
-    # 指定したフォルダ内の全てのサブフォルダを再帰的に検索
-    for root, dirs, files in os.walk(root_folder):
-        if target_file_name in files:
-            return root +"/"+target_file_name , root
-    return None,None
+    # 日付フォルダのインデックスから検索（見つからない場合は None, None）
+    return find_frame(root_folder, target_file_name)
 
 def movie_create(root_folder):
-    # 同名のMP4ファイルが存在する場合は削除
-    if os.path.exists(os.path.join(root_folder,"output2.mp4")):
-        os.remove(os.path.join(root_folder,"output2.mp4"))  # 既存のファイルを削除
-
-    # 動画作成のための VideoWriter オブジェクトを作成
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # mp4形式で保存
-    video = cv2.VideoWriter(os.path.join(root_folder,"output2.mp4"), fourcc, 5.0, (1920, 1080))
-    # 指定されたディレクトリ内のすべてのファイルを取得
-    files = os.listdir(root_folder)
-    
-    # .jpg拡張子のファイルのみをリストアップ
-    jpg_files = [file for file in files if file.lower().endswith('.jpg')]
-    for file in jpg_files:
-        image = cv2.imread(root_folder+"/"+file)
-        video.write(image)  # 動画ファイルに書き込み
+    # 画像が前回の作成時から変わっていない場合は作成しない
+    return encode_folder(root_folder)
 
 def create_mapping_image(records, folder_path,folder_list):
     """
@@ -283,13 +253,6 @@ def create_mapping_image(records, folder_path,folder_list):
         shutil.rmtree(destination_folder)
     os.makedirs(destination_folder)
 
-    #HACK 名前辞書読込 2024/11/15 torisato(削除予定)
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    #HACK　日本語フォント　2024/11/15 torisato(削除予定)
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
-
     # for id, chameleon_code, center_x, center_y, log_datetime, TID in records:
     for folder in folder_list:
         image_path= os.path.join(folder_path,folder)
@@ -330,8 +293,7 @@ def create_mapping_image(records, folder_path,folder_list):
 
                 #HACK　取得したIDに文字列"cc_id"が含まれているかチェックする 2024/11/15 torisato(削除予定)
                 if chameleon_code is not None:
-                    cc = next((item for item in cc_name_dict if item['ccid'] == str(chameleon_code)), None)
-                    chameleon_code = cc['name']
+                    chameleon_code = get_cc_name(chameleon_code)
                 
                 # print(former_log_datetime,current_log_datetime)
 
@@ -375,19 +337,11 @@ def create_mapping_image(records, folder_path,folder_list):
                 # 一致している場合、同じ画像に〇を描く
                 cv2.circle(image, ( round(center_x / 10) * 10, round(center_y / 10) * 10), 50, (0, 0, 0), 3)
 
-                #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-                image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-                #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-                draw = ImageDraw.Draw(image_pil)
-
                 # 画像にテキストを描画
                 if text == chameleon_code:
-                    draw.text((round(center_x / 10) * 10 - 30, round(center_y / 10) * 10 - 30), text, font=font, fill=(0, 0, 0))
+                    draw_text(image, (round(center_x / 10) * 10 - 30, round(center_y / 10) * 10 - 30), text, fill=(0, 0, 0))
                 else:
-                    draw.text((round(center_x / 10) * 10 - 20, round(center_y / 10) * 10 - 30), text, font=font, fill=(0, 0, 0))
-                # Pillow形式からcv2形式に戻す
-                image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
+                    draw_text(image, (round(center_x / 10) * 10 - 20, round(center_y / 10) * 10 - 30), text, fill=(0, 0, 0))
 
                 # former_created を更新
                 former_log_datetime = current_log_datetime
@@ -428,13 +382,6 @@ def create_mapping_image(records, folder_path,folder_list):
         shutil.rmtree(destination_folder)
     os.makedirs(destination_folder)
 
-    #HACK 名前辞書読込 2024/11/15 torisato(削除予定)
-    with open('cc_name.txt', 'r', encoding='utf-8') as file:
-        cc_name_dict = json.load(file)
-
-    #HACK　日本語フォント　2024/11/15 torisato(削除予定)
-    font = ImageFont.truetype("NotoSansJP-VariableFont_wght.ttf", 60)
-
     # for id, chameleon_code, center_x, center_y, log_datetime, TID in records:
     for folder in folder_list:
         image_path= os.path.join(folder_path,folder)
@@ -475,8 +422,7 @@ def create_mapping_image(records, folder_path,folder_list):
 
                 #HACK　取得したIDに文字列"cc_id"が含まれているかチェックする 2024/11/15 torisato(削除予定)
                 if chameleon_code is not None:
-                    cc = next((item for item in cc_name_dict if item['ccid'] == str(chameleon_code)), None)
-                    chameleon_code = cc['name']
+                    chameleon_code = get_cc_name(chameleon_code)
                 
                 # print(former_log_datetime,current_log_datetime)
 
@@ -520,19 +466,11 @@ def create_mapping_image(records, folder_path,folder_list):
                 # 一致している場合、同じ画像に〇を描く
                 cv2.circle(image, ( round(center_x / 10) * 10, round(center_y / 10) * 10), 50, (0, 0, 0), 3)
 
-                #HACK cv2の画像をPillow形式に変換 2024/11/15 torisato(削除予定)
-                image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-                #HACK 描画用のDrawオブジェクトを作成 2024/11/15 torisato(削除予定)
-                draw = ImageDraw.Draw(image_pil)
-
                 # 画像にテキストを描画
                 if text == chameleon_code:
-                    draw.text((round(center_x / 10) * 10 - 30, round(center_y / 10) * 10 - 30), text, font=font, fill=(0, 0, 0))
+                    draw_text(image, (round(center_x / 10) * 10 - 30, round(center_y / 10) * 10 - 30), text, fill=(0, 0, 0))
                 else:
-                    draw.text((round(center_x / 10) * 10 - 20, round(center_y / 10) * 10 - 30), text, font=font, fill=(0, 0, 0))
-                # Pillow形式からcv2形式に戻す
-                image = cv2.cvtColor(np.array(image_pil), cv2.COLOR_BGR2RGB)
+                    draw_text(image, (round(center_x / 10) * 10 - 20, round(center_y / 10) * 10 - 30), text, fill=(0, 0, 0))
 
                 # former_created を更新
                 former_log_datetime = current_log_datetime